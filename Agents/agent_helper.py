@@ -6,6 +6,48 @@ This prevents redundant API calls when agents depend on each other.
 from backend.init_db import SessionLocal
 from backend.data_store import get_latest_soil, get_latest_water, get_latest_weather, get_latest_stage
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, Future
+import asyncio
+import json
+import contextvars
+import threading
+
+# key -> (Future, owner thread id) for fetches currently in progress
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def singleflight(key, func):
+    """
+    Run func once per key at a time. Callers that arrive while it is running
+    wait for and share the same result (or exception) instead of repeating
+    the work. Re-entry from the running thread calls func directly.
+    """
+    me = threading.get_ident()
+    with _inflight_lock:
+        entry = _inflight.get(key)
+        if entry is None:
+            future = Future()
+            _inflight[key] = (future, me)
+            leader = True
+        else:
+            future, owner = entry
+            leader = False
+    if not leader:
+        if owner == me:
+            return func()
+        return future.result()
+    try:
+        result = func()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
 
 def get_or_fetch_soil(farmer_input, session_state, model, latitude=None, longitude=None, run_id: int = None):
     """
@@ -20,33 +62,39 @@ def get_or_fetch_soil(farmer_input, session_state, model, latitude=None, longitu
         print("_____________________________________________________________check")
         return {'id': None, 'output': output}
     
-    # 2. Check database
-    try:
-        with SessionLocal() as session:
-            db_soil = get_latest_soil(
-                session,
-                location=farmer_input.location,
-                crop_name=farmer_input.crop_name
-            )
-            if db_soil:
-                return {'id': db_soil.id, 'output': db_soil.output}
-    except Exception as e:
-        print(f"[get_or_fetch_soil] DB lookup failed: {e}")
-    
-    # 3. Generate new
-    from soil import run_soil_agent
-    result = run_soil_agent(
-        location=farmer_input.location,
-        crop_name=farmer_input.crop_name,
-        crop_variety=farmer_input.crop_variety,
-        sowing_date=farmer_input.sowing_date,
-        area=farmer_input.area,
-        latitude=latitude,
-        longitude=longitude,
-        soil_type=farmer_input.soil_type or "",
-        model=model,
-        run_id=run_id,
-    )
+    def _fetch():
+        # 2. Check database
+        try:
+            with SessionLocal() as session:
+                db_soil = get_latest_soil(
+                    session,
+                    location=farmer_input.location,
+                    crop_name=farmer_input.crop_name
+                )
+                if db_soil:
+                    return {'id': db_soil.id, 'output': db_soil.output}, False
+        except Exception as e:
+            print(f"[get_or_fetch_soil] DB lookup failed: {e}")
+
+        # 3. Generate new
+        from soil import run_soil_agent
+        return run_soil_agent(
+            location=farmer_input.location,
+            crop_name=farmer_input.crop_name,
+            crop_variety=farmer_input.crop_variety,
+            sowing_date=farmer_input.sowing_date,
+            area=farmer_input.area,
+            latitude=latitude,
+            longitude=longitude,
+            soil_type=farmer_input.soil_type or "",
+            model=model,
+            run_id=run_id,
+        ), True
+
+    # Concurrent callers for the same location/crop share one fetch
+    result, generated = singleflight(('soil', farmer_input.location, farmer_input.crop_name), _fetch)
+    if not generated:
+        return result
     
     # Save to session state
     if 'agent_outputs' not in session_state:
@@ -68,22 +116,27 @@ def get_or_fetch_water(farmer_input, session_state, model, run_id: int = None):
             return output
         return {'id': None, 'output': output}
     
-    # 2. Check database
-    try:
-        with SessionLocal() as session:
-            db_water = get_latest_water(
-                session,
-                location=farmer_input.location,
-                crop_name=farmer_input.crop_name
-            )
-            if db_water:
-                return {'id': db_water.id, 'output': db_water.output}
-    except Exception as e:
-        print(f"[get_or_fetch_water] DB lookup failed: {e}")
-    
-    # 3. Generate new
-    from water import water_agent
-    result = water_agent(farmer_input, model=model, run_id=run_id)
+    def _fetch():
+        # 2. Check database
+        try:
+            with SessionLocal() as session:
+                db_water = get_latest_water(
+                    session,
+                    location=farmer_input.location,
+                    crop_name=farmer_input.crop_name
+                )
+                if db_water:
+                    return {'id': db_water.id, 'output': db_water.output}, False
+        except Exception as e:
+            print(f"[get_or_fetch_water] DB lookup failed: {e}")
+
+        # 3. Generate new
+        from water import water_agent
+        return water_agent(farmer_input, model=model, run_id=run_id), True
+
+    result, generated = singleflight(('water', farmer_input.location, farmer_input.crop_name), _fetch)
+    if not generated:
+        return result
     
     # Save to session state
     if 'agent_outputs' not in session_state:
@@ -105,31 +158,39 @@ def get_or_fetch_weather(farmer_input, session_state, latitude=None, longitude=N
             return output
         return {'id': None, 'output': output}
     
-    # 2. Check database
-    try:
-        with SessionLocal() as session:
-            db_weather = get_latest_weather(
-                session,
-                location=farmer_input.location,
-                crop_name=farmer_input.crop_name
-            )
-            if db_weather:
-                return {'id': db_weather.id, 'output': db_weather.output}
-    except Exception as e:
-        print(f"[get_or_fetch_weather] DB lookup failed: {e}")
-    
-    # 3. Generate new
-    from weather import weather_7day_compact
-    result = weather_7day_compact(
-        location=farmer_input.location,
-        latitude=latitude,
-        longitude=longitude,
-        days=7,
-        crop_name=farmer_input.crop_name,
-        save_to_db=True,
-        model_name=model_name,
-        run_id=run_id,
-    )
+    def _fetch():
+        # 2. Check database
+        try:
+            with SessionLocal() as session:
+                db_weather = get_latest_weather(
+                    session,
+                    location=farmer_input.location,
+                    crop_name=farmer_input.crop_name
+                )
+                if db_weather:
+                    result = {'id': db_weather.id, 'output': db_weather.output}
+                    if db_weather.data:
+                        result['data'] = json.loads(db_weather.data)
+                    return result, False
+        except Exception as e:
+            print(f"[get_or_fetch_weather] DB lookup failed: {e}")
+
+        # 3. Generate new
+        from weather import weather_7day_compact
+        return weather_7day_compact(
+            location=farmer_input.location,
+            latitude=latitude,
+            longitude=longitude,
+            days=7,
+            crop_name=farmer_input.crop_name,
+            save_to_db=True,
+            model_name=model_name,
+            run_id=run_id,
+        ), True
+
+    result, generated = singleflight(('weather', farmer_input.location, farmer_input.crop_name), _fetch)
+    if not generated:
+        return result
     
     # Save to session state
     if 'agent_outputs' not in session_state:
@@ -151,53 +212,58 @@ def get_or_fetch_stage(farmer_input, session_state, model, latitude=None, longit
             return output
         return {'id': None, 'output': output}
     
-    # 2. Check database
-    try:
-        with SessionLocal() as session:
-            db_stage = get_latest_stage(
-                session,
-                location=farmer_input.location,
-                crop_name=farmer_input.crop_name,
-                sowing_date=farmer_input.sowing_date
-            )
-            if db_stage:
-                if 'agent_outputs' not in session_state:
-                    session_state['agent_outputs'] = {}
-                stage_obj = {'id': db_stage.id, 'output': db_stage.output}
-                session_state['agent_outputs']['stage'] = stage_obj
-                return stage_obj
-    except Exception as e:
-        print(f"[get_or_fetch_stage] DB lookup failed: {e}")
-    
-    # 3. Generate new - with dependency resolution
-    from stage_agent import stage_generation
-    
-    # Ensure dependencies are fetched
-    if soil_data is None:
-        soil_data = get_or_fetch_soil(farmer_input, session_state, model, latitude, longitude, run_id=run_id)
-    if water_data is None:
-        water_data = get_or_fetch_water(farmer_input, session_state, model, run_id=run_id)
-    if weather_data is None:
-        weather_data = get_or_fetch_weather(farmer_input, session_state, latitude, longitude, model_name=model, run_id=run_id)
-    
-    result = stage_generation(
-        farmer_input,
-        model=model,
-        latitude=latitude,
-        longitude=longitude,
-        soil_data=soil_data,
-        water_data=water_data,
-        weather_data=weather_data,
-        run_id=run_id,
+    def _fetch():
+        # 2. Check database
+        try:
+            with SessionLocal() as session:
+                db_stage = get_latest_stage(
+                    session,
+                    location=farmer_input.location,
+                    crop_name=farmer_input.crop_name,
+                    sowing_date=farmer_input.sowing_date
+                )
+                if db_stage:
+                    from stage_parser import plan_data
+                    return {'id': db_stage.id, 'output': db_stage.output, 'data': plan_data(db_stage.output)}
+        except Exception as e:
+            print(f"[get_or_fetch_stage] DB lookup failed: {e}")
+
+        # 3. Generate new - with dependency resolution
+        from stage_agent import stage_generation
+
+        # Ensure dependencies are fetched
+        deps_soil = soil_data
+        deps_water = water_data
+        deps_weather = weather_data
+        if deps_soil is None:
+            deps_soil = get_or_fetch_soil(farmer_input, session_state, model, latitude, longitude, run_id=run_id)
+        if deps_water is None:
+            deps_water = get_or_fetch_water(farmer_input, session_state, model, run_id=run_id)
+        if deps_weather is None:
+            deps_weather = get_or_fetch_weather(farmer_input, session_state, latitude, longitude, model_name=model, run_id=run_id)
+
+        result = stage_generation(
+            farmer_input,
+            model=model,
+            latitude=latitude,
+            longitude=longitude,
+            soil_data=deps_soil,
+            water_data=deps_water,
+            weather_data=deps_weather,
+            run_id=run_id,
+        )
+        if isinstance(result, dict) and 'output' in result:
+            return result
+        return {'id': None, 'output': result}
+
+    stage_obj = singleflight(
+        ('stage', farmer_input.location, farmer_input.crop_name, farmer_input.sowing_date),
+        _fetch,
     )
-    
+
     # Save to session state
     if 'agent_outputs' not in session_state:
         session_state['agent_outputs'] = {}
-    if isinstance(result, dict) and 'output' in result:
-        session_state['agent_outputs']['stage'] = result
-        return result
-    stage_obj = {'id': None, 'output': result}
     session_state['agent_outputs']['stage'] = stage_obj
     return stage_obj
 
@@ -212,4 +278,31 @@ def extract_output_text(data):
         elif 'data' in data:
             return str(data['data'])
         return str(data)
-    return str(data)
\ No newline at end of file
+    return str(data)
+
+
+def map_bounded(func, items, max_concurrency: int = 1):
+    """
+    Apply func to every item with at most max_concurrency calls in flight.
+    Results are returned in the same order as items. func is expected to
+    handle its own errors so one failing item does not affect the others.
+    Workers run in a copy of the caller's context (e.g. llm_cache.fresh_answers).
+    """
+    items = list(items)
+    if max_concurrency is None or max_concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(items))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, func, item) for item in items]
+        return [f.result() for f in futures]
+
+
+async def amap_bounded(func, items, max_concurrency: int = 1):
+    """Async counterpart of map_bounded; func is a coroutine function."""
+    items = list(items)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or 1))
+
+    async def _run(item):
+        async with semaphore:
+            return await func(item)
+
+    return list(await asyncio.gather(*[_run(item) for item in items]))
@@ -1,16 +1,17 @@
 import os
 import json
 from typing import TypedDict, Optional, Literal, Dict, Any
-from datetime import datetime, date
 from dotenv import load_dotenv
 from together import Together
 from dataclasses import dataclass
 from langgraph.graph import StateGraph
 from soil import FarmerInput, run_soil_agent
 from stage_agent import stage_generation
-import re
 from weather import weather_7day_compact
-from llm_router import call_llm
+from stage_parser import parse_stage_plan, stages_for
+from llm_router import call_llm, acall_llm, fanout_concurrency, answered_model, LLMResult
+from schemas import output_schema, stage_results_data
+import asyncio
 
 
 load_dotenv()
@@ -109,14 +110,12 @@ Disease_system_prompt = """
 Disease Agent - Simplified version
 """
 
-def disease_agent(
+def _disease_prepare(
     farmer_input: FarmerInput = None,
     crop: str = None,
     crop_variety: str = None,
     location: str = None,
     sowing_date: str = None,
-    temperature: float = 0.2,
-    max_tokens: int = 1500,
     custom_prompt: str = None,
     model: str = None,
     session_state=None,
@@ -125,13 +124,12 @@ def disease_agent(
     soil_text: str = None,
     weather_text: str = None,
     stages_text: str = None,
-    run_id: int = None
-) -> str:
+    run_id: int = None,
+):
     """
-    Generate stage-specific disease risk assessment.
-    Model will use its knowledge to identify relevant diseases.
+    Resolve dependencies, parse stages and build one job per stage.
+    Returns a message string when there is nothing to assess.
     """
-    
     system_prompt = custom_prompt if custom_prompt else Disease_system_prompt
 
     from agent_helper import get_or_fetch_soil, get_or_fetch_weather, get_or_fetch_stage, extract_output_text
@@ -165,25 +163,22 @@ def disease_agent(
         stages_text = extract_output_text(stage_data)
 
     stage_report = stages_text
-    # Robust regex for CURRENT STAGE parsing
-    # Parse all stages from stage_report (shared logic with pest_agent)
-    import re
-    stage_pattern = r"Stage \d+: ([^\n]+)\n[\s\S]*?Start Date: (\d{4}-\d{2}-\d{2})\n[\s\S]*?End Date: (\d{4}-\d{2}-\d{2})"
-    stages = re.findall(stage_pattern, stage_report)
+    # Parse all stages from stage_report (shared parser with pest_agent)
+    if not parse_stage_plan(stage_report) and "CURRENT STAGE: Crop has already been harvested" in (stage_report or ""):
+        return "No active stage: Crop has already been harvested."
+    weather_record = weather_data.get("data") if isinstance(weather_data, dict) else None
+    stages, stage_source = stages_for(stage_report, farmer_input, weather_record)
     if not stages:
-        if "CURRENT STAGE: Crop has already been harvested" in stage_report:
-            return "No active stage: Crop has already been harvested."
         print("\n[DEBUG] Stage report output:\n", stage_report)
         return "Error: Could not parse stages from stage agent output."
-
-    # weather_text and soil_text are already resolved above
+    if stage_source != "parsed":
+        print(f"[disease] Warning: stage plan did not parse; using {stage_source} stages")
 
     # Forecast disease risk for all future stages
-    today = __import__('datetime').date.today()
-    results = []
-    for stage_name, stage_start, stage_end in stages:
-        stage_start_date = __import__('datetime').datetime.strptime(stage_start, "%Y-%m-%d").date()
-        stage_duration = ( __import__('datetime').datetime.strptime(stage_end, "%Y-%m-%d") - __import__('datetime').datetime.strptime(stage_start, "%Y-%m-%d") ).days + 1
+    jobs = []
+    for stage in stages:
+        stage_name, stage_duration = stage.name, stage.duration
+        stage_start, stage_end = stage.start.isoformat(), stage.end.isoformat()
         user_prompt = f"""
         INPUTS:
         
@@ -204,48 +199,163 @@ def disease_agent(
         
         Based on your agricultural knowledge, identify the most likely diseases for this crop at this stage given these weather and soil conditions. Provide practical management advice.
         """
-        chosen_model = model if model else MODEL_NAME
-        try:
-            text = call_llm(
-                model=chosen_model,
-                system_prompt=system_prompt,
-                user_message=user_prompt,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            results.append(f"--- Disease Risk for {stage_name} ({stage_start} to {stage_end}) ---\n" + text)
-        except Exception as e:
-            results.append(f"Error generating disease assessment for stage {stage_name}: {e}")
+        header = f"--- Disease Risk for {stage_name} ({stage_start} to {stage_end}) ---"
+        jobs.append((stage_name, header, user_prompt))
+
+    return {
+        'farmer_input': farmer_input,
+        'chosen_model': model if model else MODEL_NAME,
+        'system_prompt': system_prompt,
+        'jobs': jobs,
+        'stages': stages,
+        'stage_data': stage_data,
+        'soil_data': soil_data,
+        'weather_data': weather_data,
+    }
+
+
+def _disease_finish(prepared: dict, results: list, run_id: int = None):
     if not results:
         return "No future stages to forecast."
     final_text = "\n\n".join(results)
+    farmer_input = prepared['farmer_input']
 
     # Save to DB
     try:
         from backend.init_db import SessionLocal
         from backend.data_store import save_disease
 
+        stage_data = prepared['stage_data']
+        soil_data = prepared['soil_data']
+        weather_data = prepared['weather_data']
         stage_id = stage_data.get('id') if isinstance(stage_data, dict) else None
         soil_id = soil_data.get('id') if isinstance(soil_data, dict) else None
         weather_id = weather_data.get('id') if isinstance(weather_data, dict) else None
 
-        chosen_model = model if model else MODEL_NAME
         with SessionLocal() as session:
             obj = save_disease(
                 session=session,
-                crop_name=crop,
-                crop_variety=crop_variety,
-                location=location,
-                sowing_date=sowing_date,
+                crop_name=getattr(farmer_input, 'crop_name', None),
+                crop_variety=getattr(farmer_input, 'crop_variety', None),
+                location=getattr(farmer_input, 'location', None),
+                sowing_date=getattr(farmer_input, 'sowing_date', None),
                 stage_id=stage_id,
                 soil_id=soil_id,
                 weather_id=weather_id,
-                model_name=chosen_model,
-                prompt=system_prompt,
+                model_name=answered_model(results, prepared['chosen_model']),
+                prompt=prepared['system_prompt'],
                 output=final_text,
                 run_id=run_id,
             )
-            return {"id": obj.id, "output": final_text}
+            return {"id": obj.id, "output": final_text, "data": stage_results_data(prepared['stages'], results)}
     except Exception as ex:
         print(f"[disease_agent] Warning: Could not save to DB: {ex}")
         return final_text
+
+
+def disease_agent(
+    farmer_input: FarmerInput = None,
+    crop: str = None,
+    crop_variety: str = None,
+    location: str = None,
+    sowing_date: str = None,
+    temperature: float = 0.2,
+    max_tokens: int = 1500,
+    custom_prompt: str = None,
+    model: str = None,
+    session_state=None,
+    latitude: float = None,
+    longitude: float = None,
+    soil_text: str = None,
+    weather_text: str = None,
+    stages_text: str = None,
+    run_id: int = None,
+    max_concurrency: int = None
+) -> str:
+    """
+    Generate stage-specific disease risk assessment.
+    Model will use its knowledge to identify relevant diseases.
+    Per-stage calls run in parallel, up to max_concurrency at a time
+    (None = provider default, 1 = serial).
+    """
+    from agent_helper import map_bounded
+
+    prepared = _disease_prepare(
+        farmer_input, crop, crop_variety, location, sowing_date, custom_prompt, model,
+        session_state, latitude, longitude, soil_text, weather_text, stages_text, run_id,
+    )
+    if isinstance(prepared, str):
+        return prepared
+
+    def _assess_stage(job):
+        stage_name, header, user_prompt = job
+        try:
+            text = call_llm(
+                model=prepared['chosen_model'],
+                system_prompt=prepared['system_prompt'],
+                user_message=user_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                agent="disease",
+                response_schema=output_schema("disease"),
+            )
+            return LLMResult(header + "\n" + text, getattr(text, "model", None), data=getattr(text, "data", None))
+        except Exception as e:
+            return f"Error generating disease assessment for stage {stage_name}: {e}"
+
+    # per-stage calls are independent; fan them out (results keep stage order)
+    results = map_bounded(_assess_stage, prepared['jobs'], fanout_concurrency(prepared['chosen_model'], max_concurrency))
+    return _disease_finish(prepared, results, run_id)
+
+
+async def adisease_agent(
+    farmer_input: FarmerInput = None,
+    crop: str = None,
+    crop_variety: str = None,
+    location: str = None,
+    sowing_date: str = None,
+    temperature: float = 0.2,
+    max_tokens: int = 1500,
+    custom_prompt: str = None,
+    model: str = None,
+    session_state=None,
+    latitude: float = None,
+    longitude: float = None,
+    soil_text: str = None,
+    weather_text: str = None,
+    stages_text: str = None,
+    run_id: int = None,
+    max_concurrency: int = None
+):
+    """
+    Async variant of disease_agent. Per-stage calls use acall_llm and run
+    concurrently (bounded by max_concurrency); lookups and saves run in threads.
+    """
+    from agent_helper import amap_bounded
+
+    prepared = await asyncio.to_thread(
+        _disease_prepare,
+        farmer_input, crop, crop_variety, location, sowing_date, custom_prompt, model,
+        session_state, latitude, longitude, soil_text, weather_text, stages_text, run_id,
+    )
+    if isinstance(prepared, str):
+        return prepared
+
+    async def _assess_stage(job):
+        stage_name, header, user_prompt = job
+        try:
+            text = await acall_llm(
+                model=prepared['chosen_model'],
+                system_prompt=prepared['system_prompt'],
+                user_message=user_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                agent="disease",
+                response_schema=output_schema("disease"),
+            )
+            return LLMResult(header + "\n" + text, getattr(text, "model", None), data=getattr(text, "data", None))
+        except Exception as e:
+            return f"Error generating disease assessment for stage {stage_name}: {e}"
+
+    results = await amap_bounded(_assess_stage, prepared['jobs'], fanout_concurrency(prepared['chosen_model'], max_concurrency))
+    return await asyncio.to_thread(_disease_finish, prepared, results, run_id)
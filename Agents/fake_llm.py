@@ -0,0 +1,637 @@
+"""
+Offline stand-in for an LLM provider, selected with the `fake:` model prefix.
+
+call_llm("fake:...") returns canned answers in the format each agent's
+post-processing expects (the stage plan parses with
+parse_stage_plan_and_current_stage, the merge answer is valid JSON, and
+structured calls get JSON matching schemas.AGENT_SCHEMAS), so the
+whole pipeline can be run and load-tested without network or API keys.
+
+The agent is detected from the prompts; pin it with "fake:<agent>", e.g.
+"fake:stage". Behaviour is configured with environment variables, configure(),
+or per model with query-style options ("fake:?error_rate=1|fake:backup" makes
+the first model in a fallback chain always fail):
+
+    FAKE_LLM_LATENCY            time to first token: "fixed:0.5",
+                                "uniform:0.2,1.5", "normal:0.8,0.2",
+                                "lognormal:<median>,<sigma>" or "0"
+    FAKE_LLM_SECONDS_PER_TOKEN  decode time added per output token
+    FAKE_LLM_ERROR_RATE         fraction of calls that fail (0..1)
+    FAKE_LLM_ERROR_STATUS       HTTP status(es) the failures carry, e.g. "429,503"
+    FAKE_LLM_OUTPUT_TOKENS      pad answers to roughly this many tokens (0 = natural size)
+    FAKE_LLM_SEED               seed; the same prompts and seed replay the same
+                                latencies, failures and answers
+
+Answers are capped at max_tokens like a real model would truncate them.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from datetime import date, datetime, timedelta
+from typing import Optional
+from urllib.parse import parse_qsl
+
+DEFAULT_SETTINGS = {
+    "latency": "lognormal:0.4,0.5",
+    "seconds_per_token": 0.004,
+    "error_rate": 0.0,
+    "error_status": "503",
+    "output_tokens": 0,
+    "seed": "0",
+}
+_ENV_NAMES = {
+    "latency": "FAKE_LLM_LATENCY",
+    "seconds_per_token": "FAKE_LLM_SECONDS_PER_TOKEN",
+    "error_rate": "FAKE_LLM_ERROR_RATE",
+    "error_status": "FAKE_LLM_ERROR_STATUS",
+    "output_tokens": "FAKE_LLM_OUTPUT_TOKENS",
+    "seed": "FAKE_LLM_SEED",
+}
+_CASTS = {
+    "latency": str,
+    "seconds_per_token": float,
+    "error_rate": float,
+    "error_status": str,
+    "output_tokens": int,
+    "seed": str,
+}
+
+# Structured calls carry this in the system prompt (schemas.SCHEMA_INSTRUCTION)
+JSON_MARKER = "OUTPUT FORMAT OVERRIDE"
+
+# Streamed answers are split into chunks of about this many characters
+STREAM_CHUNK_CHARS = 24
+
+_overrides = {}
+_lock = threading.Lock()
+_call_counts = {}  # prompt hash -> calls so far (retries of one prompt differ)
+_stats = {}  # agent -> counters
+
+# Markers looked for in the prompts; the one found earliest names the agent
+_AGENT_MARKERS = (
+    ("merge", ("FINAL MERGE AGENT", "MERGED JSON REPORT")),
+    ("stage", ("STAGE-PLANNER", "GROWTH STAGE PLAN")),
+    ("nutrient", ("NUTRIENT PLANNER",)),
+    ("irrigation", ("IRRIGATION PLANNER",)),
+    ("pest", ("PEST MANAGEMENT AGENT",)),
+    ("disease", ("DISEASE MANAGEMENT AGENT",)),
+    ("soil", ("SOIL AGENT",)),
+    ("water", ("WATER AGENT",)),
+)
+
+# crop -> [(stage name, typical days)]
+CROP_STAGES = {
+    "wheat": [
+        ("Germination & Emergence", 10), ("Crown Root Initiation", 15), ("Tillering", 25),
+        ("Jointing & Booting", 20), ("Heading & Flowering", 15), ("Grain Filling", 25),
+        ("Physiological Maturity", 15),
+    ],
+    "rice": [
+        ("Germination & Seedling", 20), ("Tillering", 30), ("Panicle Initiation", 20),
+        ("Flowering", 15), ("Grain Filling", 25), ("Maturity", 15),
+    ],
+    "maize": [
+        ("Emergence", 10), ("Vegetative (V6-V10)", 30), ("Tasseling & Silking", 15),
+        ("Grain Filling", 30), ("Physiological Maturity", 15),
+    ],
+    "soybean": [
+        ("Emergence", 10), ("Vegetative", 30), ("Flowering", 20),
+        ("Pod Development", 20), ("Seed Filling", 20), ("Maturity", 10),
+    ],
+}
+DEFAULT_STAGES = [
+    ("Germination", 10), ("Vegetative Growth", 35), ("Flowering", 20),
+    ("Fruit / Grain Development", 30), ("Maturity", 15),
+]
+
+_FILLER = (
+    "Field observations should be recorded weekly and compared with this plan. "
+    "Adjust the schedule if local extension advice or observed crop condition differs. "
+)
+
+
+class FakeLLMError(Exception):
+    """Simulated provider error; status_code drives the router's retry rules."""
+
+    def __init__(self, status_code: int, message: str = "simulated provider error"):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+class FakeLLMTimeout(Exception):
+    """Simulated read timeout (the sampled latency exceeded the timeout)."""
+
+
+def configure(**settings):
+    """Override settings for this process (keys of DEFAULT_SETTINGS); None restores the default."""
+    unknown = [k for k in settings if k not in DEFAULT_SETTINGS]
+    if unknown:
+        raise ValueError(f"Unknown fake LLM settings: {unknown}")
+    with _lock:
+        for name, value in settings.items():
+            if value is None:
+                _overrides.pop(name, None)
+            else:
+                _overrides[name] = value
+
+
+def settings(model: str = "") -> dict:
+    """Effective settings: defaults < env < configure() < options in the model string."""
+    out = dict(DEFAULT_SETTINGS)
+    for name, env_name in _ENV_NAMES.items():
+        value = os.getenv(env_name)
+        if value not in (None, ""):
+            out[name] = value
+    with _lock:
+        out.update(_overrides)
+    out.update(_model_options(model)[1])
+    for name, cast in _CASTS.items():
+        try:
+            out[name] = cast(out[name])
+        except (TypeError, ValueError):
+            out[name] = DEFAULT_SETTINGS[name]
+    return out
+
+
+def _model_options(model: str):
+    """Split "fake:<label>?k=v&k=v" into (label, {k: v})."""
+    body = (model or "").strip()
+    if body.startswith("fake:"):
+        body = body[len("fake:"):]
+    elif body == "fake":
+        body = ""
+    label, _, query = body.partition("?")
+    options = {k: v for k, v in parse_qsl(query) if k in DEFAULT_SETTINGS}
+    return label.strip().lower(), options
+
+
+def detect_agent(model: str, system_prompt: str, user_message: str) -> str:
+    label, _ = _model_options(model)
+    if label in dict(_AGENT_MARKERS):
+        return label
+    # prompts name their own agent first ("You are the SOIL AGENT ..."), other
+    # agents only later, so the earliest marker wins
+    for text in (system_prompt or "", user_message or ""):
+        upper = text.upper()
+        positions = []
+        for agent, markers in _AGENT_MARKERS:
+            found = [upper.find(marker) for marker in markers if marker in upper]
+            if found:
+                positions.append((min(found), agent))
+        if positions:
+            return min(positions)[1]
+    return "generic"
+
+
+def sample_latency(spec: str, rng: random.Random) -> float:
+    """Seconds to first token for a distribution spec such as "lognormal:0.4,0.5"."""
+    kind, _, args = (spec or "0").strip().lower().partition(":")
+    try:
+        values = [float(v) for v in args.split(",") if v.strip()]
+        if kind in ("", "0", "none", "off"):
+            return 0.0
+        if kind == "fixed":
+            return max(0.0, values[0])
+        if kind == "uniform":
+            return rng.uniform(values[0], values[1])
+        if kind == "normal":
+            return max(0.0, rng.gauss(values[0], values[1]))
+        if kind == "lognormal":
+            return rng.lognormvariate(math.log(max(values[0], 1e-6)), values[1])
+        return max(0.0, float(kind))
+    except (ValueError, IndexError):
+        print(f"[fake_llm] Warning: bad latency spec {spec!r}; using 0")
+        return 0.0
+
+
+def _tokens(text: str) -> int:
+    # ~4 characters per token, the same fallback estimate_tokens uses
+    return max(1, int(len(text) / 4)) if text else 0
+
+
+# ---------------------------------------------------------------------------
+# Canned answers
+# ---------------------------------------------------------------------------
+def _field(pattern: str, *texts, default=None):
+    for text in texts:
+        match = re.search(pattern, text or "", re.IGNORECASE)
+        if match and match.group(1).strip():
+            return match.group(1).strip()
+    return default
+
+
+def _sowing_date(system_prompt: str, user_message: str) -> date:
+    raw = _field(r"Sowing[\s_-]*Date[:：]?\s*(\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4})", user_message, system_prompt)
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(raw, fmt).date()
+        except (TypeError, ValueError):
+            continue
+    return date.today() - timedelta(days=45)
+
+
+def _crop(system_prompt: str, user_message: str) -> str:
+    return _field(r"Crop(?:[\s_]*Name)?[:：]\s*([A-Za-z][A-Za-z \-]*)", user_message, system_prompt, default="crop")
+
+
+def _location(system_prompt: str, user_message: str) -> str:
+    return _field(r"Location[:：]\s*([^\n,]+)", user_message, system_prompt, default="the farm")
+
+
+def _stage_rows(crop: str, sowing: date):
+    """[(name, start, end, days)] for the crop, starting at the sowing date."""
+    stages = CROP_STAGES.get(crop.split()[0].lower() if crop else "", DEFAULT_STAGES)
+    rows = []
+    start = sowing
+    for name, days in stages:
+        end = start + timedelta(days=days - 1)
+        rows.append((name, start, end, days))
+        start = end + timedelta(days=1)
+    return rows
+
+
+def _stage_plan(system_prompt, user_message, rng):
+    crop = _crop(system_prompt, user_message)
+    sowing = _sowing_date(system_prompt, user_message)
+    rows = _stage_rows(crop, sowing)
+    lines = [
+        f"Location: {_location(system_prompt, user_message)}",
+        f"Crop: {crop}",
+        f"Sowing Date: {sowing.isoformat()}",
+        "",
+        "GROWTH STAGE PLAN:",
+        "━" * 44,
+        "",
+    ]
+    for i, (name, start, end, days) in enumerate(rows, 1):
+        lines += [
+            f"Stage {i}: {name}",
+            f"├─ Start Date: {start.isoformat()}",
+            f"├─ End Date: {end.isoformat()}",
+            f"├─ Duration: {days} days",
+            f"├─ Confidence: {rng.uniform(0.7, 0.95):.2f}",
+            "└─ Key Factors: Typical temperature and soil moisture for the season",
+            "",
+        ]
+    total = sum(r[3] for r in rows)
+    lines += [
+        "━" * 44,
+        f"TOTAL CROP DURATION: {total} days",
+        f"EXPECTED HARVEST DATE: {rows[-1][2].isoformat()}",
+        f"OVERALL CONFIDENCE: {rng.uniform(0.75, 0.9):.2f}",
+        "",
+        "CRITICAL ASSUMPTIONS:",
+        "- Normal seasonal weather; irrigation available at critical stages",
+        "",
+        "CRITICAL ALERTS (if any):",
+        "- None beyond normal seasonal risks",
+    ]
+    return "\n".join(lines)
+
+
+def _merge_json(system_prompt, user_message, rng):
+    pattern = (
+        r"Stage\s*\d+[:：]\s*([^\n\r]+).*?Start[\s_-]*Date[:：]?\s*(\d{4}-\d{2}-\d{2})"
+        r".*?End[\s_-]*Date[:：]?\s*(\d{4}-\d{2}-\d{2})"
+    )
+    found = re.findall(pattern, user_message or "", re.DOTALL | re.IGNORECASE)
+    if found:
+        rows = [
+            (name.strip(), datetime.strptime(s, "%Y-%m-%d").date(), datetime.strptime(e, "%Y-%m-%d").date())
+            for name, s, e in found
+        ]
+    else:
+        rows = [(n, s, e) for n, s, e, _ in _stage_rows(_crop(system_prompt, user_message), _sowing_date(system_prompt, user_message))]
+    stages = []
+    for name, start, end in rows:
+        stages.append({
+            "stage_name": name,
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "duration_days": (end - start).days + 1,
+            **_stage_advice(rng),
+        })
+    return json.dumps({
+        "stages": stages,
+        "general_summary": _general_summary(rng),
+    }, indent=2, ensure_ascii=False)
+
+
+def _stage_advice(rng):
+    return {
+        "activities": [
+            f"Apply {rng.randint(15, 40)} kg Urea per hectare",
+            f"Irrigate with {rng.randint(40, 70)}mm water every {rng.randint(7, 12)} days",
+            "Check 10 random plants for aphids and leaf spots twice a week",
+        ],
+        "tips": ["Check soil moisture before irrigating"],
+        "alerts": ["MEDIUM RISK: fungal disease after prolonged humid weather"],
+    }
+
+
+def _general_summary(rng):
+    return {
+        "soil": "Loamy soil with neutral pH and moderate organic matter.",
+        "nutrient": "Total requirement: 120:60:40 kg/ha NPK, split basal and top dressing.",
+        "irrigation": f"Total: {rng.randint(350, 500)}mm over the season in critical irrigations.",
+        "weather": "Seasonal conditions expected; watch for heat or cold stress.",
+        "pest": "Aphids and stem borers are the main threats; follow IPM thresholds.",
+        "disease": "Rusts and leaf blights are the main threats in humid spells.",
+    }
+
+
+def _report(agent, system_prompt, user_message, rng):
+    crop = _crop(system_prompt, user_message)
+    location = _location(system_prompt, user_message)
+    title = agent.upper() if agent != "generic" else "ADVISORY"
+    header = [
+        f"{title} REPORT",
+        f"Location: {location}",
+        f"Crop: {crop}",
+        "",
+    ]
+    bodies = {
+        "soil": [
+            f"- Soil type: Loam, pH {rng.uniform(6.2, 7.8):.1f}",
+            f"- Organic carbon: {rng.uniform(0.3, 0.9):.2f}%",
+            f"- Available N/P/K: {rng.randint(180, 320)}/{rng.randint(10, 30)}/{rng.randint(150, 350)} kg/ha",
+            "- Recommendation: add 5 t/ha farmyard manure before sowing",
+        ],
+        "water": [
+            f"- Seasonal rainfall: {rng.randint(300, 900)} mm",
+            f"- Groundwater depth: {rng.randint(5, 30)} m",
+            "- Water availability: adequate with supplemental irrigation",
+        ],
+        "nutrient": [
+            "- Total requirement: 120:60:40 kg/ha NPK",
+            "- Basal: 50% N, full P and K at sowing",
+            "- Top dressing: remaining N in two splits at tillering and booting",
+            "- Zinc Sulphate 25 kg/ha if zinc is deficient",
+        ],
+        "irrigation": [
+            f"- Total water requirement: {rng.randint(350, 500)} mm",
+            f"- Irrigate {rng.randint(50, 70)} mm every {rng.randint(8, 14)} days at critical stages",
+            "- Skip irrigation if rainfall exceeds 25 mm in the previous 3 days",
+        ],
+        "pest": [
+            "- Aphids: monitor leaf undersides; threshold 5 aphids per tiller",
+            "- Stem borer: look for dead hearts; install pheromone traps at 5/ha",
+            "- Risk level: MEDIUM",
+        ],
+        "disease": [
+            "- Rust: yellow-orange pustules on leaves; spray Propiconazole 0.1% on appearance",
+            "- Leaf blight: brown lesions in humid weather; ensure field drainage",
+            "- Risk level: MEDIUM",
+        ],
+    }
+    return "\n".join(header + bodies.get(agent, ["- No specific issues found; follow standard practices"]))
+
+
+def _structured(agent, system_prompt, user_message, rng):
+    """JSON answer for a structured call (schemas.AGENT_SCHEMAS[agent])."""
+    title = _field(r'"title"\s*:\s*"(\w+)"', system_prompt)
+    if title == "merge_stage":
+        return json.dumps(_stage_advice(rng), indent=2, ensure_ascii=False)
+    if title == "merge_summary":
+        return json.dumps(_general_summary(rng), indent=2, ensure_ascii=False)
+    if title == "merge" and (user_message or "").lstrip().startswith("{"):
+        # polish pass over a rule-based merge: hand the draft back unchanged
+        try:
+            return json.dumps(json.loads(user_message), indent=2, ensure_ascii=False)
+        except ValueError:
+            pass
+    crop = _crop(system_prompt, user_message)
+    sowing = _sowing_date(system_prompt, user_message)
+    rows = _stage_rows(crop, sowing)
+    stage_name = _field(r"(?:Growth )?Stage[:：]\s*([^\n]+)", user_message, default=rows[0][0])
+    risk = rng.choice(["LOW", "MEDIUM", "HIGH"])
+    if agent == "stage":
+        data = {
+            "location": _location(system_prompt, user_message),
+            "crop": crop,
+            "sowing_date": sowing.isoformat(),
+            "stages": [
+                {
+                    "stage_name": name, "start_date": start.isoformat(), "end_date": end.isoformat(),
+                    "duration_days": days, "confidence": round(rng.uniform(0.7, 0.95), 2),
+                    "key_factors": "Typical temperature and soil moisture for the season",
+                }
+                for name, start, end, days in rows
+            ],
+            "expected_harvest_date": rows[-1][2].isoformat(),
+            "overall_confidence": round(rng.uniform(0.75, 0.9), 2),
+            "assumptions": ["Normal seasonal weather; irrigation available at critical stages"],
+        }
+    elif agent == "soil":
+        data = {
+            "soil_type": "Loam", "texture": "Medium", "ph": round(rng.uniform(6.2, 7.8), 1),
+            "organic_carbon_pct": round(rng.uniform(0.3, 0.9), 2),
+            "nitrogen_kg_ha": rng.randint(180, 320), "phosphorus_kg_ha": rng.randint(10, 30),
+            "potassium_kg_ha": rng.randint(150, 350), "drainage": "Good",
+            "recommendations": ["Add 5 t/ha farmyard manure before sowing"],
+            "summary": "Loamy soil with neutral pH and moderate organic matter.",
+        }
+    elif agent == "water":
+        data = {
+            "source": "Groundwater", "availability": "Adequate with supplemental irrigation",
+            "quality": "Good", "seasonal_rainfall_mm": rng.randint(300, 900),
+            "recommendations": ["Irrigate at critical stages only"],
+            "summary": "Water is adequate with supplemental irrigation.",
+        }
+    elif agent == "nutrient":
+        splits = ["Apply 50% N with full P and K as basal", "Top-dress 25% N", "Top-dress remaining 25% N"]
+        data = {
+            "total_n_kg_ha": 120, "total_p_kg_ha": 60, "total_k_kg_ha": 40,
+            "micronutrients": ["Zinc Sulphate 25 kg/ha if zinc is deficient"],
+            "stages": [{"stage_name": r[0], "applications": [splits[i]] if i < len(splits) else []} for i, r in enumerate(rows)],
+            "summary": "Total requirement: 120:60:40 kg/ha NPK, split basal and top dressing.",
+        }
+    elif agent == "irrigation":
+        amount = rng.randint(50, 70)
+        data = {
+            "total_water_mm": rng.randint(350, 500), "method": "Furrow",
+            "stages": [{"stage_name": r[0], "irrigations": [f"Irrigate {amount} mm every {rng.randint(8, 14)} days"]} for r in rows],
+            "alerts": ["Skip irrigation if rainfall exceeds 25 mm in the previous 3 days"],
+            "summary": f"Irrigate about {amount} mm at critical stages.",
+        }
+    elif agent == "pest":
+        data = {
+            "stage_name": stage_name,
+            "pests": [
+                {"name": "Aphids", "risk": risk, "symptoms": "Colonies on leaf undersides", "action": "Threshold 5 aphids per tiller; spray neem oil 3%"},
+                {"name": "Stem borer", "risk": "LOW", "symptoms": "Dead hearts", "action": "Install pheromone traps at 5/ha"},
+            ],
+            "alerts": [f"{risk} RISK: aphids in warm dry spells"],
+            "summary": "Aphids are the main pest in this stage.",
+        }
+    elif agent == "disease":
+        data = {
+            "stage_name": stage_name,
+            "diseases": [
+                {"name": "Rust", "risk": risk, "symptoms": "Yellow-orange pustules on leaves", "action": "Spray Propiconazole 0.1% on appearance"},
+                {"name": "Leaf blight", "risk": "LOW", "symptoms": "Brown lesions", "action": "Ensure field drainage"},
+            ],
+            "alerts": [f"{risk} RISK: rust after humid weather"],
+            "summary": "Rust is the main disease risk in this stage.",
+        }
+    else:
+        return _merge_json(system_prompt, user_message, rng)
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+
+def answer(agent: str, system_prompt: str, user_message: str, rng: random.Random) -> str:
+    if JSON_MARKER in (system_prompt or ""):
+        return _structured(agent, system_prompt, user_message, rng)
+    if agent == "stage":
+        return _stage_plan(system_prompt, user_message, rng)
+    if agent == "merge":
+        return _merge_json(system_prompt, user_message, rng)
+    return _report(agent, system_prompt, user_message, rng)
+
+
+def _sized(text: str, output_tokens: int, max_tokens: int) -> str:
+    """Pad to output_tokens, then truncate to max_tokens. JSON answers keep
+    their shape: the filler goes into general_summary.soil of a full merge
+    report and into a top-level "notes" key of any other object."""
+    if output_tokens and _tokens(text) < output_tokens:
+        missing_chars = (output_tokens - _tokens(text)) * 4
+        filler = (_FILLER * (missing_chars // len(_FILLER) + 1))[:missing_chars].strip()
+        if text.startswith("{"):
+            data = json.loads(text)
+            summary = data.get("general_summary")
+            if isinstance(summary, dict) and isinstance(summary.get("soil"), str):
+                summary["soil"] += " " + filler
+            else:
+                data["notes"] = filler
+            text = json.dumps(data, indent=2, ensure_ascii=False)
+        else:
+            text = text + "\n\nNOTES:\n" + filler
+    if max_tokens and _tokens(text) > max_tokens:
+        text = text[: int(max_tokens) * 4]
+    return text
+
+
+# ---------------------------------------------------------------------------
+# Call plumbing
+# ---------------------------------------------------------------------------
+def _plan(model, system_prompt, user_message, max_tokens):
+    """Decide everything about one call up front: answer, latencies, failure."""
+    config = settings(model)
+    agent = detect_agent(model, system_prompt, user_message)
+    digest = hashlib.sha256(
+        json.dumps([model, system_prompt, user_message], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    with _lock:
+        nth = _call_counts.get(digest, 0)
+        _call_counts[digest] = nth + 1
+        if len(_call_counts) > 10000:
+            _call_counts.clear()
+    # content depends only on the prompt; latency and failures also on the attempt
+    text = _sized(
+        answer(agent, system_prompt, user_message, random.Random(f"{config['seed']}:{digest}")),
+        config["output_tokens"],
+        max_tokens,
+    )
+    rng = random.Random(f"{config['seed']}:{digest}:{nth}")
+    first_token = sample_latency(config["latency"], rng)
+    decode = _tokens(text) * max(0.0, config["seconds_per_token"])
+    error = None
+    if rng.random() < config["error_rate"]:
+        statuses = [int(s) for s in re.findall(r"\d+", config["error_status"])] or [503]
+        error = FakeLLMError(rng.choice(statuses))
+    prompt_tokens = _tokens(system_prompt) + _tokens(user_message)
+    return agent, text, first_token, decode, error, prompt_tokens
+
+
+def _record(agent, prompt_tokens, completion_tokens, seconds, error=None):
+    with _lock:
+        entry = _stats.setdefault(agent, {
+            "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0,
+        })
+        entry["calls"] += 1
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
+        entry["seconds"] += seconds
+        if error is not None:
+            entry["errors"] += 1
+
+
+def stats() -> dict:
+    """Per-agent call, error, token and simulated-seconds counters."""
+    with _lock:
+        return {agent: dict(entry, seconds=round(entry["seconds"], 3)) for agent, entry in _stats.items()}
+
+
+def reset(clear_settings: bool = False):
+    """Zero the counters (and the per-prompt attempt numbers); optionally drop configure() overrides."""
+    with _lock:
+        _stats.clear()
+        _call_counts.clear()
+        if clear_settings:
+            _overrides.clear()
+
+
+def _waited(seconds: float, timeout: Optional[float]) -> float:
+    """How long the caller actually waits: a slow answer is cut off at the timeout."""
+    return seconds if timeout is None else min(seconds, timeout)
+
+
+def _check(seconds: float, timeout: Optional[float], error=None):
+    if timeout is not None and seconds > timeout:
+        raise FakeLLMTimeout(f"simulated read timeout after {timeout:.1f}s")
+    if error is not None:
+        raise error
+
+
+def complete(model, system_prompt, user_message, temperature=0.1, max_tokens=1200, timeout=None) -> str:
+    agent, text, first_token, decode, error, prompt_tokens = _plan(model, system_prompt, user_message, max_tokens)
+    total = first_token if error else first_token + decode
+    waited = _waited(total, timeout)
+    try:
+        time.sleep(waited)
+        _check(total, timeout, error)
+    except Exception as e:
+        _record(agent, prompt_tokens, 0, waited, e)
+        raise
+    _record(agent, prompt_tokens, _tokens(text), total)
+    return text
+
+
+async def acomplete(model, system_prompt, user_message, temperature=0.1, max_tokens=1200, timeout=None) -> str:
+    agent, text, first_token, decode, error, prompt_tokens = _plan(model, system_prompt, user_message, max_tokens)
+    total = first_token if error else first_token + decode
+    waited = _waited(total, timeout)
+    try:
+        await asyncio.sleep(waited)
+        _check(total, timeout, error)
+    except Exception as e:
+        _record(agent, prompt_tokens, 0, waited, e)
+        raise
+    _record(agent, prompt_tokens, _tokens(text), total)
+    return text
+
+
+def stream(model, system_prompt, user_message, temperature=0.1, max_tokens=1200, timeout=None):
+    """Yield the answer in chunks: the first after the sampled latency, the rest at decode speed."""
+    agent, text, first_token, decode, error, prompt_tokens = _plan(model, system_prompt, user_message, max_tokens)
+    waited = _waited(first_token, timeout)
+    try:
+        time.sleep(waited)
+        _check(first_token, timeout, error)
+    except Exception as e:
+        _record(agent, prompt_tokens, 0, waited, e)
+        raise
+    chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+    per_chunk = decode / len(chunks) if chunks else 0.0
+    for i, chunk in enumerate(chunks):
+        if i:
+            time.sleep(per_chunk)
+        yield chunk
+    _record(agent, prompt_tokens, _tokens(text), first_token + decode)
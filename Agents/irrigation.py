@@ -4,7 +4,9 @@ from datetime import datetime
 from dotenv import load_dotenv
 from together import Together
 from user_input import FarmerInput
-from llm_router import call_llm
+from llm_router import call_llm, acall_llm, answered_model
+from schemas import output_schema
+import asyncio
 
 load_dotenv()
 
@@ -170,43 +172,31 @@ irrigation_system_prompt = """
 """
 
 
-def irrigation_agent(
-    farmer_input: FarmerInput = None,
-    location: str = None,
-    crop: str = None,
-    sowing_date: str = None,
-    area: float = None,
+def _irrigation_farmer_input(farmer_input=None, location=None, crop=None, sowing_date=None, area=None):
+    # Backward compatibility: allow calling with explicit args
+    if farmer_input is None:
+        farmer_input = FarmerInput(
+            location=location,
+            crop_name=crop,
+            sowing_date=sowing_date,
+            area=area,
+        )
+    return farmer_input
+
+
+def _irrigation_inputs(
+    farmer_input,
+    chosen_model: str,
     soil_report: str = None,
     water_report: str = None,
     weather_report: str = None,
     growth_stages: str = None,
-    model_name: str = None,
-    temperature: float = 0.1,
-    max_tokens: int = 2000,
-    custom_prompt: str = None,
     session_state=None,
     latitude: float = None,
     longitude: float = None,
-    save_to_db: bool = True,
     run_id: int = None,
-) -> str:
-    """
-    Generate detailed stage-wise irrigation plan for any crop.
-    
-    Args:
-        location: Farm location
-        crop: Crop name (wheat/rice/maize/cotton/any crop)
-        sowing_date: Sowing date (YYYY-MM-DD)
-        area: Area in hectares
-        soil_report: Soil analysis report
-        water_report: Water availability report
-        weather_report: Weather data
-        growth_stages: Growth stage plan from stage_planner_agent
-        custom_prompt: Optional custom prompt
-    
-    Returns:
-        Detailed irrigation plan as string
-    """
+) -> dict:
+    """Resolve soil/water/weather/stage reports (session/DB first)."""
     from agent_helper import (
         get_or_fetch_soil,
         get_or_fetch_water,
@@ -215,29 +205,6 @@ def irrigation_agent(
         extract_output_text,
     )
 
-    # Backward compatibility: allow calling with explicit args
-    if farmer_input is None:
-        farmer_input = FarmerInput(
-            location=location,
-            crop_name=crop,
-            sowing_date=sowing_date,
-            area=area,
-        )
-
-    location = getattr(farmer_input, 'location', location)
-    crop = getattr(farmer_input, 'crop_name', crop)
-    sowing_date = getattr(farmer_input, 'sowing_date', sowing_date)
-    area = getattr(farmer_input, 'area', area)
-
-    chosen_model = model_name if model_name else MODEL_NAME
-
-    # Escape braces in inputs
-    def esc(s: str) -> str:
-        return (s or "").replace("{", "{{").replace("}", "}}")
-
-    # Use custom prompt if provided
-    system_prompt = custom_prompt if custom_prompt else irrigation_system_prompt
-
     # Fetch dependencies intelligently (session/DB first)
     soil_data = None
     water_data = None
@@ -257,12 +224,33 @@ def irrigation_agent(
         stage_data = get_or_fetch_stage(farmer_input, session_state or {}, chosen_model, latitude, longitude, run_id=run_id)
         growth_stages = extract_output_text(stage_data)
 
+    return {
+        'soil_report': soil_report,
+        'water_report': water_report,
+        'weather_report': weather_report,
+        'growth_stages': growth_stages,
+        'soil_data': soil_data,
+        'water_data': water_data,
+        'weather_data': weather_data,
+        'stage_data': stage_data,
+    }
+
+
+def _irrigation_request(farmer_input, inputs: dict, custom_prompt: str = None):
+    """Build (system_prompt, user_message) for the irrigation agent."""
+    # Escape braces in inputs
+    def esc(s: str) -> str:
+        return (s or "").replace("{", "{{").replace("}", "}}")
+
+    # Use custom prompt if provided
+    system_prompt = custom_prompt if custom_prompt else irrigation_system_prompt
+
     # Format prompt with actual data
     user_message = system_prompt.format(
-        location=esc(location),
-        crop=esc(crop),
-        sowing_date=esc(sowing_date),
-        area=esc(str(area)),
+        location=esc(getattr(farmer_input, 'location', None)),
+        crop=esc(getattr(farmer_input, 'crop_name', None)),
+        sowing_date=esc(getattr(farmer_input, 'sowing_date', None)),
+        area=esc(str(getattr(farmer_input, 'area', None))),
         irrigation_type=esc(getattr(farmer_input, 'irrigation_type', '') or ''),
         irrigation_method=esc(getattr(farmer_input, 'irrigation_method', '') or ''),
         water_source=esc(getattr(farmer_input, 'water_source', '') or ''),
@@ -276,11 +264,105 @@ def irrigation_agent(
         hardpan_crusting=esc(getattr(farmer_input, 'hardpan_crusting', '') or ''),
         farming_method=esc(getattr(farmer_input, 'farming_method', '') or ''),
         planting_method=esc(getattr(farmer_input, 'planting_method', '') or ''),
-        soil_report=esc(soil_report),
-        water_report=esc(water_report),
-        weather_report=esc(weather_report),
-        growth_stages=esc(growth_stages),
+        soil_report=esc(inputs['soil_report']),
+        water_report=esc(inputs['water_report']),
+        weather_report=esc(inputs['weather_report']),
+        growth_stages=esc(inputs['growth_stages']),
     )
+    return system_prompt, user_message
+
+
+def _save_irrigation_result(final_text, farmer_input, inputs: dict, chosen_model, system_prompt, save_to_db=True, run_id=None):
+    if save_to_db:
+        try:
+            from backend.init_db import SessionLocal
+            from backend.data_store import save_irrigation
+
+            stage_id = None
+            soil_id = None
+            water_id = None
+            weather_id = None
+            stage_data = inputs['stage_data']
+            soil_data = inputs['soil_data']
+            water_data = inputs['water_data']
+            weather_data = inputs['weather_data']
+            if isinstance(stage_data, dict) and 'id' in stage_data:
+                stage_id = stage_data.get('id')
+            if isinstance(soil_data, dict) and 'id' in soil_data:
+                soil_id = soil_data.get('id')
+            if isinstance(water_data, dict) and 'id' in water_data:
+                water_id = water_data.get('id')
+            if isinstance(weather_data, dict) and 'id' in weather_data:
+                weather_id = weather_data.get('id')
+
+            with SessionLocal() as session:
+                obj = save_irrigation(
+                    session=session,
+                    location=getattr(farmer_input, 'location', None),
+                    crop_name=getattr(farmer_input, 'crop_name', None),
+                    sowing_date=getattr(farmer_input, 'sowing_date', None),
+                    area=getattr(farmer_input, 'area', None),
+                    stage_id=stage_id,
+                    soil_id=soil_id,
+                    water_id=water_id,
+                    weather_id=weather_id,
+                    model_name=answered_model([final_text], chosen_model),
+                    prompt=system_prompt,
+                    output=final_text,
+                    run_id=run_id,
+                )
+                return {"id": obj.id, "output": final_text, "data": getattr(final_text, "data", None)}
+        except Exception as ex:
+            print(f"[irrigation_agent] Warning: Could not save to DB: {ex}")
+
+    return final_text
+
+
+def irrigation_agent(
+    farmer_input: FarmerInput = None,
+    location: str = None,
+    crop: str = None,
+    sowing_date: str = None,
+    area: float = None,
+    soil_report: str = None,
+    water_report: str = None,
+    weather_report: str = None,
+    growth_stages: str = None,
+    model_name: str = None,
+    temperature: float = 0.1,
+    max_tokens: int = 2000,
+    custom_prompt: str = None,
+    session_state=None,
+    latitude: float = None,
+    longitude: float = None,
+    save_to_db: bool = True,
+    run_id: int = None,
+) -> str:
+    """
+    Generate detailed stage-wise irrigation plan for any crop.
+    
+    Args:
+        location: Farm location
+        crop: Crop name (wheat/rice/maize/cotton/any crop)
+        sowing_date: Sowing date (YYYY-MM-DD)
+        area: Area in hectares
+        soil_report: Soil analysis report
+        water_report: Water availability report
+        weather_report: Weather data
+        growth_stages: Growth stage plan from stage_planner_agent
+        custom_prompt: Optional custom prompt
+    
+    Returns:
+        Detailed irrigation plan as string
+    """
+    farmer_input = _irrigation_farmer_input(farmer_input, location, crop, sowing_date, area)
+    chosen_model = model_name if model_name else MODEL_NAME
+
+    inputs = _irrigation_inputs(
+        farmer_input, chosen_model, soil_report, water_report, weather_report, growth_stages,
+        session_state, latitude, longitude, run_id,
+    )
+    system_prompt, user_message = _irrigation_request(farmer_input, inputs, custom_prompt)
 
     try:
         text = call_llm(
@@ -289,49 +371,60 @@ def irrigation_agent(
             user_message=user_message,
             temperature=temperature,
             max_tokens=max_tokens,
+            agent="irrigation",
+            response_schema=output_schema("irrigation"),
         )
-
-        final_text = text
-
-        if save_to_db:
-            try:
-                from backend.init_db import SessionLocal
-                from backend.data_store import save_irrigation
-
-                stage_id = None
-                soil_id = None
-                water_id = None
-                weather_id = None
-                if isinstance(stage_data, dict) and 'id' in stage_data:
-                    stage_id = stage_data.get('id')
-                if isinstance(soil_data, dict) and 'id' in soil_data:
-                    soil_id = soil_data.get('id')
-                if isinstance(water_data, dict) and 'id' in water_data:
-                    water_id = water_data.get('id')
-                if isinstance(weather_data, dict) and 'id' in weather_data:
-                    weather_id = weather_data.get('id')
-
-                with SessionLocal() as session:
-                    obj = save_irrigation(
-                        session=session,
-                        location=location,
-                        crop_name=crop,
-                        sowing_date=sowing_date,
-                        area=area,
-                        stage_id=stage_id,
-                        soil_id=soil_id,
-                        water_id=water_id,
-                        weather_id=weather_id,
-                        model_name=chosen_model,
-                        prompt=system_prompt,
-                        output=final_text,
-                        run_id=run_id,
-                    )
-                    return {"id": obj.id, "output": final_text}
-            except Exception as ex:
-                print(f"[irrigation_agent] Warning: Could not save to DB: {ex}")
-
-        return final_text
+        return _save_irrigation_result(text, farmer_input, inputs, chosen_model, system_prompt, save_to_db, run_id)
     except Exception as e:
         return f"Error calling Irrigation Agent: {e}"
 
+
+async def airrigation_agent(
+    farmer_input: FarmerInput = None,
+    location: str = None,
+    crop: str = None,
+    sowing_date: str = None,
+    area: float = None,
+    soil_report: str = None,
+    water_report: str = None,
+    weather_report: str = None,
+    growth_stages: str = None,
+    model_name: str = None,
+    temperature: float = 0.1,
+    max_tokens: int = 2000,
+    custom_prompt: str = None,
+    session_state=None,
+    latitude: float = None,
+    longitude: float = None,
+    save_to_db: bool = True,
+    run_id: int = None,
+):
+    """
+    Async variant of irrigation_agent. Dependency lookups and the DB save run
+    in worker threads; the plan itself is generated with acall_llm.
+    """
+    farmer_input = _irrigation_farmer_input(farmer_input, location, crop, sowing_date, area)
+    chosen_model = model_name if model_name else MODEL_NAME
+
+    inputs = await asyncio.to_thread(
+        _irrigation_inputs,
+        farmer_input, chosen_model, soil_report, water_report, weather_report, growth_stages,
+        session_state, latitude, longitude, run_id,
+    )
+    system_prompt, user_message = _irrigation_request(farmer_input, inputs, custom_prompt)
+
+    try:
+        text = await acall_llm(
+            model=chosen_model,
+            system_prompt=system_prompt,
+            user_message=user_message,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            agent="irrigation",
+            response_schema=output_schema("irrigation"),
+        )
+        return await asyncio.to_thread(
+            _save_irrigation_result, text, farmer_input, inputs, chosen_model, system_prompt, save_to_db, run_id
+        )
+    except Exception as e:
+        return f"Error calling Irrigation Agent: {e}"
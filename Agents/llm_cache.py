@@ -0,0 +1,189 @@
+"""
+Content-addressed cache for LLM responses, used by call_llm / acall_llm.
+
+Responses are keyed by a hash of (model, system_prompt, user_message,
+temperature, max_tokens). Lookups go to an in-process LRU first and then to
+the `llm_cache` table; writes go to both. Entries expire per agent (TTL), the
+LRU is bounded by entry count and the table is pruned to a maximum row count.
+
+A farmer asking for a fresh answer should skip reads (the new response is
+still stored): pass bypass_cache=True to call_llm, or wrap the work in
+`with fresh_answers():`.
+"""
+
+import os
+import time
+import json
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timezone
+from typing import Optional
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_DB_MAX_ROWS = int(os.getenv("LLM_CACHE_DB_MAX_ROWS", "5000"))
+# Prune the DB tier once every N writes instead of on every write
+LLM_CACHE_PRUNE_EVERY = 50
+
+# Seconds a cached response stays valid, per agent. Mirrors the freshness
+# windows of get_latest_* in backend/data_store.py. Override with
+# LLM_CACHE_TTL_<AGENT>, e.g. LLM_CACHE_TTL_SOIL=3600.
+AGENT_TTL_SECONDS = {
+    "soil": 24 * 3600,
+    "water": 24 * 3600,
+    "weather": 6 * 3600,
+    "stage": 48 * 3600,
+    "nutrient": 24 * 3600,
+    "pest": 24 * 3600,
+    "disease": 24 * 3600,
+    "irrigation": 24 * 3600,
+    "merge": 24 * 3600,
+}
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+_lru = OrderedDict()  # key -> (stored_at, text, model)
+_lock = threading.Lock()
+_stats = {"hits": 0, "db_hits": 0, "misses": 0, "bypassed": 0, "writes": 0, "evictions": 0}
+_writes_since_prune = 0
+
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+def cache_key(model: str, system_prompt: str, user_message: str, temperature: float, max_tokens: int) -> str:
+    payload = json.dumps(
+        [model, system_prompt, user_message, float(temperature), int(max_tokens)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def ttl_for(agent: Optional[str]) -> int:
+    if agent:
+        env_value = os.getenv(f"LLM_CACHE_TTL_{agent.upper()}")
+        if env_value:
+            try:
+                return int(env_value)
+            except ValueError:
+                pass
+    return AGENT_TTL_SECONDS.get(agent, DEFAULT_TTL_SECONDS)
+
+
+@contextmanager
+def fresh_answers(enabled: bool = True):
+    """Skip cache reads for every call_llm made inside this block (this thread/task)."""
+    token = _bypass.set(bool(enabled))
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def is_bypassed(bypass_cache: bool = False) -> bool:
+    return bool(bypass_cache) or _bypass.get()
+
+
+def _count(name: str, n: int = 1):
+    with _lock:
+        _stats[name] += n
+
+
+def lookup(key: str, agent: Optional[str] = None, bypass_cache: bool = False) -> Optional[tuple]:
+    """Return (text, model that answered) for key, or None on miss/expiry/bypass."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    if is_bypassed(bypass_cache):
+        _count("bypassed")
+        return None
+
+    ttl = ttl_for(agent)
+    now = time.time()
+    with _lock:
+        entry = _lru.get(key)
+        if entry is not None:
+            stored_at, text, model = entry
+            if now - stored_at <= ttl:
+                _lru.move_to_end(key)
+                _stats["hits"] += 1
+                return text, model
+            del _lru[key]
+
+    try:
+        from backend.init_db import SessionLocal
+        from backend.data_store import get_llm_cache
+
+        with SessionLocal() as session:
+            row = get_llm_cache(session, key, max_age_seconds=ttl)
+            if row is not None and row.output is not None:
+                # keep the row's age so a nearly expired row is not given a fresh TTL
+                stored_at = None
+                if row.created_at is not None:
+                    stored_at = row.created_at.replace(tzinfo=timezone.utc).timestamp()
+                _remember(key, row.output, row.model_name, stored_at)
+                _count("db_hits")
+                return row.output, row.model_name
+    except Exception as ex:
+        print(f"[llm_cache] Warning: DB lookup failed: {ex}")
+
+    _count("misses")
+    return None
+
+
+def _remember(key: str, text: str, model: Optional[str] = None, stored_at: Optional[float] = None):
+    with _lock:
+        _lru[key] = (stored_at if stored_at is not None else time.time(), str(text), model)
+        _lru.move_to_end(key)
+        while len(_lru) > LLM_CACHE_MAX_ENTRIES:
+            _lru.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def store(key: str, text: str, agent: Optional[str] = None, model: Optional[str] = None):
+    """Write a response to both tiers. Empty responses are not cached."""
+    global _writes_since_prune
+    if not LLM_CACHE_ENABLED or not text:
+        return
+    _remember(key, text, model)
+    _count("writes")
+
+    with _lock:
+        _writes_since_prune += 1
+        prune = _writes_since_prune >= LLM_CACHE_PRUNE_EVERY
+        if prune:
+            _writes_since_prune = 0
+
+    try:
+        from backend.init_db import SessionLocal
+        from backend.data_store import save_llm_cache, prune_llm_cache
+
+        with SessionLocal() as session:
+            save_llm_cache(session, key, agent_id=agent, model_name=model, output=str(text))
+            if prune:
+                deleted = prune_llm_cache(session, LLM_CACHE_DB_MAX_ROWS)
+                if deleted:
+                    _count("evictions", deleted)
+    except Exception as ex:
+        print(f"[llm_cache] Warning: Could not save to DB: {ex}")
+
+
+def stats() -> dict:
+    """Hit/miss counters plus current LRU size; hit_rate counts both tiers."""
+    with _lock:
+        out = dict(_stats)
+        out["lru_size"] = len(_lru)
+    lookups = out["hits"] + out["db_hits"] + out["misses"]
+    out["hit_rate"] = round((out["hits"] + out["db_hits"]) / lookups, 3) if lookups else 0.0
+    return out
+
+
+def clear(reset_stats: bool = True):
+    """Drop the in-process tier (the DB tier is pruned via clear_old_cache/prune_llm_cache)."""
+    global _writes_since_prune
+    with _lock:
+        _lru.clear()
+        _writes_since_prune = 0
+        if reset_stats:
+            for name in _stats:
+                _stats[name] = 0
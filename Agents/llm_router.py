@@ -1,8 +1,1187 @@
 import os
+import json
+import time
+import random
+import atexit
+import asyncio
+import threading
+import contextvars
+import functools
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, TimeoutError as FuturesTimeout
 from typing import Optional
 from dotenv import load_dotenv, find_dotenv
+import llm_cache
+import fake_llm
+import schemas
 load_dotenv(find_dotenv(), override=True)
 
+# Max pooled HTTP connections per provider client. Override with LLM_POOL_SIZE
+# or configure_clients(pool_size=...).
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+
+# Default number of concurrent calls per provider for fan-out loops (e.g. per-stage
+# pest/disease calls). Override with LLM_FANOUT_<PROVIDER>, e.g. LLM_FANOUT_TOGETHER=2.
+FANOUT_CONCURRENCY = {
+    "together": 4,
+    "openai": 8,
+    "anthropic": 4,
+    "gemini": 4,
+    "fake": 8,
+}
+
+
+def provider_for_model(model: str) -> str:
+    """Return the provider name call_llm would route this model string to.
+    For a fallback chain ("a|b|c") this is the provider of the first model."""
+    m = (model or "").split("|")[0].strip()
+    if m == "fake" or m.startswith("fake:"):
+        return "fake"
+    if m.startswith("gpt-"):
+        return "openai"
+    if m.startswith("claude-"):
+        return "anthropic"
+    if m.startswith("gemini-"):
+        return "gemini"
+    return "together"
+
+
+def fanout_concurrency(model: str, max_concurrency: Optional[int] = None) -> int:
+    """Resolve how many parallel calls a fan-out loop may issue for this model."""
+    if max_concurrency is not None:
+        return max(1, int(max_concurrency))
+    provider = provider_for_model(model)
+    env_value = os.getenv(f"LLM_FANOUT_{provider.upper()}")
+    if env_value:
+        try:
+            return max(1, int(env_value))
+        except ValueError:
+            pass
+    return FANOUT_CONCURRENCY.get(provider, 1)
+
+# ---------------------------------------------------------------------------
+# Call policy: timeouts, retries with backoff, hedged requests.
+# Per provider; override with LLM_CONNECT_TIMEOUT_<PROVIDER>,
+# LLM_TIMEOUT_<PROVIDER> (read timeout), LLM_RETRIES_<PROVIDER> and
+# LLM_HEDGE_<PROVIDER> ("auto" = recorded p95, a number of seconds, or "off"),
+# or call configure_llm_policy().
+# ---------------------------------------------------------------------------
+LLM_POLICIES = {
+    "together": {"connect_timeout": 5.0, "read_timeout": 90.0, "max_retries": 2,
+                 "backoff_base": 0.5, "backoff_max": 8.0, "hedge_after": None},
+    "openai": {"connect_timeout": 5.0, "read_timeout": 90.0, "max_retries": 2,
+               "backoff_base": 0.5, "backoff_max": 8.0, "hedge_after": None},
+    "anthropic": {"connect_timeout": 5.0, "read_timeout": 120.0, "max_retries": 2,
+                  "backoff_base": 1.0, "backoff_max": 16.0, "hedge_after": None},
+    "gemini": {"connect_timeout": 5.0, "read_timeout": 90.0, "max_retries": 2,
+               "backoff_base": 0.5, "backoff_max": 8.0, "hedge_after": None},
+    "fake": {"connect_timeout": 5.0, "read_timeout": 90.0, "max_retries": 2,
+             "backoff_base": 0.5, "backoff_max": 8.0, "hedge_after": None},
+}
+# "auto" hedging needs this many successful samples before it kicks in
+HEDGE_MIN_SAMPLES = 20
+_LATENCY_WINDOW = 200
+
+_metrics_lock = threading.Lock()
+_latencies = {}  # provider -> deque of successful attempt latencies (s)
+_attempts = deque(maxlen=500)  # recent attempts, newest last
+_counters = {}  # provider -> {'attempts', 'errors', 'retries', 'hedges', 'hedge_wins'}
+
+_RETRYABLE_NAMES = (
+    "timeout", "connection", "ratelimit", "overloaded", "serviceunavailable",
+    "internalserver", "deadlineexceeded", "resourceexhausted",
+)
+
+
+def _env_number(name: str, cast):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        return None
+
+
+def llm_policy(provider: str) -> dict:
+    """Effective call policy for a provider (defaults merged with env overrides)."""
+    policy = dict(LLM_POLICIES.get(provider, LLM_POLICIES["together"]))
+    name = provider.upper()
+    connect = _env_number(f"LLM_CONNECT_TIMEOUT_{name}", float)
+    read = _env_number(f"LLM_TIMEOUT_{name}", float)
+    retries = _env_number(f"LLM_RETRIES_{name}", int)
+    if connect is not None:
+        policy["connect_timeout"] = connect
+    if read is not None:
+        policy["read_timeout"] = read
+    if retries is not None:
+        policy["max_retries"] = max(0, retries)
+    hedge = os.getenv(f"LLM_HEDGE_{name}")
+    if hedge:
+        hedge = hedge.strip().lower()
+        if hedge in ("off", "0", "none", "false"):
+            policy["hedge_after"] = None
+        elif hedge == "auto":
+            policy["hedge_after"] = "auto"
+        else:
+            policy["hedge_after"] = _env_number(f"LLM_HEDGE_{name}", float)
+    return policy
+
+
+def configure_llm_policy(provider: str, **overrides):
+    """Update a provider's policy. Clients are recreated so new timeouts apply."""
+    LLM_POLICIES.setdefault(provider, dict(LLM_POLICIES["together"])).update(overrides)
+    close_clients()
+
+
+def _percentile(values, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _hedge_threshold(provider: str, policy: dict) -> Optional[float]:
+    hedge_after = policy.get("hedge_after")
+    if hedge_after == "auto":
+        with _metrics_lock:
+            samples = list(_latencies.get(provider, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return _percentile(samples, 95)
+    return hedge_after or None
+
+
+def _count(provider: str, name: str):
+    with _metrics_lock:
+        counters = _counters.setdefault(
+            provider, {"attempts": 0, "errors": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "queued": 0}
+        )
+        counters[name] += 1
+
+
+def _record_attempt(provider, model, attempt, hedged, seconds, error=None):
+    with _metrics_lock:
+        if error is None:
+            _latencies.setdefault(provider, deque(maxlen=_LATENCY_WINDOW)).append(seconds)
+        _attempts.append({
+            "provider": provider,
+            "model": model,
+            "attempt": attempt,
+            "hedged": hedged,
+            "seconds": round(seconds, 3),
+            "error": None if error is None else f"{type(error).__name__}: {error}",
+            "at": time.time(),
+        })
+    _count(provider, "attempts")
+    if error is not None:
+        _count(provider, "errors")
+
+
+def llm_metrics() -> dict:
+    """Per-provider attempt counters, latency and rate-limit queue-wait
+    percentiles, breaker states and recent attempts."""
+    with _metrics_lock:
+        latencies = {p: list(v) for p, v in _latencies.items()}
+        counters = {p: dict(v) for p, v in _counters.items()}
+        waits = {p: list(v) for p, v in _queue_waits.items()}
+        ttfb = {p: list(v) for p, v in _ttfb.items()}
+        recent = list(_attempts)[-50:]
+    providers = {}
+    for provider in set(latencies) | set(counters):
+        samples = latencies.get(provider, [])
+        queued = waits.get(provider, [])
+        providers[provider] = {
+            **counters.get(provider, {}),
+            "p50": _percentile(samples, 50),
+            "p95": _percentile(samples, 95),
+            "p99": _percentile(samples, 99),
+            "samples": len(samples),
+            "queue_wait_p50": _percentile(queued, 50),
+            "queue_wait_p95": _percentile(queued, 95),
+            "queue_wait_total": round(sum(queued), 3),
+            "ttfb_p50": _percentile(ttfb.get(provider, []), 50),
+            "ttfb_p95": _percentile(ttfb.get(provider, []), 95),
+        }
+    return {"providers": providers, "circuits": circuit_state(), "recent_attempts": recent}
+
+
+def _status_code(exc):
+    for candidate in (exc, getattr(exc, "response", None)):
+        for attr in ("status_code", "code"):
+            value = getattr(candidate, attr, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def _is_retryable(exc) -> bool:
+    status = _status_code(exc)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    name = type(exc).__name__.lower()
+    return any(token in name for token in _RETRYABLE_NAMES)
+
+
+def _backoff_delay(policy: dict, attempt: int, exc=None) -> float:
+    """Full-jitter exponential backoff; honours Retry-After when the provider sends it."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after"))
+    except (TypeError, ValueError, AttributeError):
+        retry_after = None
+    if retry_after is not None:
+        return min(retry_after, policy["backoff_max"])
+    ceiling = min(policy["backoff_max"], policy["backoff_base"] * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+# ---------------------------------------------------------------------------
+# Rate limiting: a requests-per-minute and a tokens-per-minute token bucket
+# per (provider, API key), shared by threads and asyncio tasks. Callers queue
+# (sleep until their reservation is due) rather than being rejected.
+# Override with LLM_RPM_<PROVIDER> / LLM_TPM_<PROVIDER>; 0 disables a bucket.
+# ---------------------------------------------------------------------------
+RATE_LIMITS = {
+    "together": {"rpm": 600, "tpm": 0},
+    "openai": {"rpm": 500, "tpm": 200000},
+    "anthropic": {"rpm": 50, "tpm": 40000},
+    "gemini": {"rpm": 360, "tpm": 0},
+    # unlimited unless LLM_RPM_FAKE / LLM_TPM_FAKE simulate a provider quota
+    "fake": {"rpm": 0, "tpm": 0},
+}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_queue_waits = {}  # provider -> deque of seconds spent queued (only calls that waited)
+_ttfb = {}  # provider -> deque of time-to-first-chunk for streamed calls
+
+
+@functools.lru_cache(maxsize=32)
+def _encoding(model_name: str):
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except Exception:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def estimate_tokens(text: str, model_name: str = "") -> int:
+    """Token count via tiktoken, falling back to ~4 characters per token."""
+    if not text:
+        return 0
+    try:
+        return len(_encoding((model_name or "").strip()).encode(text))
+    except Exception:
+        # Rough fallback: ~4 chars per token
+        return max(1, int(len(text) / 4))
+
+
+class _TokenBucket:
+    """Reservation-style bucket: the level may go negative, which is the queue."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take amount now; return how long the caller must wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= min(amount, self.capacity)
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+
+def rate_limits(provider: str) -> dict:
+    limits = dict(RATE_LIMITS.get(provider, {"rpm": 0, "tpm": 0}))
+    for name in ("rpm", "tpm"):
+        value = _env_number(f"LLM_{name.upper()}_{provider.upper()}", float)
+        if value is not None:
+            limits[name] = value
+    return limits
+
+
+def configure_rate_limits(provider: str, rpm: Optional[float] = None, tpm: Optional[float] = None):
+    """Change a provider's limits; buckets are rebuilt on next use."""
+    limits = RATE_LIMITS.setdefault(provider, {"rpm": 0, "tpm": 0})
+    if rpm is not None:
+        limits["rpm"] = rpm
+    if tpm is not None:
+        limits["tpm"] = tpm
+    with _limiters_lock:
+        for key in [k for k in _limiters if k[0] == provider]:
+            del _limiters[key]
+
+
+def _limiter(provider: str):
+    key = (provider, _resolve_api_key(provider))
+    buckets = _limiters.get(key)
+    if buckets is None:
+        with _limiters_lock:
+            buckets = _limiters.get(key)
+            if buckets is None:
+                limits = rate_limits(provider)
+                buckets = {
+                    name: _TokenBucket(limits[name])
+                    for name in ("rpm", "tpm")
+                    if limits.get(name)
+                }
+                _limiters[key] = buckets
+    return buckets
+
+
+def _reserve(provider: str, tokens: int) -> float:
+    buckets = _limiter(provider)
+    wait_rpm = buckets["rpm"].reserve(1) if "rpm" in buckets else 0.0
+    wait_tpm = buckets["tpm"].reserve(tokens) if "tpm" in buckets and tokens else 0.0
+    return max(wait_rpm, wait_tpm)
+
+
+def _record_queue_wait(provider: str, seconds: float):
+    with _metrics_lock:
+        _queue_waits.setdefault(provider, deque(maxlen=_LATENCY_WINDOW)).append(seconds)
+    _count(provider, "queued")
+
+
+def _throttle(provider: str, tokens: int):
+    delay = _reserve(provider, tokens)
+    if delay > 0:
+        _record_queue_wait(provider, delay)
+        time.sleep(delay)
+
+
+def _request_tokens(m: str, system_prompt: str, user_message: str, max_tokens: int) -> int:
+    """Budget charged to the TPM bucket: prompt estimate plus the completion cap."""
+    return estimate_tokens(system_prompt, m) + estimate_tokens(user_message, m) + int(max_tokens or 0)
+
+
+async def _athrottle(provider: str, tokens: int):
+    delay = _reserve(provider, tokens)
+    if delay > 0:
+        _record_queue_wait(provider, delay)
+        await asyncio.sleep(delay)
+
+
+# ---------------------------------------------------------------------------
+# Fallback chains and circuit breakers.
+# A model string may list fallbacks: "Qwen/Qwen2.5-72B-Instruct-Turbo|gpt-4.1-mini".
+# LLM_FALLBACK_MODELS (same "a|b" format) is appended to single-model strings.
+# A provider's breaker opens after LLM_BREAKER_FAILURES consecutive failed
+# (timeouts, 429, 5xx) or slow (> LLM_BREAKER_SLOW_SECONDS) calls, skips it for LLM_BREAKER_COOLDOWN
+# seconds, then lets one probe through (half-open).
+# ---------------------------------------------------------------------------
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+BREAKER_SLOW_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_SECONDS", "60"))
+
+
+class LLMResult(str):
+    """
+    Text returned by call_llm, annotated with the model/provider that answered.
+    For structured calls (response_schema=...) .data holds the parsed answer.
+    """
+
+    def __new__(cls, text, model: Optional[str] = None, provider: Optional[str] = None, data=None):
+        obj = super().__new__(cls, text)
+        obj.model = model
+        obj.provider = provider
+        obj.data = data
+        return obj
+
+
+def answered_model(results, default: Optional[str] = None) -> Optional[str]:
+    """Model name(s) that produced these call_llm results, for the model_name column."""
+    models = []
+    for result in results:
+        model = getattr(result, "model", None)
+        if model and model not in models:
+            models.append(model)
+    return ", ".join(models) if models else default
+
+
+def model_chain(model: str) -> list:
+    """Split a model string into its ordered fallback chain."""
+    chain = [part.strip() for part in (model or "").split("|") if part.strip()]
+    if len(chain) == 1:
+        extra = os.getenv("LLM_FALLBACK_MODELS", "")
+        chain += [part.strip() for part in extra.split("|") if part.strip()]
+    deduped = []
+    for m in chain:
+        if m not in deduped:
+            deduped.append(m)
+    return deduped
+
+
+class _CircuitBreaker:
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < BREAKER_COOLDOWN:
+                    return False
+                self.state = "half_open"
+                self.probing = False
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def record(self, ok: bool, seconds: float):
+        slow = seconds > BREAKER_SLOW_SECONDS
+        with self.lock:
+            if ok and not slow:
+                self.state = "closed"
+                self.failures = 0
+                self.probing = False
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= BREAKER_FAILURES:
+                if self.state != "open":
+                    print(f"[call_llm] circuit open for {self.provider} ({self.failures} failed/slow calls)")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def release(self):
+        """End a call that says nothing about provider health (e.g. a 400)."""
+        with self.lock:
+            self.probing = False
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+_breakers = {}
+
+
+def _breaker(provider: str) -> _CircuitBreaker:
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        with _metrics_lock:
+            breaker = _breakers.setdefault(provider, _CircuitBreaker(provider))
+    return breaker
+
+
+def circuit_state() -> dict:
+    """Current breaker state per provider."""
+    return {provider: breaker.snapshot() for provider, breaker in list(_breakers.items())}
+
+
+def _chain_error(chain, errors, last_error):
+    if len(chain) == 1 and last_error is not None:
+        return last_error
+    return RuntimeError("All models in fallback chain failed: " + "; ".join(errors))
+
+
+# ---------------------------------------------------------------------------
+# Client registry: one client per (provider, api key), created lazily and
+# shared across calls and threads so HTTP keep-alive / TLS sessions are reused.
+# ---------------------------------------------------------------------------
+_clients = {}
+_clients_lock = threading.Lock()
+_api_keys = {}
+
+_API_KEY_ENV = {
+    "openai": ("OPENAI_API_KEY",),
+    "anthropic": ("ANTHROPIC_API_KEY",),
+    "gemini": ("GEMINI_API_KEY", "GOOGLE_API_KEY"),
+    "together": ("TOGETHER_API_KEY",),
+}
+
+
+def _resolve_api_key(provider: str) -> Optional[str]:
+    """
+    Read the provider's API key from the environment once and remember it.
+    A missing key is not remembered, so a key set later is picked up.
+    """
+    if provider in _api_keys:
+        return _api_keys[provider]
+    key = None
+    for env_name in _API_KEY_ENV.get(provider, ()):
+        key = os.getenv(env_name)
+        if key:
+            break
+    if key:
+        key = key.strip().strip('"').strip("'")
+    if not key:
+        return None
+    _api_keys[provider] = key
+    return key
+
+
+def _http_limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=LLM_POOL_SIZE,
+        max_keepalive_connections=LLM_POOL_SIZE,
+    )
+
+
+def _http_timeout(provider: str):
+    import httpx
+
+    policy = llm_policy(provider)
+    return httpx.Timeout(policy["read_timeout"], connect=policy["connect_timeout"])
+
+
+def _http_client(provider: str):
+    import httpx
+
+    return httpx.Client(limits=_http_limits(), timeout=_http_timeout(provider))
+
+
+def _async_http_client(provider: str):
+    import httpx
+
+    return httpx.AsyncClient(limits=_http_limits(), timeout=_http_timeout(provider))
+
+
+class _GeminiClient:
+    """google-generativeai is configured globally; cache GenerativeModel objects."""
+
+    _MAX_MODELS = 64
+
+    def __init__(self, genai, api_key: str):
+        self.genai = genai
+        genai.configure(api_key=api_key)
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def model(self, model_name: str, system_prompt: Optional[str]):
+        key = (model_name, system_prompt)
+        with self._lock:
+            gm = self._models.get(key)
+            if gm is None:
+                if len(self._models) >= self._MAX_MODELS:
+                    self._models.clear()
+                if system_prompt is None:
+                    gm = self.genai.GenerativeModel(model_name=model_name)
+                else:
+                    gm = self.genai.GenerativeModel(model_name=model_name, system_instruction=system_prompt)
+                self._models[key] = gm
+            return gm
+
+
+def _create_client(provider: str, api_key: Optional[str]):
+    # SDK-level retries are disabled; _call_with_policy owns retry/backoff
+    if provider == "openai":
+        from openai import OpenAI
+
+        return OpenAI(
+            api_key=api_key,
+            http_client=_http_client(provider),
+            timeout=_http_timeout(provider),
+            max_retries=0,
+        )
+
+    if provider == "anthropic":
+        try:
+            import anthropic
+        except Exception as e:
+            raise RuntimeError("Missing dependency 'anthropic'. Install it to use Claude models.") from e
+        return anthropic.Anthropic(
+            api_key=api_key,
+            http_client=_http_client(provider),
+            timeout=_http_timeout(provider),
+            max_retries=0,
+        )
+
+    if provider == "gemini":
+        try:
+            import google.generativeai as genai
+        except Exception as e:
+            raise RuntimeError(
+                "Missing dependency 'google-generativeai'. Install it to use Gemini models."
+            ) from e
+        return _GeminiClient(genai, api_key)
+
+    from together import Together
+
+    policy = llm_policy(provider)
+    http_client = _http_client(provider)
+    try:
+        return Together(
+            api_key=api_key,
+            http_client=http_client,
+            timeout=policy["read_timeout"],
+            max_retries=0,
+        )
+    except TypeError:
+        # Older SDK versions manage their own HTTP session
+        http_client.close()
+        return Together(api_key=api_key)
+
+
+def get_client(provider: str, api_key: Optional[str] = None):
+    """Return the shared client for (provider, api key), creating it on first use."""
+    key = api_key or _resolve_api_key(provider)
+    if not key:
+        missing = {
+            "openai": "OPENAI_API_KEY not set in environment",
+            "anthropic": "ANTHROPIC_API_KEY not set in environment",
+            "gemini": "GEMINI_API_KEY (or GOOGLE_API_KEY) not set in environment",
+        }
+        if provider in missing:
+            raise RuntimeError(missing[provider])
+    cache_key = (provider, key)
+    client = _clients.get(cache_key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            client = _create_client(provider, key)
+            _clients[cache_key] = client
+        return client
+
+
+def close_clients():
+    """Close every pooled client and forget cached API keys (safe to call repeatedly)."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        _api_keys.clear()
+    for client in clients:
+        close = getattr(client, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+
+
+def configure_clients(pool_size: Optional[int] = None):
+    """Change the connection pool size; existing clients are closed and recreated lazily."""
+    global LLM_POOL_SIZE
+    if pool_size is not None:
+        LLM_POOL_SIZE = max(1, int(pool_size))
+    close_clients()
+
+
+atexit.register(close_clients)
+
+
+# Async clients are bound to the event loop that created them, so the
+# registry key includes the running loop.
+_async_clients = {}
+
+
+def _create_async_client(provider: str, api_key: Optional[str]):
+    if provider == "openai":
+        from openai import AsyncOpenAI
+
+        return AsyncOpenAI(
+            api_key=api_key,
+            http_client=_async_http_client(provider),
+            timeout=_http_timeout(provider),
+            max_retries=0,
+        )
+
+    if provider == "anthropic":
+        try:
+            import anthropic
+        except Exception as e:
+            raise RuntimeError("Missing dependency 'anthropic'. Install it to use Claude models.") from e
+        return anthropic.AsyncAnthropic(
+            api_key=api_key,
+            http_client=_async_http_client(provider),
+            timeout=_http_timeout(provider),
+            max_retries=0,
+        )
+
+    from together import AsyncTogether
+
+    policy = llm_policy(provider)
+    try:
+        return AsyncTogether(
+            api_key=api_key,
+            http_client=_async_http_client(provider),
+            timeout=policy["read_timeout"],
+            max_retries=0,
+        )
+    except TypeError:
+        return AsyncTogether(api_key=api_key)
+
+
+def get_async_client(provider: str, api_key: Optional[str] = None):
+    """Async counterpart of get_client; one client per (provider, api key, event loop)."""
+    key = api_key or _resolve_api_key(provider)
+    if provider != "together" and not key:
+        get_client(provider, api_key)  # raises the same missing-key error
+    if provider == "gemini":
+        # GenerativeModel exposes generate_content_async, so the sync client is
+        # shared; get_client takes _clients_lock itself, so call it unlocked
+        return get_client("gemini", key)
+    cache_key = (provider, key, id(asyncio.get_running_loop()))
+    client = _async_clients.get(cache_key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _async_clients.get(cache_key)
+        if client is None:
+            client = _create_async_client(provider, key)
+            _async_clients[cache_key] = client
+        return client
+
+
+async def aclose_clients():
+    """Close async clients created on the current event loop."""
+    loop_id = id(asyncio.get_running_loop())
+    with _clients_lock:
+        keys = [k for k in _async_clients if k[2] == loop_id]
+        clients = [_async_clients.pop(k) for k in keys]
+    for client in clients:
+        close = getattr(client, "close", None)
+        if not callable(close) or isinstance(client, _GeminiClient):
+            continue
+        try:
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Provider calls
+# ---------------------------------------------------------------------------
+def _chat_messages(system_prompt: str, user_message: str):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_message},
+    ]
+
+
+def _response_format(provider: str, response_schema: Optional[dict]) -> dict:
+    """Extra create() kwargs for the provider's JSON mode (OpenAI-style APIs)."""
+    if not response_schema:
+        return {}
+    schema = {k: v for k, v in response_schema.items() if not k.startswith("x-")}
+    if provider == "openai":
+        return {"response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": response_schema.get("title", "answer"), "schema": schema},
+        }}
+    if provider == "together":
+        return {"response_format": {"type": "json_object", "schema": schema}}
+    return {}
+
+
+def _gemini_config(temperature, max_tokens, response_schema=None) -> dict:
+    config = {
+        "temperature": temperature,
+        "max_output_tokens": max_tokens,
+    }
+    if response_schema:
+        # Gemini's response_schema is an OpenAPI subset; JSON mode plus the prompt instruction is enough
+        config["response_mime_type"] = "application/json"
+    return config
+
+
+def _call_openai(m, system_prompt, user_message, temperature, max_tokens, response_schema=None):
+    client = get_client("openai")
+    resp = client.chat.completions.create(
+        model=m,
+        messages=_chat_messages(system_prompt, user_message),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        **_response_format("openai", response_schema),
+    )
+    return (resp.choices[0].message.content or "").strip()
+
+
+def _anthropic_text(msg) -> str:
+    # msg.content is a list of content blocks
+    parts = []
+    for block in getattr(msg, "content", []) or []:
+        text = getattr(block, "text", None)
+        if text:
+            parts.append(text)
+    return ("".join(parts)).strip()
+
+
+def _call_anthropic(m, system_prompt, user_message, temperature, max_tokens, response_schema=None):
+    # no JSON mode; the schema instruction is in the system prompt
+    client = get_client("anthropic")
+    msg = client.messages.create(
+        model=m,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        system=system_prompt,
+        messages=[{"role": "user", "content": user_message}],
+    )
+    return _anthropic_text(msg)
+
+
+def _call_gemini(m, system_prompt, user_message, temperature, max_tokens, response_schema=None):
+    client = get_client("gemini")
+    generation_config = _gemini_config(temperature, max_tokens, response_schema)
+    try:
+        gm = client.model(m, system_prompt)
+        resp = gm.generate_content(
+            user_message,
+            generation_config=generation_config,
+            request_options={"timeout": llm_policy("gemini")["read_timeout"]},
+        )
+    except TypeError:
+        # Older SDK versions may not support system_instruction
+        gm = client.model(m, None)
+        resp = gm.generate_content(
+            f"SYSTEM:\n{system_prompt}\n\nUSER:\n{user_message}",
+            generation_config=generation_config,
+        )
+    return (getattr(resp, "text", None) or "").strip()
+
+
+def _call_together(m, system_prompt, user_message, temperature, max_tokens, response_schema=None):
+    client = get_client("together")
+    resp = client.chat.completions.create(
+        model=m,
+        messages=_chat_messages(system_prompt, user_message),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        **_response_format("together", response_schema),
+    )
+    return (resp.choices[0].message.content or "").strip()
+
+
+def _call_fake(m, system_prompt, user_message, temperature, max_tokens, response_schema=None):
+    # offline canned answers (see fake_llm, which answers in JSON when the schema
+    # instruction is in the prompt); the read timeout is simulated
+    return fake_llm.complete(
+        m, system_prompt, user_message, temperature, max_tokens,
+        timeout=llm_policy("fake")["read_timeout"],
+    )
+
+
+_PROVIDER_CALLS = {
+    "openai": _call_openai,
+    "anthropic": _call_anthropic,
+    "gemini": _call_gemini,
+    "together": _call_together,
+    "fake": _call_fake,
+}
+
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=max(4, LLM_POOL_SIZE * 2), thread_name_prefix="llm-hedge")
+    return _hedge_pool
+
+
+def _timed_attempt(provider, m, fn, attempt, hedged, tokens=0, throttle=True):
+    # queueing for the rate limiter is not part of the attempt's latency
+    if throttle:
+        _throttle(provider, tokens)
+    start = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as e:
+        _record_attempt(provider, m, attempt, hedged, time.perf_counter() - start, e)
+        raise
+    _record_attempt(provider, m, attempt, hedged, time.perf_counter() - start)
+    return result
+
+
+def _hedged_attempt(provider, m, fn, attempt, hedge_after, tokens=0):
+    """One logical attempt; if it is slower than hedge_after, race a duplicate."""
+    if not hedge_after:
+        return _timed_attempt(provider, m, fn, attempt, False, tokens)
+    # take the primary's rate-limit token before the hedge timer starts, so a
+    # call queued behind a saturated bucket is not hedged; the backup queues on its own
+    _throttle(provider, tokens)
+    pool = _hedge_executor()
+    primary = pool.submit(contextvars.copy_context().run, _timed_attempt, provider, m, fn, attempt, False, tokens, False)
+    try:
+        return primary.result(timeout=hedge_after)
+    except FuturesTimeout:
+        pass
+    _count(provider, "hedges")
+    backup = pool.submit(contextvars.copy_context().run, _timed_attempt, provider, m, fn, attempt, True, tokens)
+    pending = {primary, backup}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None:
+                if fut is backup:
+                    _count(provider, "hedge_wins")
+                # the slower request keeps running in the pool; its result is dropped
+                return fut.result()
+            error = fut.exception()
+    raise error
+
+
+def _call_with_policy(provider: str, m: str, fn, tokens: int = 0):
+    """Run fn under the provider's rate limit and retry/backoff/hedge policy.
+    tokens is the estimated prompt + completion size charged to the TPM bucket."""
+    policy = llm_policy(provider)
+    retries = policy["max_retries"]
+    for attempt in range(retries + 1):
+        try:
+            return _hedged_attempt(provider, m, fn, attempt, _hedge_threshold(provider, policy), tokens)
+        except Exception as e:
+            if attempt >= retries or not _is_retryable(e):
+                raise
+            delay = _backoff_delay(policy, attempt, e)
+            _count(provider, "retries")
+            print(f"[call_llm] {provider} attempt {attempt + 1} failed ({type(e).__name__}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+# ---------------------------------------------------------------------------
+# Streaming
+# stream_llm() yields text chunks from each provider's streaming API. Inside
+# `with stream_to(callback):`, call_llm made from the same thread streams too,
+# forwarding callback(agent, chunk) while still returning the full text, so
+# agents stream without changes. Calls fanned out to worker threads (e.g.
+# per-stage pest/disease calls) are not streamed.
+# ---------------------------------------------------------------------------
+_stream_sink = contextvars.ContextVar("llm_stream_sink", default=None)
+
+
+@contextmanager
+def stream_to(callback):
+    """Forward chunks of call_llm output made from this thread to callback(agent, chunk)."""
+    token = _stream_sink.set((callback, threading.get_ident()))
+    try:
+        yield
+    finally:
+        _stream_sink.reset(token)
+
+
+def _active_sink():
+    entry = _stream_sink.get()
+    if entry is not None and entry[1] == threading.get_ident():
+        return entry[0]
+    return None
+
+
+def _emit(sink, agent, chunk):
+    try:
+        sink(agent, chunk)
+    except Exception as e:
+        print(f"[call_llm] Warning: stream callback failed: {e}")
+
+
+def _stream_openai(m, system_prompt, user_message, temperature, max_tokens):
+    client = get_client("openai")
+    stream = client.chat.completions.create(
+        model=m,
+        messages=_chat_messages(system_prompt, user_message),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+def _stream_anthropic(m, system_prompt, user_message, temperature, max_tokens):
+    client = get_client("anthropic")
+    with client.messages.stream(
+        model=m,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        system=system_prompt,
+        messages=[{"role": "user", "content": user_message}],
+    ) as stream:
+        for text in stream.text_stream:
+            if text:
+                yield text
+
+
+def _stream_gemini(m, system_prompt, user_message, temperature, max_tokens):
+    client = get_client("gemini")
+    gm = client.model(m, system_prompt)
+    resp = gm.generate_content(
+        user_message,
+        generation_config={"temperature": temperature, "max_output_tokens": max_tokens},
+        stream=True,
+        request_options={"timeout": llm_policy("gemini")["read_timeout"]},
+    )
+    for chunk in resp:
+        try:
+            text = chunk.text
+        except Exception:
+            # chunks without text parts (e.g. safety metadata) raise on .text
+            text = None
+        if text:
+            yield text
+
+
+def _stream_together(m, system_prompt, user_message, temperature, max_tokens):
+    client = get_client("together")
+    stream = client.chat.completions.create(
+        model=m,
+        messages=_chat_messages(system_prompt, user_message),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+def _stream_fake(m, system_prompt, user_message, temperature, max_tokens):
+    return fake_llm.stream(
+        m, system_prompt, user_message, temperature, max_tokens,
+        timeout=llm_policy("fake")["read_timeout"],
+    )
+
+
+_STREAM_CALLS = {
+    "openai": _stream_openai,
+    "anthropic": _stream_anthropic,
+    "gemini": _stream_gemini,
+    "together": _stream_together,
+    "fake": _stream_fake,
+}
+
+
+def _stream_chain(chain, system_prompt, user_message, temperature, max_tokens):
+    """Yield (model, chunk). Retries and fail-over only happen before the first chunk."""
+    errors = []
+    last_error = None
+    for m in chain:
+        provider = provider_for_model(m)
+        breaker = _breaker(provider)
+        if not breaker.allow():
+            errors.append(f"{m}: circuit open for {provider}")
+            continue
+        policy = llm_policy(provider)
+        tokens = _request_tokens(m, system_prompt, user_message, max_tokens)
+        stream = _STREAM_CALLS[provider]
+        for attempt in range(policy["max_retries"] + 1):
+            _throttle(provider, tokens)
+            start = time.perf_counter()
+            started = False
+            try:
+                for chunk in stream(m, system_prompt, user_message, temperature, max_tokens):
+                    if not started:
+                        started = True
+                        with _metrics_lock:
+                            _ttfb.setdefault(provider, deque(maxlen=_LATENCY_WINDOW)).append(time.perf_counter() - start)
+                    yield m, chunk
+            except Exception as e:
+                elapsed = time.perf_counter() - start
+                _record_attempt(provider, m, attempt, False, elapsed, e)
+                if started:
+                    # part of the answer is already out; nothing to fail over to
+                    breaker.record(False, elapsed)
+                    raise
+                if attempt < policy["max_retries"] and _is_retryable(e):
+                    _count(provider, "retries")
+                    time.sleep(_backoff_delay(policy, attempt, e))
+                    continue
+                if _is_retryable(e):
+                    breaker.record(False, elapsed)
+                else:
+                    breaker.release()
+                errors.append(f"{m}: {type(e).__name__}: {e}")
+                last_error = e
+                break
+            else:
+                elapsed = time.perf_counter() - start
+                _record_attempt(provider, m, attempt, False, elapsed)
+                breaker.record(True, elapsed)
+                return
+    raise _chain_error(chain, errors, last_error)
+
+
+def stream_llm(
+    *,
+    model: str,
+    system_prompt: str,
+    user_message: str,
+    temperature: float = 0.1,
+    max_tokens: int = 1200,
+    agent: Optional[str] = None,
+    bypass_cache: bool = False,
+):
+    """Generator version of call_llm: yields text chunks as the provider produces them.
+    A cache hit is yielded as a single chunk; the full answer is cached at the end."""
+    chain = model_chain(model)
+    if not chain:
+        raise ValueError("model is required")
+    key = llm_cache.cache_key("|".join(chain), system_prompt, user_message, temperature, max_tokens)
+    cached = llm_cache.lookup(key, agent=agent, bypass_cache=bypass_cache)
+    if cached is not None:
+        yield cached[0]
+        return
+    parts = []
+    answered = None
+    for answered, chunk in _stream_chain(chain, system_prompt, user_message, temperature, max_tokens):
+        parts.append(chunk)
+        yield chunk
+    llm_cache.store(key, "".join(parts).strip(), agent=agent, model=answered)
+
+
+def _call_streaming(sink, chain, key, system_prompt, user_message, temperature, max_tokens, agent):
+    parts = []
+    answered = chain[0]
+    for answered, chunk in _stream_chain(chain, system_prompt, user_message, temperature, max_tokens):
+        parts.append(chunk)
+        _emit(sink, agent, chunk)
+    result = LLMResult("".join(parts).strip(), answered, provider_for_model(answered))
+    llm_cache.store(key, result, agent=agent, model=answered)
+    return result
+
+
+def _result(text: str, model: str, response_schema: Optional[dict] = None, agent: Optional[str] = None) -> LLMResult:
+    """LLMResult for an answer; structured answers are repaired, parsed and rendered."""
+    provider = provider_for_model(model)
+    if not response_schema:
+        return LLMResult(text, model, provider)
+    data, fixes = schemas.repair(text, response_schema)
+    if data is None:
+        # not JSON at all: keep the text so the caller still has an answer
+        print(f"[call_llm] Warning: {agent or 'structured'} answer is not JSON; returning it as text")
+        return LLMResult(text, model, provider)
+    if agent and fixes:
+        print(f"[call_llm] {agent}: repaired structured answer ({len(fixes)} fixes)")
+    return LLMResult(schemas.render(data, response_schema), model, provider, data=data)
+
+
+def _cached_text(result: LLMResult) -> str:
+    # structured answers are cached as canonical JSON so a cache hit re-parses without repairs
+    if result.data is not None:
+        return json.dumps(result.data, ensure_ascii=False)
+    return result
+
+
 def call_llm(
     *,
     model: str,
@@ -10,6 +1189,9 @@ def call_llm(
     user_message: str,
     temperature: float = 0.1,
     max_tokens: int = 1200,
+    agent: Optional[str] = None,
+    bypass_cache: bool = False,
+    response_schema: Optional[dict] = None,
 ) -> str:
     """Route chat completion to the right provider based on model string.
 
@@ -18,105 +1200,275 @@ def call_llm(
     - OpenAI: models starting with 'gpt-'
     - Anthropic (Claude): models starting with 'claude-'
     - Gemini: models starting with 'gemini-'
+    - Fake: models starting with 'fake:' (offline canned answers with
+      simulated latency and errors, see fake_llm)
+
+    Provider clients come from a shared registry (see get_client), so
+    connections are reused across calls and threads.
+
+    Responses are cached by content (see llm_cache); `agent` selects the TTL
+    and bypass_cache=True forces a fresh answer (which is then cached).
+    Provider calls follow LLM_POLICIES: timeouts, retries with jittered
+    backoff on 429/5xx/timeouts, and optional hedged requests.
+
+    `model` may be a fallback chain ("a|b|c"); models whose provider circuit
+    is open are skipped. Returns an LLMResult whose .model is the model that
+    actually answered. Inside stream_to(...) the provider's streaming API is
+    used and chunks are forwarded as they arrive.
+
+    With response_schema (see schemas.AGENT_SCHEMAS) the model is asked for
+    JSON, in the provider's JSON mode where it has one, and the answer is
+    repaired locally in one pass (schemas.repair) rather than regenerated.
+    The result text is schemas.render() of the answer and .data the parsed
+    object. Structured calls are not streamed; the rendered text is sent to
+    the stream callback in one chunk.
     """
 
     if not model:
         raise ValueError("model is required")
 
-    m = model.strip()
-
-    # OpenAI
-    if m.startswith("gpt-"):
-        api_key = os.getenv("OPENAI_API_KEY")
-        print("---------------------------------------->",api_key)
-        if not api_key:
-            raise RuntimeError("OPENAI_API_KEY not set in environment")
-        api_key = api_key.strip().strip('"').strip("'")
-        from openai import OpenAI
+    chain = model_chain(model)
+    if not chain:
+        raise ValueError("model is required")
+    if response_schema:
+        system_prompt = system_prompt + schemas.schema_instruction(response_schema)
+    key = llm_cache.cache_key("|".join(chain), system_prompt, user_message, temperature, max_tokens)
+    cached = llm_cache.lookup(key, agent=agent, bypass_cache=bypass_cache)
+    sink = _active_sink()
+    if cached is not None:
+        text, answered = cached
+        result = _result(text, answered or chain[0], response_schema)
+        if sink is not None:
+            _emit(sink, agent, result)
+        return result
 
-        client = OpenAI(api_key=api_key)
-        resp = client.chat.completions.create(
-            model=m,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message},
-            ],
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-        return (resp.choices[0].message.content or "").strip()
+    if sink is not None and not response_schema:
+        return _call_streaming(sink, chain, key, system_prompt, user_message, temperature, max_tokens, agent)
 
-    # Anthropic (Claude)
-    if m.startswith("claude-"):
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise RuntimeError("ANTHROPIC_API_KEY not set in environment")
+    errors = []
+    last_error = None
+    for m in chain:
+        provider = provider_for_model(m)
+        breaker = _breaker(provider)
+        if not breaker.allow():
+            errors.append(f"{m}: circuit open for {provider}")
+            continue
+        call = _PROVIDER_CALLS[provider]
+        start = time.perf_counter()
         try:
-            import anthropic
+            text = _call_with_policy(
+                provider, m,
+                lambda call=call, m=m: call(m, system_prompt, user_message, temperature, max_tokens, response_schema),
+                tokens=_request_tokens(m, system_prompt, user_message, max_tokens),
+            )
         except Exception as e:
-            raise RuntimeError("Missing dependency 'anthropic'. Install it to use Claude models.") from e
+            if _is_retryable(e):
+                breaker.record(False, time.perf_counter() - start)
+            else:
+                breaker.release()
+            errors.append(f"{m}: {type(e).__name__}: {e}")
+            last_error = e
+            if len(chain) > 1:
+                print(f"[call_llm] {m} failed ({type(e).__name__}); trying next model in chain")
+            continue
+        breaker.record(True, time.perf_counter() - start)
+        result = _result(text, m, response_schema, agent)
+        llm_cache.store(key, _cached_text(result), agent=agent, model=m)
+        if sink is not None:
+            _emit(sink, agent, result)
+        return result
 
-        client = anthropic.Anthropic(api_key=api_key)
-        msg = client.messages.create(
-            model=m,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            system=system_prompt,
-            messages=[{"role": "user", "content": user_message}],
-        )
-        # msg.content is a list of content blocks
-        parts = []
-        for block in getattr(msg, "content", []) or []:
-            text = getattr(block, "text", None)
-            if text:
-                parts.append(text)
-        return ("".join(parts)).strip()
+    raise _chain_error(chain, errors, last_error)
 
-    # Gemini
-    if m.startswith("gemini-"):
-        api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise RuntimeError("GEMINI_API_KEY (or GOOGLE_API_KEY) not set in environment")
-        try:
-            import google.generativeai as genai
-        except Exception as e:
-            raise RuntimeError(
-                "Missing dependency 'google-generativeai'. Install it to use Gemini models."
-            ) from e
 
-        genai.configure(api_key=api_key)
-        try:
-            gm = genai.GenerativeModel(model_name=m, system_instruction=system_prompt)
-            resp = gm.generate_content(
-                user_message,
-                generation_config={
-                    "temperature": temperature,
-                    "max_output_tokens": max_tokens,
-                },
-            )
-        except TypeError:
-            # Older SDK versions may not support system_instruction
-            gm = genai.GenerativeModel(model_name=m)
-            resp = gm.generate_content(
-                f"SYSTEM:\n{system_prompt}\n\nUSER:\n{user_message}",
-                generation_config={
-                    "temperature": temperature,
-                    "max_output_tokens": max_tokens,
-                },
-            )
-        return (getattr(resp, "text", None) or "").strip()
+# ---------------------------------------------------------------------------
+# Async provider calls
+# ---------------------------------------------------------------------------
+async def _acall_openai(m, system_prompt, user_message, temperature, max_tokens, response_schema=None):
+    client = get_async_client("openai")
+    resp = await client.chat.completions.create(
+        model=m,
+        messages=_chat_messages(system_prompt, user_message),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        **_response_format("openai", response_schema),
+    )
+    return (resp.choices[0].message.content or "").strip()
 
-    # Together (default)
-    from together import Together
 
-    client = Together()
-    resp = client.chat.completions.create(
+async def _acall_anthropic(m, system_prompt, user_message, temperature, max_tokens, response_schema=None):
+    client = get_async_client("anthropic")
+    msg = await client.messages.create(
+        model=m,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        system=system_prompt,
+        messages=[{"role": "user", "content": user_message}],
+    )
+    return _anthropic_text(msg)
+
+
+async def _acall_gemini(m, system_prompt, user_message, temperature, max_tokens, response_schema=None):
+    client = get_async_client("gemini")
+    generation_config = _gemini_config(temperature, max_tokens, response_schema)
+    try:
+        gm = client.model(m, system_prompt)
+        resp = await gm.generate_content_async(
+            user_message,
+            generation_config=generation_config,
+            request_options={"timeout": llm_policy("gemini")["read_timeout"]},
+        )
+    except TypeError:
+        gm = client.model(m, None)
+        resp = await gm.generate_content_async(
+            f"SYSTEM:\n{system_prompt}\n\nUSER:\n{user_message}",
+            generation_config=generation_config,
+        )
+    return (getattr(resp, "text", None) or "").strip()
+
+
+async def _acall_together(m, system_prompt, user_message, temperature, max_tokens, response_schema=None):
+    client = get_async_client("together")
+    resp = await client.chat.completions.create(
         model=m,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message},
-        ],
+        messages=_chat_messages(system_prompt, user_message),
         temperature=temperature,
         max_tokens=max_tokens,
+        **_response_format("together", response_schema),
     )
     return (resp.choices[0].message.content or "").strip()
+
+
+async def _acall_fake(m, system_prompt, user_message, temperature, max_tokens, response_schema=None):
+    return await fake_llm.acomplete(
+        m, system_prompt, user_message, temperature, max_tokens,
+        timeout=llm_policy("fake")["read_timeout"],
+    )
+
+
+_ASYNC_PROVIDER_CALLS = {
+    "openai": _acall_openai,
+    "anthropic": _acall_anthropic,
+    "gemini": _acall_gemini,
+    "together": _acall_together,
+    "fake": _acall_fake,
+}
+
+
+async def _atimed_attempt(provider, m, make_coro, attempt, hedged, tokens=0, throttle=True):
+    if throttle:
+        await _athrottle(provider, tokens)
+    start = time.perf_counter()
+    try:
+        result = await make_coro()
+    except Exception as e:
+        _record_attempt(provider, m, attempt, hedged, time.perf_counter() - start, e)
+        raise
+    _record_attempt(provider, m, attempt, hedged, time.perf_counter() - start)
+    return result
+
+
+async def _ahedged_attempt(provider, m, make_coro, attempt, hedge_after, tokens=0):
+    if not hedge_after:
+        return await _atimed_attempt(provider, m, make_coro, attempt, False, tokens)
+    # as in _hedged_attempt, rate-limit queueing does not count towards hedge_after
+    await _athrottle(provider, tokens)
+    primary = asyncio.ensure_future(_atimed_attempt(provider, m, make_coro, attempt, False, tokens, False))
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done:
+        return primary.result()
+    _count(provider, "hedges")
+    backup = asyncio.ensure_future(_atimed_attempt(provider, m, make_coro, attempt, True, tokens))
+    pending = {primary, backup}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        _count(provider, "hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # unlike the thread pool, the losing request can actually be cancelled
+        for task in pending:
+            task.cancel()
+
+
+async def _acall_with_policy(provider: str, m: str, make_coro, tokens: int = 0):
+    policy = llm_policy(provider)
+    retries = policy["max_retries"]
+    for attempt in range(retries + 1):
+        try:
+            return await _ahedged_attempt(provider, m, make_coro, attempt, _hedge_threshold(provider, policy), tokens)
+        except Exception as e:
+            if attempt >= retries or not _is_retryable(e):
+                raise
+            delay = _backoff_delay(policy, attempt, e)
+            _count(provider, "retries")
+            print(f"[acall_llm] {provider} attempt {attempt + 1} failed ({type(e).__name__}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def acall_llm(
+    *,
+    model: str,
+    system_prompt: str,
+    user_message: str,
+    temperature: float = 0.1,
+    max_tokens: int = 1200,
+    agent: Optional[str] = None,
+    bypass_cache: bool = False,
+    response_schema: Optional[dict] = None,
+) -> str:
+    """Async version of call_llm with the same routing rules, using each SDK's async client."""
+
+    if not model:
+        raise ValueError("model is required")
+
+    chain = model_chain(model)
+    if not chain:
+        raise ValueError("model is required")
+    if response_schema:
+        system_prompt = system_prompt + schemas.schema_instruction(response_schema)
+    key = llm_cache.cache_key("|".join(chain), system_prompt, user_message, temperature, max_tokens)
+    # the DB tier is synchronous; keep it off the event loop
+    cached = await asyncio.to_thread(llm_cache.lookup, key, agent, bypass_cache)
+    if cached is not None:
+        text, answered = cached
+        return _result(text, answered or chain[0], response_schema)
+
+    errors = []
+    last_error = None
+    for m in chain:
+        provider = provider_for_model(m)
+        breaker = _breaker(provider)
+        if not breaker.allow():
+            errors.append(f"{m}: circuit open for {provider}")
+            continue
+        call = _ASYNC_PROVIDER_CALLS[provider]
+        start = time.perf_counter()
+        try:
+            text = await _acall_with_policy(
+                provider, m,
+                lambda call=call, m=m: call(m, system_prompt, user_message, temperature, max_tokens, response_schema),
+                tokens=_request_tokens(m, system_prompt, user_message, max_tokens),
+            )
+        except Exception as e:
+            if _is_retryable(e):
+                breaker.record(False, time.perf_counter() - start)
+            else:
+                breaker.release()
+            errors.append(f"{m}: {type(e).__name__}: {e}")
+            last_error = e
+            if len(chain) > 1:
+                print(f"[acall_llm] {m} failed ({type(e).__name__}); trying next model in chain")
+            continue
+        breaker.record(True, time.perf_counter() - start)
+        result = _result(text, m, response_schema, agent)
+        await asyncio.to_thread(llm_cache.store, key, _cached_text(result), agent, m)
+        return result
+
+    raise _chain_error(chain, errors, last_error)
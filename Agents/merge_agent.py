@@ -168,12 +168,28 @@
 import os
 import json
 import re
-from llm_router import call_llm
+from llm_router import call_llm, acall_llm, fanout_concurrency, answered_model, LLMResult
+from schemas import output_schema, repair, AGENT_SCHEMAS
+from stage_parser import parse_stage_plan
+from merge_rules import rules_merge, can_merge, items_by_stage
 from dotenv import load_dotenv
 
 load_dotenv()
 MODEL_NAME = "Qwen/Qwen2.5-72B-Instruct-Turbo"
 
+# "single": one call with every report; "map_reduce": one small call per stage
+# (in parallel) plus one call for general_summary, see merge_map_reduce();
+# "rules": no LLM call, see merge_rules.py (falls back to map_reduce when the
+# agents' structured data is missing)
+MERGE_MODE = os.getenv("MERGE_MODE", "single").strip().lower()
+# rules mode: one optional LLM pass that rewrites the wording of the merged JSON
+MERGE_POLISH = os.getenv("MERGE_POLISH", "0").strip().lower() in ("1", "true", "yes", "on")
+MERGE_STAGE_MAX_TOKENS = int(os.getenv("MERGE_STAGE_MAX_TOKENS", "700"))
+MERGE_SUMMARY_MAX_TOKENS = int(os.getenv("MERGE_SUMMARY_MAX_TOKENS", "800"))
+# characters of one report given to a stage call (stage slice / season-wide notes)
+MERGE_SLICE_CHARS = int(os.getenv("MERGE_SLICE_CHARS", "1500"))
+MERGE_GENERAL_CHARS = int(os.getenv("MERGE_GENERAL_CHARS", "600"))
+
 # ✅ COMPLETE MERGE PROMPT - Production Ready
 Merge_system_prompt = '''
   You are the FINAL MERGE AGENT for a comprehensive crop advisory system. Your job is to synthesize information from 7 specialized agents into ONE actionable, farmer-friendly report.
@@ -396,6 +412,71 @@ def clean_json_response(response: str) -> str:
     return response.strip()
 
 
+def _merge_user_message(soil, nutrient, irrigation, pest, disease, weather, stage) -> str:
+    # Construct user message with all agent reports
+    return f"""Please merge the following crop management reports into a comprehensive plan.
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📋 STAGE PLAN:
+{stage or 'No stage information provided'}
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+🌱 SOIL ANALYSIS:
+{soil or 'No soil information provided'}
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+🧪 NUTRIENT PLAN:
+{nutrient or 'No nutrient information provided'}
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+💧 IRRIGATION SCHEDULE:
+{irrigation or 'No irrigation information provided'}
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+🐛 PEST ADVISORY:
+{pest or 'No pest information provided'}
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+🦠 DISEASE ADVISORY:
+{disease or 'No disease information provided'}
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+🌤️ WEATHER FORECAST:
+{weather or 'No weather information provided'}
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Now generate the merged JSON report following the structure specified in the system prompt."""
+
+
+def _parse_merge_response(response: str):
+    """(pretty JSON text, parsed dict) for a merge answer; (cleaned text, None) if it is not JSON."""
+    # structured calls arrive already repaired and parsed
+    parsed_json = getattr(response, "data", None)
+    try:
+        if parsed_json is None:
+            # single-pass local repair (fences, trailing commas, truncation, missing keys)
+            parsed_json, _ = repair(response, AGENT_SCHEMAS["merge"])
+        if parsed_json is None:
+            # ✅ IF JSON PARSING FAILS - Return cleaned text as-is
+            # This handles cases where LLM returns text instead of JSON
+            return clean_json_response(response), None
+        # Return formatted JSON string (pretty printed)
+        return json.dumps(parsed_json, indent=2, ensure_ascii=False), parsed_json
+    
+    except Exception as e:
+        # ✅ RETURN ERROR AS STRING (not dict)
+        error_msg = f"""ERROR IN MERGE AGENT:
+Type: {type(e).__name__}
+Details: {str(e)}
+
+Please check:
+1. All agent reports are properly formatted
+2. API key is valid
+3. Network connection is stable"""
+        return error_msg, None
+
+
 def merge_agent(
     soil: str,
     nutrient: str,
@@ -408,6 +489,9 @@ def merge_agent(
     temperature: float = 0.1,
     max_tokens: int = 4096,
     custom_prompt: str = None,
+    mode: str = None,
+    agent_data: dict = None,
+    polish: bool = None,
 ) -> str:
     """
     Merge all agent reports into a comprehensive crop management plan
@@ -424,87 +508,473 @@ def merge_agent(
         temperature: Sampling temperature
         max_tokens: Maximum response tokens
         custom_prompt: Override default merge prompt
+        mode: "single", "map_reduce" or "rules" (default MERGE_MODE);
+            map_reduce needs a parseable stage plan and no custom_prompt,
+            rules also needs structured nutrient/irrigation/pest/disease data
+        agent_data: {agent: structured output} used to slice reports by stage
+        polish: rules mode only, rewrite the wording with one LLM call
+            (default MERGE_POLISH)
     
     Returns:
         str: Merged report as formatted text (JSON string or error message)
     """
     if model_name is None:
         model_name = MODEL_NAME
+
+    mode = mode or MERGE_MODE
+    if mode == "rules" and not custom_prompt:
+        merged = merge_by_rules(
+            stage, agent_data, polish=polish,
+            model_name=model_name, temperature=temperature, max_tokens=max_tokens,
+        )
+        if merged is not None:
+            return merged
+        mode = "map_reduce"
+    if mode == "map_reduce" and not custom_prompt:
+        merged = merge_map_reduce(
+            soil, nutrient, irrigation, pest, disease, weather, stage,
+            model_name=model_name, temperature=temperature, agent_data=agent_data,
+        )
+        if merged is not None:
+            return merged
     
     system_prompt = custom_prompt if custom_prompt else Merge_system_prompt
     
-    # Construct user message with all agent reports
-    user_message = f"""Please merge the following crop management reports into a comprehensive plan.
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-📋 STAGE PLAN:
-{stage or 'No stage information provided'}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-🌱 SOIL ANALYSIS:
-{soil or 'No soil information provided'}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-🧪 NUTRIENT PLAN:
-{nutrient or 'No nutrient information provided'}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-💧 IRRIGATION SCHEDULE:
-{irrigation or 'No irrigation information provided'}
+    user_message = _merge_user_message(soil, nutrient, irrigation, pest, disease, weather, stage)
+    
+    try:
+        # Call LLM
+        response = call_llm(
+            model=model_name,
+            system_prompt=system_prompt,
+            user_message=user_message,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            agent="merge",
+            response_schema=output_schema("merge"),
+        )
+    except Exception as e:
+        return f"Error calling merge model: {e}"
+    
+    # keep track of which model in a fallback chain answered
+    text, data = _parse_merge_response(response)
+    return LLMResult(text, getattr(response, "model", None), data=data)
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-🐛 PEST ADVISORY:
-{pest or 'No pest information provided'}
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-🦠 DISEASE ADVISORY:
-{disease or 'No disease information provided'}
+async def amerge_agent(
+    soil: str,
+    nutrient: str,
+    irrigation: str,
+    pest: str,
+    disease: str,
+    weather: str,
+    stage: str,
+    model_name: str = None,
+    temperature: float = 0.1,
+    max_tokens: int = 4096,
+    custom_prompt: str = None,
+    mode: str = None,
+    agent_data: dict = None,
+    polish: bool = None,
+) -> str:
+    """Async variant of merge_agent (same prompt and post-processing, awaits acall_llm)."""
+    if model_name is None:
+        model_name = MODEL_NAME
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-🌤️ WEATHER FORECAST:
-{weather or 'No weather information provided'}
+    mode = mode or MERGE_MODE
+    if mode == "rules" and not custom_prompt:
+        merged = await amerge_by_rules(
+            stage, agent_data, polish=polish,
+            model_name=model_name, temperature=temperature, max_tokens=max_tokens,
+        )
+        if merged is not None:
+            return merged
+        mode = "map_reduce"
+    if mode == "map_reduce" and not custom_prompt:
+        merged = await amerge_map_reduce(
+            soil, nutrient, irrigation, pest, disease, weather, stage,
+            model_name=model_name, temperature=temperature, agent_data=agent_data,
+        )
+        if merged is not None:
+            return merged
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    system_prompt = custom_prompt if custom_prompt else Merge_system_prompt
+    user_message = _merge_user_message(soil, nutrient, irrigation, pest, disease, weather, stage)
 
-Now generate the merged JSON report following the structure specified in the system prompt."""
-    
     try:
-        # Call LLM
-        response = call_llm(
+        response = await acall_llm(
             model=model_name,
             system_prompt=system_prompt,
             user_message=user_message,
             temperature=temperature,
             max_tokens=max_tokens,
+            agent="merge",
+            response_schema=output_schema("merge"),
         )
     except Exception as e:
         return f"Error calling merge model: {e}"
-    
-    # Clean JSON response
-    cleaned_content = clean_json_response(response)
-    
-    # ✅ TRY TO PARSE JSON - If successful, return pretty JSON string
+
+    text, data = _parse_merge_response(response)
+    return LLMResult(text, getattr(response, "model", None), data=data)
+
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# Map-reduce merge: slice every report by stage, synthesize each stage with a
+# small prompt (in parallel), then write general_summary in one short call.
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Merge_stage_prompt = '''
+You are the FINAL MERGE AGENT for a crop advisory system, working on ONE growth stage.
+You get the parts of the nutrient, irrigation, pest, disease and weather reports that
+apply to this stage, plus short season-wide notes.
+
+Return JSON with:
+- activities: 3-7 actionable tasks for this stage with exact quantities and timing
+  (fertilizer kg/ha, irrigation mm and frequency, which pests/diseases to check and how,
+  weather-based actions)
+- tips: 1-4 short practical tips (max 15 words each)
+- alerts: 1-4 risk warnings as "RISK LEVEL: threat + trigger"
+
+Rules:
+- Use ONLY information from the reports; do not invent products, doses or dates.
+- If two reports conflict, choose the more conservative option and mention it in alerts.
+- If a report has nothing for this stage, say so in alerts.
+- Simple, farmer-friendly language.
+'''
+
+Merge_summary_prompt = '''
+You are the FINAL MERGE AGENT for a crop advisory system, writing the GENERAL SUMMARY.
+You get the soil and weather reports, season-wide notes from the other reports and the
+alerts already written for each stage.
+
+Return JSON with keys soil, nutrient, irrigation, weather, pest, disease; each value is
+2-3 sentences with the totals, top threats and risk periods the reports give.
+Use ONLY information from the reports. Simple, farmer-friendly language.
+'''
+
+# (merge_agent argument, label in the prompts); soil only feeds the summary
+_SLICED_REPORTS = [
+    ("nutrient", "NUTRIENT PLAN"),
+    ("irrigation", "IRRIGATION SCHEDULE"),
+    ("pest", "PEST ADVISORY"),
+    ("disease", "DISEASE ADVISORY"),
+    ("weather", "WEATHER FORECAST"),
+]
+_SECTION_HEADER = re.compile(r"^\s*-{3,}.*-{3,}\s*$", re.MULTILINE)
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_STAGE_NUMBER = re.compile(r"\bstage\s*(\d+)\b", re.IGNORECASE)
+
+
+def _trim(text, limit: int) -> str:
+    text = (text or "").strip()
+    return text if len(text) <= limit else text[:limit].rstrip() + " ..."
+
+
+def _sections(text: str) -> list:
+    """"--- header ---" sections (pest/disease reports), otherwise blank-line paragraphs."""
+    text = str(text or "")
+    starts = [m.start() for m in _SECTION_HEADER.finditer(text)]
+    if not starts:
+        return [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    bounds = [0] + starts + [len(text)]
+    return [text[a:b].strip() for a, b in zip(bounds, bounds[1:]) if text[a:b].strip()]
+
+
+def _section_stages(section: str, stages) -> list:
+    """Indices of the stages a section is about (by name, "Stage N" or a date in the stage)."""
+    # a section header names its stage; the body may mention others in passing
+    probe = section.splitlines()[0] if _SECTION_HEADER.match(section) else section
+    low = probe.lower()
+    hits = set()
+    for i, s in enumerate(stages):
+        if s.name.lower() in low:
+            hits.add(i)
+    for m in _STAGE_NUMBER.finditer(probe):
+        hits.update(i for i, s in enumerate(stages) if s.number == int(m.group(1)))
+    if not hits:
+        for m in _ISO_DATE.finditer(probe):
+            day = m.group(0)
+            hits.update(
+                i for i, s in enumerate(stages)
+                if s.start.isoformat() <= day <= s.end.isoformat()
+            )
+    return sorted(hits)
+
+
+def _text_slices(text, stages):
+    """([text for each stage], season-wide text) for one report."""
+    per_stage = [[] for _ in stages]
+    general = []
+    for section in _sections(text):
+        hits = _section_stages(section, stages)
+        for i in hits:
+            per_stage[i].append(section)
+        if not hits:
+            general.append(section)
+    return ["\n\n".join(parts) for parts in per_stage], "\n\n".join(general)
+
+
+def _data_slices(data, stages):
+    """Like _text_slices for a structured output ({"stages": [...], ...}); None if it has no stages."""
+    if not isinstance(data, dict) or not data.get("stages"):
+        return None
+    per_stage = []
+    for item in items_by_stage(data, stages):
+        body = {k: v for k, v in (item or {}).items() if k not in ("stage_name", "start_date", "end_date")}
+        per_stage.append(json.dumps(body, ensure_ascii=False) if body else "")
+    rest = {k: v for k, v in data.items() if k != "stages" and v}
+    general = json.dumps(rest, ensure_ascii=False) if rest else ""
+    return per_stage, general
+
+
+def _prepare_map_reduce(reports: dict, stage, agent_data):
+    """Stages and per-stage/season-wide slices of each report; None when no stage parses."""
+    stages = parse_stage_plan(stage)
+    if not stages:
+        return None
+    agent_data = agent_data or {}
+    slices = {}
+    for name, _ in _SLICED_REPORTS:
+        slices[name] = _data_slices(agent_data.get(name), stages) or _text_slices(reports.get(name), stages)
+    return {"stages": stages, "reports": reports, "slices": slices}
+
+
+def _stage_message(prepared, index: int) -> str:
+    s = prepared["stages"][index]
+    parts = [f"STAGE {s.number}: {s.name}\nDates: {s.start.isoformat()} to {s.end.isoformat()} ({s.duration} days)"]
+    for name, label in _SLICED_REPORTS:
+        per_stage, general = prepared["slices"][name]
+        if per_stage[index]:
+            parts.append(f"{label} (this stage):\n{_trim(per_stage[index], MERGE_SLICE_CHARS)}")
+        if general:
+            parts.append(f"{label} (season-wide):\n{_trim(general, MERGE_GENERAL_CHARS)}")
+        if not per_stage[index] and not general:
+            parts.append(f"{label}: no information for this stage")
+    return "\n\n".join(parts)
+
+
+def _summary_message(prepared, stage_results) -> str:
+    reports = prepared["reports"]
+    parts = [
+        f"SOIL ANALYSIS:\n{_trim(reports.get('soil'), MERGE_SLICE_CHARS) or 'No soil information provided'}",
+        f"WEATHER FORECAST:\n{_trim(reports.get('weather'), MERGE_SLICE_CHARS) or 'No weather information provided'}",
+    ]
+    for name, label in _SLICED_REPORTS:
+        general = prepared["slices"][name][1]
+        if name != "weather" and general:
+            parts.append(f"{label} (season-wide):\n{_trim(general, MERGE_GENERAL_CHARS)}")
+    alerts = []
+    for s, result in zip(prepared["stages"], stage_results):
+        data = getattr(result, "data", None) or {}
+        if data.get("alerts"):
+            alerts.append(f"- {s.name}: " + "; ".join(data["alerts"]))
+    if alerts:
+        parts.append("STAGE ALERTS:\n" + "\n".join(alerts))
+    return "\n\n".join(parts)
+
+
+def _call(model_name, temperature, system_prompt, user_message, schema, max_tokens):
     try:
-        parsed_json = json.loads(cleaned_content)
-        # Return formatted JSON string (pretty printed)
-        return json.dumps(parsed_json, indent=2, ensure_ascii=False)
-    
-    except json.JSONDecodeError:
-        # ✅ IF JSON PARSING FAILS - Return cleaned text as-is
-        # This handles cases where LLM returns text instead of JSON
-        return cleaned_content
-    
+        return call_llm(
+            model=model_name, system_prompt=system_prompt, user_message=user_message,
+            temperature=temperature, max_tokens=max_tokens, agent="merge",
+            response_schema=schema,
+        )
     except Exception as e:
-        # ✅ RETURN ERROR AS STRING (not dict)
-        error_msg = f"""ERROR IN MERGE AGENT:
-Type: {type(e).__name__}
-Details: {str(e)}
+        return f"Error calling merge model: {e}"
 
-Please check:
-1. All agent reports are properly formatted
-2. API key is valid
-3. Network connection is stable"""
-        return error_msg
+
+async def _acall(model_name, temperature, system_prompt, user_message, schema, max_tokens):
+    try:
+        return await acall_llm(
+            model=model_name, system_prompt=system_prompt, user_message=user_message,
+            temperature=temperature, max_tokens=max_tokens, agent="merge",
+            response_schema=schema,
+        )
+    except Exception as e:
+        return f"Error calling merge model: {e}"
+
+
+def _finish_map_reduce(prepared, stage_results, summary):
+    """Assemble the same JSON as the single-prompt merge (schemas.AGENT_SCHEMAS["merge"])."""
+    answered = [r for r in list(stage_results) + [summary] if getattr(r, "data", None) is not None]
+    if not answered:
+        return str(summary)
+    stages = []
+    for s, result in zip(prepared["stages"], stage_results):
+        advice = getattr(result, "data", None) or {
+            "activities": [],
+            "tips": [],
+            "alerts": [f"Merged advice for this stage is unavailable ({result})"],
+        }
+        stages.append({
+            "stage_name": s.name,
+            "start_date": s.start.isoformat(),
+            "end_date": s.end.isoformat(),
+            "duration_days": s.duration,
+            "activities": advice.get("activities", []),
+            "tips": advice.get("tips", []),
+            "alerts": advice.get("alerts", []),
+        })
+    general_summary = getattr(summary, "data", None) or {
+        name: "" for name in AGENT_SCHEMAS["merge_summary"]["required"]
+    }
+    data = {"stages": stages, "general_summary": general_summary}
+    return LLMResult(json.dumps(data, indent=2, ensure_ascii=False), answered_model(answered), data=data)
+
+
+def merge_map_reduce(
+    soil, nutrient, irrigation, pest, disease, weather, stage,
+    model_name: str = None,
+    temperature: float = 0.1,
+    agent_data: dict = None,
+    max_concurrency: int = None,
+):
+    """
+    Map-reduce variant of merge_agent: one call per stage (at most
+    fanout_concurrency(model_name) in flight), then one general_summary call.
+    Returns None when the stage plan does not parse (callers fall back to the
+    single-prompt merge).
+    """
+    from agent_helper import map_bounded
+
+    model_name = model_name or MODEL_NAME
+    reports = dict(soil=soil, nutrient=nutrient, irrigation=irrigation, pest=pest, disease=disease, weather=weather)
+    prepared = _prepare_map_reduce(reports, stage, agent_data)
+    if prepared is None:
+        return None
+    stage_results = map_bounded(
+        lambda i: _call(
+            model_name, temperature, Merge_stage_prompt, _stage_message(prepared, i),
+            AGENT_SCHEMAS["merge_stage"], MERGE_STAGE_MAX_TOKENS,
+        ),
+        range(len(prepared["stages"])),
+        fanout_concurrency(model_name, max_concurrency),
+    )
+    summary = _call(
+        model_name, temperature, Merge_summary_prompt, _summary_message(prepared, stage_results),
+        AGENT_SCHEMAS["merge_summary"], MERGE_SUMMARY_MAX_TOKENS,
+    )
+    return _finish_map_reduce(prepared, stage_results, summary)
+
+
+async def amerge_map_reduce(
+    soil, nutrient, irrigation, pest, disease, weather, stage,
+    model_name: str = None,
+    temperature: float = 0.1,
+    agent_data: dict = None,
+    max_concurrency: int = None,
+):
+    """Async variant of merge_map_reduce."""
+    from agent_helper import amap_bounded
+
+    model_name = model_name or MODEL_NAME
+    reports = dict(soil=soil, nutrient=nutrient, irrigation=irrigation, pest=pest, disease=disease, weather=weather)
+    prepared = _prepare_map_reduce(reports, stage, agent_data)
+    if prepared is None:
+        return None
+
+    async def _stage_call(i):
+        return await _acall(
+            model_name, temperature, Merge_stage_prompt, _stage_message(prepared, i),
+            AGENT_SCHEMAS["merge_stage"], MERGE_STAGE_MAX_TOKENS,
+        )
+
+    stage_results = await amap_bounded(
+        _stage_call, range(len(prepared["stages"])), fanout_concurrency(model_name, max_concurrency),
+    )
+    summary = await _acall(
+        model_name, temperature, Merge_summary_prompt, _summary_message(prepared, stage_results),
+        AGENT_SCHEMAS["merge_summary"], MERGE_SUMMARY_MAX_TOKENS,
+    )
+    return _finish_map_reduce(prepared, stage_results, summary)
+
+
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+# Rule-based merge (merge_rules.py) with an optional LLM polish pass
+# ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Merge_polish_prompt = '''
+You are the FINAL MERGE AGENT for a crop advisory system. The JSON below is a complete
+merged advisory built from the agent reports. Rewrite the wording of activities, tips,
+alerts and general_summary in simple, farmer-friendly language.
+
+Rules:
+- Keep every stage, date, quantity, product name, risk level and threshold exactly.
+- Do not add, drop or reorder stages; do not invent new advice.
+- Return the same JSON structure.
+'''
+
+
+def _prepare_rules(stage, agent_data):
+    """The rule-based merge JSON, or None (with a warning) when rules mode cannot run."""
+    stages = parse_stage_plan(stage)
+    missing = can_merge(agent_data)
+    if not stages or missing:
+        reason = f"no structured data from {', '.join(missing)}" if missing else "the stage plan does not parse"
+        print(f"[merge_agent] Warning: rule-based merge skipped ({reason}); using the LLM merge")
+        return None
+    return rules_merge(stages, agent_data)
+
+
+def _finish_rules(data, polished=None):
+    """LLMResult for the rules JSON; a polish answer is used only if it kept every stage and date."""
+    model = "rules"
+    if polished is not None:
+        stages = (getattr(polished, "data", None) or {}).get("stages")
+        if isinstance(stages, list) and len(stages) == len(data["stages"]):
+            keep = ("stage_name", "start_date", "end_date", "duration_days")
+            data = {
+                "stages": [{**p, **{k: r[k] for k in keep}} for r, p in zip(data["stages"], stages)],
+                "general_summary": polished.data.get("general_summary") or data["general_summary"],
+            }
+            model = answered_model([polished], model)
+        else:
+            print("[merge_agent] Warning: polish pass did not return the merged stages; keeping the rule-based merge")
+    return LLMResult(json.dumps(data, indent=2, ensure_ascii=False), model, data=data)
+
+
+def merge_by_rules(
+    stage, agent_data,
+    polish: bool = None,
+    model_name: str = None,
+    temperature: float = 0.1,
+    max_tokens: int = 4096,
+):
+    """
+    Merge from the agents' structured data without an LLM (merge_rules.rules_merge);
+    with polish, one LLM call rewrites the wording. None when rules mode cannot run.
+    """
+    data = _prepare_rules(stage, agent_data)
+    if data is None:
+        return None
+    polished = None
+    if MERGE_POLISH if polish is None else polish:
+        polished = _call(
+            model_name or MODEL_NAME, temperature, Merge_polish_prompt,
+            json.dumps(data, ensure_ascii=False), AGENT_SCHEMAS["merge"], max_tokens,
+        )
+    return _finish_rules(data, polished)
+
+
+async def amerge_by_rules(
+    stage, agent_data,
+    polish: bool = None,
+    model_name: str = None,
+    temperature: float = 0.1,
+    max_tokens: int = 4096,
+):
+    """Async variant of merge_by_rules."""
+    data = _prepare_rules(stage, agent_data)
+    if data is None:
+        return None
+    polished = None
+    if MERGE_POLISH if polish is None else polish:
+        polished = await _acall(
+            model_name or MODEL_NAME, temperature, Merge_polish_prompt,
+            json.dumps(data, ensure_ascii=False), AGENT_SCHEMAS["merge"], max_tokens,
+        )
+    return _finish_rules(data, polished)
 
 
 # ✅ OPTIONAL: Function to save report to file
@@ -0,0 +1,250 @@
+"""
+Rule-based merge (merge_agent.MERGE_MODE=rules): joins the structured outputs
+of the upstream agents (their result dict's `data`, see schemas.AGENT_SCHEMAS)
+by stage and builds the merge JSON ({"stages": [...], "general_summary": {...}})
+without calling an LLM.
+
+Conflicts are resolved by the precedence declared below rather than by a
+prompt: stage names and dates come from the stage plan, a hazard reported
+twice keeps its highest risk level and the action of the source listed
+first, and an activity repeated by two agents is kept once, under the first.
+"""
+
+import re
+
+# Where stage names/dates come from, first match wins
+STAGE_SOURCE_PRECEDENCE = ("stage", "nutrient", "irrigation", "pest", "disease")
+# Order of activities within a stage; also decides which agent keeps a duplicate
+ACTIVITY_PRECEDENCE = ("nutrient", "irrigation", "pest", "disease")
+# Agents whose structured data the rule-based merge needs
+RULES_REQUIRED = ("nutrient", "irrigation", "pest", "disease")
+RISK_ORDER = ("LOW", "MEDIUM", "HIGH", "CRITICAL")
+# Risk levels that become stage alerts (lower ones are activities/tips only)
+ALERT_RISKS = ("HIGH", "CRITICAL")
+
+# Forecast thresholds for weather alerts within a stage window
+HEAVY_RAIN_MM = 25.0
+HEAT_STRESS_C = 35.0
+COLD_STRESS_C = 5.0
+
+_HAZARDS = {"pest": "pests", "disease": "diseases"}
+_SUMMARY_KEYS = ("soil", "nutrient", "irrigation", "weather", "pest", "disease")
+
+
+def _norm(text) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", str(text or "").lower()).strip()
+
+
+def _strings(value) -> list:
+    if isinstance(value, str):
+        value = [value]
+    return [str(v).strip() for v in value or [] if str(v).strip()]
+
+
+def _number(value):
+    return f"{value:g}" if isinstance(value, (int, float)) else None
+
+
+def items_by_stage(data, stages) -> list:
+    """data["stages"] items aligned to stages (by name, else start date); None where missing."""
+    out = [None] * len(stages)
+    items = data.get("stages") if isinstance(data, dict) else None
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        name = _norm(item.get("stage_name"))
+        start = str(item.get("start_date") or "")
+        for i, s in enumerate(stages):
+            if out[i] is None and (name == _norm(s.name) or start == s.start.isoformat()):
+                out[i] = item
+                break
+    return out
+
+
+def can_merge(agent_data: dict) -> list:
+    """Agents in RULES_REQUIRED without structured per-stage data (empty list: rules can run)."""
+    agent_data = agent_data or {}
+    return [
+        name for name in RULES_REQUIRED
+        if not (isinstance(agent_data.get(name), dict) and agent_data[name].get("stages"))
+    ]
+
+
+def _stage_rows(stages, agent_data):
+    """(name, start, end, duration) per stage from the first source in STAGE_SOURCE_PRECEDENCE."""
+    rows = []
+    aligned = {name: items_by_stage(agent_data.get(name), stages) for name in STAGE_SOURCE_PRECEDENCE}
+    for i, s in enumerate(stages):
+        row = {"stage_name": s.name, "start_date": s.start.isoformat(), "end_date": s.end.isoformat(), "duration_days": s.duration}
+        for name in STAGE_SOURCE_PRECEDENCE:
+            item = aligned[name][i]
+            if item and item.get("start_date") and item.get("end_date"):
+                row.update(
+                    stage_name=item.get("stage_name") or s.name,
+                    start_date=item["start_date"],
+                    end_date=item["end_date"],
+                    duration_days=item.get("duration_days") or s.duration,
+                )
+                break
+        rows.append(row)
+    return rows
+
+
+def _hazards(stage_items: dict) -> list:
+    """Pest and disease entries of one stage, one per name, highest risk kept."""
+    merged = {}
+    for agent in ACTIVITY_PRECEDENCE:
+        key = _HAZARDS.get(agent)
+        item = stage_items.get(agent)
+        if not key or not item:
+            continue
+        for hazard in item.get(key) or []:
+            if not isinstance(hazard, dict) or not hazard.get("name"):
+                continue
+            risk = str(hazard.get("risk") or "MEDIUM").upper()
+            risk = risk if risk in RISK_ORDER else "MEDIUM"
+            current = merged.get(_norm(hazard["name"]))
+            if current is None:
+                merged[_norm(hazard["name"])] = {**hazard, "risk": risk, "source": agent}
+            elif RISK_ORDER.index(risk) > RISK_ORDER.index(current["risk"]):
+                # the higher risk wins; the earlier source keeps its action
+                current["risk"] = risk
+    return sorted(merged.values(), key=lambda h: -RISK_ORDER.index(h["risk"]))
+
+
+def _weather_alerts(record, start, end) -> list:
+    if not isinstance(record, dict) or not record.get("daily"):
+        return []
+    from weather import weather_window
+
+    window = weather_window(record, start, end, ("tmin", "tmax", "precip"))
+    alerts = []
+    rain = [d for d, p in zip(window["time"], window.get("precip", [])) if p is not None and p >= HEAVY_RAIN_MM]
+    heat = [d for d, t in zip(window["time"], window.get("tmax", [])) if t is not None and t >= HEAT_STRESS_C]
+    cold = [d for d, t in zip(window["time"], window.get("tmin", [])) if t is not None and t <= COLD_STRESS_C]
+    if rain:
+        alerts.append(f"Heavy rain (≥{HEAVY_RAIN_MM:g} mm) forecast on {', '.join(rain)}: skip irrigation and delay spraying")
+    if heat:
+        alerts.append(f"Heat stress (≥{HEAT_STRESS_C:g}°C) forecast on {', '.join(heat)}: irrigate in the early morning")
+    if cold:
+        alerts.append(f"Cold stress (≤{COLD_STRESS_C:g}°C) forecast on {', '.join(cold)}: delay irrigation and top dressing")
+    return alerts
+
+
+def _stage_advice(index, row, stage_items, agent_data) -> dict:
+    activities, tips, alerts = [], [], []
+    seen = set()
+
+    def _add(target, text):
+        key = _norm(text)
+        if key and key not in seen:
+            seen.add(key)
+            target.append(text)
+
+    for text in _strings((stage_items.get("nutrient") or {}).get("applications")):
+        _add(activities, text)
+    for text in _strings((stage_items.get("irrigation") or {}).get("irrigations")):
+        _add(activities, text)
+    for hazard in _hazards(stage_items):
+        label = "Monitor for" if hazard["risk"] in ("LOW", "MEDIUM") else "Act on"
+        _add(activities, f"{label} {hazard['name']} ({hazard['risk']} risk): {hazard.get('action') or 'follow the advisory'}")
+        symptoms = str(hazard.get("symptoms") or "").strip()
+        if symptoms:
+            _add(tips, f"{hazard['name']}: look for {symptoms[0].lower()}{symptoms[1:]}")
+        if hazard["risk"] in ALERT_RISKS:
+            _add(alerts, f"{hazard['risk']} RISK: {hazard['name']} - {hazard.get('action') or 'act immediately'}")
+    for agent in ACTIVITY_PRECEDENCE:
+        for text in _strings((stage_items.get(agent) or {}).get("alerts")):
+            _add(alerts, text)
+    for text in _weather_alerts(agent_data.get("weather"), row["start_date"], row["end_date"]):
+        _add(alerts, text)
+    if index == 0:
+        # soil and water advice applies before/at sowing
+        for name in ("soil", "water"):
+            for text in _strings((agent_data.get(name) or {}).get("recommendations")):
+                _add(tips, text)
+    for agent in ACTIVITY_PRECEDENCE:
+        if not stage_items.get(agent):
+            alerts.append(f"No {agent} advice was given for this stage")
+    return {"activities": activities, "tips": tips, "alerts": alerts}
+
+
+def _sentences(*parts) -> str:
+    """Join parts as sentences, dropping any part another part already contains."""
+    parts = [str(p).strip().rstrip(".") for p in parts if p and str(p).strip()]
+    keep = [
+        p for i, p in enumerate(parts)
+        if not any(i != j and _norm(p) in _norm(q) and (len(q) > len(p) or j < i) for j, q in enumerate(parts))
+    ]
+    return " ".join(p + "." for p in keep)
+
+
+def _general_summary(agent_data, hazard_stages) -> dict:
+    soil = agent_data.get("soil") or {}
+    water = agent_data.get("water") or {}
+    nutrient = agent_data.get("nutrient") or {}
+    irrigation = agent_data.get("irrigation") or {}
+    weather = agent_data.get("weather") or {}
+
+    npk = [_number(nutrient.get(f"total_{k}_kg_ha")) for k in "npk"]
+    total_water = _number(irrigation.get("total_water_mm"))
+    daily = weather.get("daily") or {}
+    tmin = [t for t in daily.get("tmin") or [] if t is not None]
+    tmax = [t for t in daily.get("tmax") or [] if t is not None]
+    ph = _number(soil.get("ph"))
+
+    summary = {
+        "soil": _sentences(
+            soil.get("summary"),
+            f"Soil type: {soil['soil_type']}" if soil.get("soil_type") else None,
+            f"pH {ph}" if ph else None,
+        ),
+        "nutrient": _sentences(
+            f"Total requirement: {':'.join(v or '-' for v in npk)} kg/ha NPK" if any(npk) else None,
+            nutrient.get("summary"),
+            f"Micronutrients: {', '.join(_strings(nutrient.get('micronutrients')))}" if nutrient.get("micronutrients") else None,
+        ),
+        "irrigation": _sentences(
+            f"Total water requirement: {total_water} mm" if total_water else None,
+            f"Method: {irrigation['method']}" if irrigation.get("method") else None,
+            irrigation.get("summary"),
+            *_strings(irrigation.get("alerts")),
+            water.get("summary"),
+        ),
+        "weather": _sentences(
+            f"Forecast {daily['time'][0]} to {daily['time'][-1]}: {min(tmin):g}-{max(tmax):g}°C" if tmin and tmax and daily.get("time") else None,
+            f"{weather['precip_total']:g} mm rain expected" if isinstance(weather.get("precip_total"), (int, float)) else None,
+        ),
+    }
+    for agent, key in _HAZARDS.items():
+        top = {}
+        for stage_name, hazards in hazard_stages:
+            for hazard in hazards:
+                if hazard["source"] != agent:
+                    continue
+                name = _norm(hazard["name"])
+                risk = RISK_ORDER.index(hazard["risk"])
+                if name not in top or risk > top[name][0]:
+                    top[name] = (risk, hazard["name"], stage_name)
+        ranked = sorted(top.values(), key=lambda t: -t[0])[:5]
+        summary[agent] = _sentences(
+            "Main threats: " + ", ".join(f"{n} ({RISK_ORDER[r]}, {s})" for r, n, s in ranked) if ranked else None,
+        )
+    return {key: summary.get(key) or "No information provided." for key in _SUMMARY_KEYS}
+
+
+def rules_merge(stages, agent_data: dict) -> dict:
+    """
+    The merge JSON for parsed stages (stage_parser.StageRecord) and
+    {agent: data}. Callers check can_merge(agent_data) first.
+    """
+    agent_data = agent_data or {}
+    rows = _stage_rows(stages, agent_data)
+    aligned = {name: items_by_stage(agent_data.get(name), stages) for name in ACTIVITY_PRECEDENCE}
+    out_stages = []
+    hazard_stages = []
+    for i, row in enumerate(rows):
+        stage_items = {name: aligned[name][i] for name in ACTIVITY_PRECEDENCE}
+        hazard_stages.append((row["stage_name"], _hazards(stage_items)))
+        out_stages.append({**row, **_stage_advice(i, row, stage_items, agent_data)})
+    return {"stages": out_stages, "general_summary": _general_summary(agent_data, hazard_stages)}
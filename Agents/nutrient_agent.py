@@ -6,7 +6,9 @@ from soil import FarmerInput
 from soil import run_soil_agent
 from water import water_agent
 from weather import weather_7day_compact
-from llm_router import call_llm
+from llm_router import call_llm, acall_llm, answered_model
+from schemas import output_schema
+import asyncio
 
 load_dotenv()
 
@@ -74,26 +76,19 @@ nutrient_system_prompt= """You are the NUTRIENT PLANNER AGENT.
     FINAL CONFIDENCE: <0.0–1.0>
     -------------------------------------
     """
-def nutrient_agent(
+def _nutrient_inputs(
     farmer_input,
-    temperature: float = 0.2,
-    max_tokens: int = 2500,
     model: str = None,
     soil_text: str = None,
     water_text: str = None,
     weather_text: str = None,
     stages_text: str = None,
-    custom_prompt: str = None,
-    session_state=None,  # NEW: pass session_state
+    session_state=None,
     latitude: float = None,
     longitude: float = None,
-    save_to_db: bool = True,
     run_id: int = None,
-) -> Any:
-    """
-    Generate stage-wise nutrient management plan.
-    Uses cached data from session_state or database before making new API calls.
-    """
+) -> dict:
+    """Resolve soil/water/weather/stage inputs (session/DB first)."""
     from agent_helper import (
         get_or_fetch_soil, 
         get_or_fetch_water, 
@@ -101,6 +96,8 @@ def nutrient_agent(
         get_or_fetch_stage,
         extract_output_text
     )
+
+    soil_data = water_data = weather_data = stage_data = None
     
     # Fetch dependencies intelligently (checks session/DB first)
     if soil_text is None:
@@ -119,7 +116,7 @@ def nutrient_agent(
         weather_text = extract_output_text(weather_data)
     
     if stages_text is None:
-        stages_text = get_or_fetch_stage(
+        stage_data = get_or_fetch_stage(
             farmer_input, 
             session_state or {}, 
             model, 
@@ -130,9 +127,23 @@ def nutrient_agent(
             weather_data=weather_data,
             run_id=run_id,
         )
-        print("------------------------------get_or_fetch_stage",stages_text)
+        print("------------------------------get_or_fetch_stage",stage_data)
+        stages_text = extract_output_text(stage_data)
 
+    return {
+        'soil_text': soil_text,
+        'water_text': water_text,
+        'weather_text': weather_text,
+        'stages_text': stages_text,
+        'soil_data': soil_data,
+        'water_data': water_data,
+        'weather_data': weather_data,
+        'stage_data': stage_data,
+    }
 
+
+def _nutrient_request(farmer_input, inputs: dict, custom_prompt: str = None, model: str = None):
+    """Build (system_prompt, prompt, chosen_model) for the nutrient agent."""
     system_prompt = custom_prompt if custom_prompt else nutrient_system_prompt
     prompt = f"""
     {system_prompt}
@@ -155,16 +166,16 @@ def nutrient_agent(
     Last fertilizer date: {getattr(farmer_input, 'last_fertilizer_date', None)}
 
     GROWTH STAGES (from Stage Agent):
-    {stages_text}
+    {inputs['stages_text']}
 
     SOIL DATA (from Soil Agent):
-    {soil_text}
+    {inputs['soil_text']}
 
     WATER DATA (from Water Agent):
-    {water_text}
+    {inputs['water_text']}
 
     WEATHER DATA (from Weather Agent):
-    {weather_text}
+    {inputs['weather_text']}
 
     ---
     IMPORTANT:
@@ -178,42 +189,119 @@ def nutrient_agent(
     """
     
     chosen_model = model if model else MODEL_NAME
+    return system_prompt, prompt, chosen_model
+
+
+NUTRIENT_SPECIALIST_PROMPT = "You are an expert agricultural nutrient management specialist."
+
+
+def _save_nutrient_result(text_out, farmer_input, inputs: dict, chosen_model, system_prompt, save_to_db=True, run_id=None):
+    if save_to_db:
+        try:
+            from backend.init_db import SessionLocal
+            from backend.data_store import save_nutrient
+
+            def _id(data):
+                return data.get('id') if isinstance(data, dict) else None
+
+            with SessionLocal() as session:
+                obj = save_nutrient(session=session,crop_name=getattr(farmer_input, 'crop_name', None),crop_variety=getattr(farmer_input, 'crop_variety', None),
+                    location=getattr(farmer_input, 'location', None),
+                    area=getattr(farmer_input, 'area', None),
+                    stage_id=_id(inputs['stage_data']),
+                    soil_id=_id(inputs['soil_data']),
+                    water_id=_id(inputs['water_data']),
+                    weather_id=_id(inputs['weather_data']),
+                    model_name=answered_model([text_out], chosen_model),
+                    prompt=system_prompt,
+                    output=text_out,
+                    run_id=run_id,
+                )
+                return {'id': obj.id, 'output': text_out, 'data': getattr(text_out, 'data', None)}
+        except Exception as ex:
+            print(f"[nutrient_agent] Warning: Could not save to DB: {ex}")
+
+    return text_out
+
+
+def nutrient_agent(
+    farmer_input,
+    temperature: float = 0.2,
+    max_tokens: int = 2500,
+    model: str = None,
+    soil_text: str = None,
+    water_text: str = None,
+    weather_text: str = None,
+    stages_text: str = None,
+    custom_prompt: str = None,
+    session_state=None,  # NEW: pass session_state
+    latitude: float = None,
+    longitude: float = None,
+    save_to_db: bool = True,
+    run_id: int = None,
+) -> Any:
+    """
+    Generate stage-wise nutrient management plan.
+    Uses cached data from session_state or database before making new API calls.
+    """
+    inputs = _nutrient_inputs(
+        farmer_input, model, soil_text, water_text, weather_text, stages_text,
+        session_state, latitude, longitude, run_id,
+    )
+    system_prompt, prompt, chosen_model = _nutrient_request(farmer_input, inputs, custom_prompt, model)
     try:
         text_out = call_llm(
             model=chosen_model,
-            system_prompt="You are an expert agricultural nutrient management specialist.",
+            system_prompt=NUTRIENT_SPECIALIST_PROMPT,
             user_message=prompt,
             temperature=temperature,
             max_tokens=max_tokens,
+            agent="nutrient",
+            response_schema=output_schema("nutrient"),
         )
+        return _save_nutrient_result(text_out, farmer_input, inputs, chosen_model, system_prompt, save_to_db, run_id)
+    except Exception as e:
+        return f"Error generating nutrient plan: {e}"
+
 
-        if save_to_db:
-            try:
-                from backend.init_db import SessionLocal
-                from backend.data_store import save_nutrient
-
-                stage_id = stages_text.get('id') if isinstance(stages_text, dict) else None
-                soil_id = soil_data.get('id') if 'soil_data' in locals() and isinstance(soil_data, dict) else None
-                water_id = water_data.get('id') if 'water_data' in locals() and isinstance(water_data, dict) else None
-                weather_id = weather_data.get('id') if 'weather_data' in locals() and isinstance(weather_data, dict) else None
-
-                with SessionLocal() as session:
-                    obj = save_nutrient(session=session,crop_name=getattr(farmer_input, 'crop_name', None),crop_variety=getattr(farmer_input, 'crop_variety', None),
-                        location=getattr(farmer_input, 'location', None),
-                        area=getattr(farmer_input, 'area', None),
-                        stage_id=stage_id,
-                        soil_id=soil_id,
-                        water_id=water_id,
-                        weather_id=weather_id,
-                        model_name=chosen_model,
-                        prompt=system_prompt,
-                        output=text_out,
-                        run_id=run_id,
-                    )
-                    return {'id': obj.id, 'output': text_out}
-            except Exception as ex:
-                print(f"[nutrient_agent] Warning: Could not save to DB: {ex}")
-
-        return text_out
+async def anutrient_agent(
+    farmer_input,
+    temperature: float = 0.2,
+    max_tokens: int = 2500,
+    model: str = None,
+    soil_text: str = None,
+    water_text: str = None,
+    weather_text: str = None,
+    stages_text: str = None,
+    custom_prompt: str = None,
+    session_state=None,
+    latitude: float = None,
+    longitude: float = None,
+    save_to_db: bool = True,
+    run_id: int = None,
+) -> Any:
+    """
+    Async variant of nutrient_agent. Dependency lookups and the DB save run in
+    worker threads; the plan itself is generated with acall_llm.
+    """
+    inputs = await asyncio.to_thread(
+        _nutrient_inputs,
+        farmer_input, model, soil_text, water_text, weather_text, stages_text,
+        session_state, latitude, longitude, run_id,
+    )
+    system_prompt, prompt, chosen_model = _nutrient_request(farmer_input, inputs, custom_prompt, model)
+    try:
+        text_out = await acall_llm(
+            model=chosen_model,
+            system_prompt=NUTRIENT_SPECIALIST_PROMPT,
+            user_message=prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            agent="nutrient",
+            response_schema=output_schema("nutrient"),
+        )
+        return await asyncio.to_thread(
+            _save_nutrient_result, text_out, farmer_input, inputs, chosen_model, system_prompt, save_to_db, run_id
+        )
     except Exception as e:
         return f"Error generating nutrient plan: {e}"
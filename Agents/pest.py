@@ -1,7 +1,6 @@
 import os
 import json
 from typing import TypedDict, Optional, Literal, Dict, Any
-from datetime import datetime, date
 from dotenv import load_dotenv
 from together import Together
 from dataclasses import dataclass
@@ -9,8 +8,11 @@ from langgraph.graph import StateGraph
 from soil import FarmerInput, run_soil_agent
 from stage_agent import stage_generation
 from water import water_agent
-from weather import weather_7day_compact
-from llm_router import call_llm
+from weather import weather_7day_compact, weather_window, render_weather_window
+from stage_parser import parse_stage_plan, stages_for
+from llm_router import call_llm, acall_llm, fanout_concurrency, answered_model, LLMResult
+from schemas import output_schema, stage_results_data
+import asyncio
 
 
 load_dotenv()
@@ -101,8 +103,6 @@ Pest Agent - Simplified version
 
 # pest.py
 import os
-import re
-from datetime import datetime, date
 from dotenv import load_dotenv
 from together import Together
 from soil import FarmerInput
@@ -130,29 +130,23 @@ Also provide an overall risk level and short weather-based alerts.
 Keep language farmer-friendly and concise.
 """
 
-def pest_agent(
+def _pest_prepare(
     farmer_input: FarmerInput,
-    stages_data: str = None,
-    soil_data = None,
-    water_data = None,
-    weather_data = None,
+    stages_data=None,
+    soil_data=None,
+    water_data=None,
+    weather_data=None,
     session_state: dict = None,
     latitude: float = None,
     longitude: float = None,
     custom_prompt: str = None,
-    temperature: float = 0.2,
-    max_tokens: int = 1200,
     model: str = None,
-    save_to_db: bool = True,
-    run_id: int = None
+    run_id: int = None,
 ) -> dict:
     """
-    Pest agent:
-    - farmer_input: FarmerInput dataclass (location, crop_name, crop_variety, sowing_date, area, latitude, longitude)
-    - optional precomputed: stages_data, soil_data, water_data, weather_data
-    - returns: {"output": text, "id": db_id or None} or {"error": "..."}
+    Resolve dependencies, parse stages and build one (header, user_prompt) job
+    per stage. Returns {"error": ...} if the stage plan cannot be parsed.
     """
-
     # helper functions expected in repo (DB-first fetch helpers)
     try:
         from agent_helper import (
@@ -166,7 +160,7 @@ def pest_agent(
         return {"error": f"Missing agent_helper or helpers: {e}", "output": None, "id": None}
 
     chosen_model = model if model else MODEL_NAME
-    system_prompt = custom_prompt if custom_prompt else (session_state.get("custom_prompts", {}).get("pest") if session_state else Pest_system_prompt)
+    system_prompt = custom_prompt or (session_state.get("custom_prompts", {}).get("pest") if session_state else None) or Pest_system_prompt
 
     # 1) ensure dependent data exists (DB/session first) - only fetch if not provided
     if soil_data is None:
@@ -194,34 +188,36 @@ def pest_agent(
     weather_text = extract_output_text(weather_data)
     stages_text = extract_output_text(stages_data)
 
-    # 3) parse stages (robust regex)
-    stage_pattern = r"Stage\s*\d+[:：]\s*([^\n\r]+).*?Start Date[:：]?\s*(\d{4}-\d{2}-\d{2}).*?End Date[:：]?\s*(\d{4}-\d{2}-\d{2})"
-    matches = re.findall(stage_pattern, stages_text, flags=re.DOTALL | re.IGNORECASE)
-
-    if not matches:
-        # Try to detect CURRENT STAGE block as fallback
-        if "CURRENT STAGE:" in stages_text:
-            # Could parse current stage block differently; for now return informative result
-            return {"error": "Could not parse stage blocks; found CURRENT STAGE. Provide full stage plan for multi-stage pest forecast.", "output": None, "id": None}
+    # 3) parse stages (shared parser; falls back to rule-based stages, never to another LLM call)
+    if not parse_stage_plan(stages_text) and "CURRENT STAGE: Crop has already been harvested" in (stages_text or ""):
+        return {"error": "No active stage: Crop has already been harvested.", "output": None, "id": None}
+    weather_record = weather_data.get("data") if isinstance(weather_data, dict) else None
+    stages, stage_source = stages_for(stages_text, farmer_input, weather_record)
+    if not stages:
         return {"error": "Could not parse stages from stage agent output.", "output": None, "id": None}
-
-    results = []
-    for (stage_name, start_date, end_date) in matches:
-        # safe parsing of dates
-        try:
-            start_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
-            end_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
-            duration = (end_dt - start_dt).days + 1
-        except Exception:
-            start_dt = None
-            end_dt = None
-            duration = "unknown"
-
-        # prepare concise weather snapshot (first lines)
-        weather_snapshot = weather_text if isinstance(weather_text, str) else str(weather_text)
-        # trim long weather blocks to first ~10 lines
-        weather_lines = weather_snapshot.splitlines() if weather_snapshot else []
-        weather_snip = "\n".join(weather_lines[:10])
+    if stage_source != "parsed":
+        print(f"[pest] Warning: stage plan did not parse; using {stage_source} stages")
+
+    # prepare concise weather snapshot (first lines)
+    weather_snapshot = weather_text if isinstance(weather_text, str) else str(weather_text)
+    # trim long weather blocks to first ~10 lines
+    weather_lines = weather_snapshot.splitlines() if weather_snapshot else []
+    weather_snip = "\n".join(weather_lines[:10])
+
+    jobs = []
+    for stage in stages:
+        stage_name, duration = stage.name, stage.duration
+        start_date, end_date = stage.start.isoformat(), stage.end.isoformat()
+
+        stage_weather = weather_snip
+        if weather_record:
+            if weather_window(weather_record, start_date, end_date, fields=())["time"]:
+                stage_weather = render_weather_window(weather_record, start_date, end_date)
+            else:
+                forecast_days = weather_record.get("daily", {}).get("time", [])
+                stage_weather = "Stage is outside the forecast period; current outlook:\n" + render_weather_window(
+                    weather_record, end=forecast_days[min(2, len(forecast_days) - 1)] if forecast_days else None
+                )
 
         user_prompt = f"""
 Crop: {farmer_input.crop_name} ({farmer_input.crop_variety})
@@ -232,7 +228,7 @@ End: {end_date}
 Duration (days): {duration}
 
 Weather summary (short):
-{weather_snip}
+{stage_weather}
 
 Soil summary (short):
 {soil_text.splitlines()[:6] if soil_text else 'No soil data'}
@@ -250,32 +246,37 @@ List top 2-4 likely pests for this crop-stage-weather combination. For each pest
 - Chemical control (brief guidance ONLY if risk is High; safe dose/time)
 Also give an overall risk level for this stage and short weather-based alerts. Keep it concise and farmer-friendly.
 """
-
-        # call model
-        try:
-            text = call_llm(
-                model=chosen_model,
-                system_prompt=system_prompt,
-                user_message=user_prompt,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            header = f"--- Pest Risk for {stage_name} ({start_date} to {end_date}) ---"
-            results.append(header + "\n" + text)
-
-        except Exception as e:
-            results.append(f"Error generating pest assessment for stage {stage_name}: {e}")
-
+        header = f"--- Pest Risk for {stage_name} ({start_date} to {end_date}) ---"
+        jobs.append((stage_name, header, user_prompt))
+
+    return {
+        "chosen_model": chosen_model,
+        "system_prompt": system_prompt,
+        "jobs": jobs,
+        "stages": stages,
+        "stages_data": stages_data,
+        "soil_data": soil_data,
+        "water_data": water_data,
+        "weather_data": weather_data,
+    }
+
+
+def _pest_finish(farmer_input: FarmerInput, prepared: dict, results: list, save_to_db: bool = True, run_id: int = None) -> dict:
     if not results:
         return {"error": "No stage assessments generated", "output": None, "id": None}
 
     final_text = "\n\n".join(results)
+    data = stage_results_data(prepared["stages"], results)
 
     # 4) Save to DB if requested (ensure save_pest exists)
     if save_to_db:
         try:
             from backend.init_db import SessionLocal
             from backend.data_store import save_pest
+            stages_data = prepared["stages_data"]
+            soil_data = prepared["soil_data"]
+            water_data = prepared["water_data"]
+            weather_data = prepared["weather_data"]
             with SessionLocal() as session:
                 out = final_text if isinstance(final_text, str) else str(final_text)
                 stage_id = stages_data.get('id') if isinstance(stages_data, dict) else None
@@ -292,14 +293,120 @@ Also give an overall risk level for this stage and short weather-based alerts. K
                     soil_id=soil_id,
                     water_id=water_id,
                     weather_id=weather_id,
-                    model_name=chosen_model,
-                    prompt=system_prompt,
+                    model_name=answered_model(results, prepared["chosen_model"]),
+                    prompt=prepared["system_prompt"],
                     output=out,
                     run_id=run_id,
                 )
-                return {"output": out, "id": pest_row.id}
+                return {"output": out, "id": pest_row.id, "data": data}
         except Exception as db_ex:
             print("[pest_agent] DB save warning:", db_ex)
-            return {"output": final_text, "id": None}
+            return {"output": final_text, "id": None, "data": data}
+
+    return {"output": final_text, "id": None, "data": data}
+
+
+def pest_agent(
+    farmer_input: FarmerInput,
+    stages_data: str = None,
+    soil_data = None,
+    water_data = None,
+    weather_data = None,
+    session_state: dict = None,
+    latitude: float = None,
+    longitude: float = None,
+    custom_prompt: str = None,
+    temperature: float = 0.2,
+    max_tokens: int = 1200,
+    model: str = None,
+    save_to_db: bool = True,
+    run_id: int = None,
+    max_concurrency: int = None
+) -> dict:
+    """
+    Pest agent:
+    - farmer_input: FarmerInput dataclass (location, crop_name, crop_variety, sowing_date, area, latitude, longitude)
+    - optional precomputed: stages_data, soil_data, water_data, weather_data
+    - max_concurrency: parallel per-stage LLM calls (None = provider default, 1 = serial)
+    - returns: {"output": text, "id": db_id or None} or {"error": "..."}
+    """
+    from agent_helper import map_bounded
+
+    prepared = _pest_prepare(
+        farmer_input, stages_data, soil_data, water_data, weather_data,
+        session_state, latitude, longitude, custom_prompt, model, run_id,
+    )
+    if "error" in prepared:
+        return prepared
+
+    def _assess_stage(job):
+        stage_name, header, user_prompt = job
+        # call model
+        try:
+            text = call_llm(
+                model=prepared["chosen_model"],
+                system_prompt=prepared["system_prompt"],
+                user_message=user_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                agent="pest",
+                response_schema=output_schema("pest"),
+            )
+            return LLMResult(header + "\n" + text, getattr(text, "model", None), data=getattr(text, "data", None))
+        except Exception as e:
+            return f"Error generating pest assessment for stage {stage_name}: {e}"
+
+    # per-stage calls are independent; fan them out (results keep stage order)
+    results = map_bounded(_assess_stage, prepared["jobs"], fanout_concurrency(prepared["chosen_model"], max_concurrency))
+    return _pest_finish(farmer_input, prepared, results, save_to_db, run_id)
+
+
+async def apest_agent(
+    farmer_input: FarmerInput,
+    stages_data: str = None,
+    soil_data = None,
+    water_data = None,
+    weather_data = None,
+    session_state: dict = None,
+    latitude: float = None,
+    longitude: float = None,
+    custom_prompt: str = None,
+    temperature: float = 0.2,
+    max_tokens: int = 1200,
+    model: str = None,
+    save_to_db: bool = True,
+    run_id: int = None,
+    max_concurrency: int = None
+) -> dict:
+    """
+    Async variant of pest_agent. Per-stage calls use acall_llm and run
+    concurrently (bounded by max_concurrency); lookups and saves run in threads.
+    """
+    from agent_helper import amap_bounded
+
+    prepared = await asyncio.to_thread(
+        _pest_prepare,
+        farmer_input, stages_data, soil_data, water_data, weather_data,
+        session_state, latitude, longitude, custom_prompt, model, run_id,
+    )
+    if "error" in prepared:
+        return prepared
+
+    async def _assess_stage(job):
+        stage_name, header, user_prompt = job
+        try:
+            text = await acall_llm(
+                model=prepared["chosen_model"],
+                system_prompt=prepared["system_prompt"],
+                user_message=user_prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                agent="pest",
+                response_schema=output_schema("pest"),
+            )
+            return LLMResult(header + "\n" + text, getattr(text, "model", None), data=getattr(text, "data", None))
+        except Exception as e:
+            return f"Error generating pest assessment for stage {stage_name}: {e}"
 
-    return {"output": final_text, "id": None}
+    results = await amap_bounded(_assess_stage, prepared["jobs"], fanout_concurrency(prepared["chosen_model"], max_concurrency))
+    return await asyncio.to_thread(_pest_finish, farmer_input, prepared, results, save_to_db, run_id)
@@ -0,0 +1,247 @@
+"""
+Rule-based growth-stage planner for crops with known thermal-time tables.
+
+Each stage ends when growing degree days (GDD) accumulated since sowing reach
+the stage's threshold in CROP_PHENOLOGY. Daily GDD comes from observed weather
+(weather_history) up to yesterday, then the forecast in the weather record,
+and beyond that the mean of the known days (or the crop's typical daily GDD
+when there is no weather at all).
+
+stage_plan() returns the same "GROWTH STAGE PLAN" text the LLM stage planner
+produces, so parse_stage_plan_and_current_stage and the downstream agents
+read it unchanged. Crops not in the table return None and the caller falls
+back to the LLM.
+"""
+
+import os
+from datetime import date, datetime, timedelta
+
+from llm_router import LLMResult
+from weather_history import gdd_temps, daily_gdd
+
+PHENOLOGY_ENABLED = os.getenv("PHENOLOGY_ENABLED", "1").lower() not in ("0", "false", "no")
+# Observed weather needs the archive; turn off to plan from forecast + typical values only
+PHENOLOGY_USE_HISTORY = os.getenv("PHENOLOGY_USE_HISTORY", "1").lower() not in ("0", "false", "no")
+
+# crop -> [(stage name, cumulative GDD at the end of the stage)], base/upper
+# temperatures as in weather_history.CROP_GDD_TEMPS
+CROP_PHENOLOGY = {
+    "wheat": [
+        ("Germination & Emergence", 150),
+        ("Crown Root Initiation", 350),
+        ("Tillering", 650),
+        ("Jointing", 900),
+        ("Booting", 1100),
+        ("Heading & Flowering", 1300),
+        ("Grain Filling", 1750),
+        ("Maturity", 1950),
+    ],
+    "rice": [
+        ("Germination & Seedling", 200),
+        ("Tillering", 700),
+        ("Panicle Initiation", 950),
+        ("Booting", 1150),
+        ("Heading & Flowering", 1350),
+        ("Grain Filling", 1750),
+        ("Maturity", 1950),
+    ],
+    "maize": [
+        ("Emergence", 120),
+        ("Vegetative Growth", 700),
+        ("Tasseling", 800),
+        ("Silking", 900),
+        ("Grain Filling", 1400),
+        ("Physiological Maturity", 1550),
+    ],
+    "soybean": [
+        ("Emergence", 130),
+        ("Vegetative Growth", 550),
+        ("Flowering", 800),
+        ("Pod Development", 1050),
+        ("Seed Filling", 1400),
+        ("Maturity", 1600),
+    ],
+}
+CROP_ALIASES = {"paddy": "rice", "corn": "maize", "soya": "soybean", "soyabean": "soybean"}
+
+# GDD per day used when no weather is available at all
+CROP_TYPICAL_DAILY_GDD = {"wheat": 14.0, "rice": 17.0, "maize": 16.0, "soybean": 15.0}
+
+# words in the variety name -> thermal-time multiplier
+VARIETY_SCALE = {"early": 0.9, "short": 0.9, "late": 1.1, "long": 1.1}
+
+# A plan never runs longer than this, whatever the temperatures
+MAX_SEASON_DAYS = 300
+
+
+def crop_key(crop_name: str):
+    name = (crop_name or "").strip().lower()
+    name = CROP_ALIASES.get(name, name)
+    return name if name in CROP_PHENOLOGY else None
+
+
+def covers(crop_name: str) -> bool:
+    """True when stage_plan() can plan this crop without the LLM."""
+    return PHENOLOGY_ENABLED and crop_key(crop_name) is not None
+
+
+def _variety_scale(crop_variety: str) -> float:
+    words = (crop_variety or "").lower().replace("-", " ").split()
+    for word, scale in VARIETY_SCALE.items():
+        if word in words:
+            return scale
+    return 1.0
+
+
+def _parse_date(value):
+    if isinstance(value, date):
+        return value
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(str(value), fmt).date()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _daily_series(crop: str, sowing: date, latitude, longitude, weather_record):
+    """day -> (gdd, source) for the observed and forecast days we have."""
+    base, upper = gdd_temps(crop)
+    series = {}
+    yesterday = date.today() - timedelta(days=1)
+    if PHENOLOGY_USE_HISTORY and latitude is not None and longitude is not None and sowing <= yesterday:
+        try:
+            from weather_history import ensure_history
+            for obs in ensure_history(latitude, longitude, sowing, yesterday):
+                gdd = daily_gdd(obs["tmin"], obs["tmax"], base, upper)
+                if gdd is not None:
+                    series[obs["day"]] = (gdd, "observed")
+        except Exception as ex:
+            print(f"[phenology] Warning: weather history unavailable: {ex}")
+    daily = (weather_record or {}).get("daily") or {}
+    for d, tmin, tmax in zip(daily.get("time", []), daily.get("tmin", []), daily.get("tmax", [])):
+        day = _parse_date(d)
+        gdd = daily_gdd(tmin, tmax, base, upper)
+        if day is not None and gdd is not None and day not in series:
+            series[day] = (gdd, "forecast")
+    return series
+
+
+def _fill_gdd(crop: str, series: dict) -> float:
+    """Daily GDD assumed for days without weather: mean of the last 14 known days."""
+    known = [series[d][0] for d in sorted(series)][-14:]
+    fill = sum(known) / len(known) if known else CROP_TYPICAL_DAILY_GDD.get(crop, 15.0)
+    return max(fill, 1.0)
+
+
+def cumulative_gdd(crop_name: str, sowing_date, days, latitude: float = None, longitude: float = None, weather_record: dict = None):
+    """
+    Expected GDD accumulated from sowing through the end of each of `days`,
+    with the same weather sources as stage_plan(). Works for any crop (the
+    base temperature falls back to weather_history.DEFAULT_GDD_TEMPS).
+    """
+    crop = crop_key(crop_name) or (crop_name or "").strip().lower()
+    sowing = _parse_date(sowing_date)
+    days = [_parse_date(d) for d in days]
+    if sowing is None or not days:
+        return [None] * len(days)
+    series = _daily_series(crop, sowing, latitude, longitude, weather_record)
+    fill = _fill_gdd(crop, series)
+    last = max(d for d in days if d is not None)
+    totals = {}
+    total = 0.0
+    day = sowing
+    while day <= last:
+        total += series.get(day, (fill, "typical"))[0]
+        totals[day] = total
+        day += timedelta(days=1)
+    return [None if d is None else (0.0 if d < sowing else round(totals[d], 1)) for d in days]
+
+
+def _stages(crop: str, sowing: date, scale: float, series: dict):
+    """[(name, start, end, sources)] by walking days until each threshold is reached."""
+    fill = _fill_gdd(crop, series)
+
+    stages = []
+    total = 0.0
+    day = sowing
+    start = sowing
+    sources = set()
+    for name, threshold in CROP_PHENOLOGY[crop]:
+        threshold *= scale
+        while total < threshold and (day - sowing).days < MAX_SEASON_DAYS:
+            gdd, source = series.get(day, (fill, "typical"))
+            total += gdd
+            sources.add(source)
+            day += timedelta(days=1)
+        end = max(start, day - timedelta(days=1))
+        stages.append((name, start, end, sources))
+        start, sources = end + timedelta(days=1), set()
+        day = max(day, start)
+    return stages
+
+
+def _confidence(sources) -> float:
+    if not sources or "typical" in sources:
+        return 0.70
+    return 0.85 if sources == {"observed"} else 0.80
+
+
+def stage_plan(farmer_input, weather_record: dict = None, latitude: float = None, longitude: float = None):
+    """
+    Stage plan text for farmer_input, or None when the crop is not covered or
+    the sowing date cannot be parsed. weather_record is the structured record
+    from weather_7day_compact (its location is used when latitude/longitude
+    are not given).
+    """
+    crop = crop_key(getattr(farmer_input, "crop_name", None))
+    sowing = _parse_date(getattr(farmer_input, "sowing_date", None))
+    if not PHENOLOGY_ENABLED or crop is None or sowing is None:
+        return None
+
+    location = (weather_record or {}).get("location") or {}
+    if latitude is None or longitude is None:
+        latitude, longitude = location.get("latitude"), location.get("longitude")
+    base, upper = gdd_temps(crop)
+    scale = _variety_scale(getattr(farmer_input, "crop_variety", ""))
+    series = _daily_series(crop, sowing, latitude, longitude, weather_record)
+    stages = _stages(crop, sowing, scale, series)
+
+    rule = "━" * 44
+    lines = [
+        f"Location: {farmer_input.location}",
+        f"Crop: {farmer_input.crop_name}",
+        f"Sowing Date: {sowing.isoformat()}",
+        "",
+        "GROWTH STAGE PLAN:",
+        rule,
+        "",
+    ]
+    previous = 0
+    for i, (name, start, end, sources) in enumerate(stages, 1):
+        threshold = CROP_PHENOLOGY[crop][i - 1][1] * scale
+        lines += [
+            f"Stage {i}: {name}",
+            f"├─ Start Date: {start.isoformat()}",
+            f"├─ End Date: {end.isoformat()}",
+            f"├─ Duration: {(end - start).days + 1} days",
+            f"├─ Confidence: {_confidence(sources):.2f}",
+            f"└─ Key Factors: {previous:.0f}-{threshold:.0f} GDD (base {base:g}°C); {', '.join(sorted(sources)) or 'typical'} temperatures",
+            "",
+        ]
+        previous = threshold
+    harvest = stages[-1][2]
+    all_sources = set().union(*(s[3] for s in stages))
+    lines += [
+        rule,
+        f"TOTAL CROP DURATION: {(harvest - sowing).days + 1} days",
+        f"EXPECTED HARVEST DATE: {harvest.isoformat()}",
+        f"OVERALL CONFIDENCE: {_confidence(all_sources):.2f}",
+        "",
+        "CRITICAL ASSUMPTIONS:",
+        f"- Stages computed from thermal time: GDD base {base:g}°C, upper cutoff {upper:g}°C",
+        "- Days without observed or forecast weather use the recent mean daily GDD (or the crop's typical value)",
+    ]
+    if scale != 1.0:
+        lines.append(f"- Variety '{farmer_input.crop_variety}' scaled to {scale:.0%} of the standard thermal time")
+    return LLMResult("\n".join(lines) + "\n", model="phenology", provider="rules")
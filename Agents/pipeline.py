@@ -0,0 +1,354 @@
+"""
+Dependency-graph executor for the full advisory pipeline ("Run All Agents").
+
+The graph is declared once in PIPELINE_NODES. Nodes whose dependencies are
+satisfied run concurrently on a thread pool, every node runs under the same
+run_id, and per-node timings are reported so the critical path is visible.
+"""
+
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# node -> direct dependencies (every input a node reads, even when another
+# dependency already implies it: node_dependencies() may drop stage's soil/water)
+PIPELINE_NODES = {
+    'soil': [],
+    'water': [],
+    'weather': [],
+    'stage': ['soil', 'water', 'weather'],
+    'nutrient': ['stage', 'soil', 'water'],
+    'pest': ['stage', 'soil', 'water'],
+    'disease': ['stage', 'soil'],
+    'irrigation': ['stage', 'soil', 'water'],
+    'merge': ['soil', 'weather', 'stage', 'nutrient', 'pest', 'disease', 'irrigation'],
+}
+
+
+def _output_text(value):
+    if isinstance(value, dict) and 'output' in value:
+        return value.get('output')
+    return value
+
+
+def _run_soil(ctx):
+    from soil import run_soil_agent
+    fi = ctx['farmer_input']
+    return run_soil_agent(
+        location=fi.location,
+        crop_name=fi.crop_name,
+        crop_variety=fi.crop_variety,
+        sowing_date=fi.sowing_date,
+        area=fi.area,
+        latitude=ctx['latitude'],
+        longitude=ctx['longitude'],
+        soil_type="",
+        custom_prompt=ctx['custom_prompts'].get('soil'),
+        model=ctx['model'],
+        temperature=ctx['temperature'],
+        max_tokens=ctx['max_tokens'],
+        run_id=ctx['run_id'],
+    )
+
+
+def _run_water(ctx):
+    from water import water_agent
+    return water_agent(
+        ctx['farmer_input'],
+        custom_prompt=ctx['custom_prompts'].get('water'),
+        model=ctx['model'],
+        temperature=ctx['temperature'],
+        max_tokens=ctx['max_tokens'],
+        run_id=ctx['run_id'],
+    )
+
+
+def _run_weather(ctx):
+    from weather import weather_7day_compact
+    fi = ctx['farmer_input']
+    return weather_7day_compact(
+        location=fi.location,
+        latitude=ctx['latitude'],
+        longitude=ctx['longitude'],
+        days=7,
+        save_to_db=True,
+        model_name=ctx['model'] or "",
+        crop_name=fi.crop_name,
+        run_id=ctx['run_id'],
+    )
+
+
+def _run_stage(ctx):
+    from stage_agent import stage_generation
+    return stage_generation(
+        ctx['farmer_input'],
+        model=ctx['model'],
+        temperature=ctx['temperature'],
+        max_tokens=ctx['max_tokens'],
+        latitude=ctx['latitude'],
+        longitude=ctx['longitude'],
+        session_state=ctx['session_state'],
+        run_id=ctx['run_id'],
+    )
+
+
+def _run_nutrient(ctx):
+    from nutrient_agent import nutrient_agent
+    return nutrient_agent(
+        ctx['farmer_input'],
+        custom_prompt=ctx['custom_prompts'].get('nutrient'),
+        model=ctx['model'],
+        temperature=ctx['temperature'],
+        max_tokens=ctx['max_tokens'],
+        session_state=ctx['session_state'],
+        latitude=ctx['latitude'],
+        longitude=ctx['longitude'],
+        run_id=ctx['run_id'],
+    )
+
+
+def _run_pest(ctx):
+    from pest import pest_agent
+    return pest_agent(
+        ctx['farmer_input'],
+        custom_prompt=ctx['custom_prompts'].get('pest'),
+        model=ctx['model'],
+        temperature=ctx['temperature'],
+        max_tokens=ctx['max_tokens'],
+        session_state=ctx['session_state'],
+        latitude=ctx['latitude'],
+        longitude=ctx['longitude'],
+        run_id=ctx['run_id'],
+    )
+
+
+def _run_disease(ctx):
+    from disease import disease_agent
+    return disease_agent(
+        ctx['farmer_input'],
+        custom_prompt=ctx['custom_prompts'].get('disease'),
+        model=ctx['model'],
+        temperature=ctx['temperature'],
+        max_tokens=ctx['max_tokens'],
+        session_state=ctx['session_state'],
+        latitude=ctx['latitude'],
+        longitude=ctx['longitude'],
+        run_id=ctx['run_id'],
+    )
+
+
+def _run_irrigation(ctx):
+    from irrigation import irrigation_agent
+    return irrigation_agent(
+        ctx['farmer_input'],
+        custom_prompt=ctx['custom_prompts'].get('irrigation'),
+        model_name=ctx['model'],
+        temperature=ctx['temperature'],
+        max_tokens=ctx['max_tokens'],
+        session_state=ctx['session_state'],
+        latitude=ctx['latitude'],
+        longitude=ctx['longitude'],
+        run_id=ctx['run_id'],
+    )
+
+
+def _run_merge(ctx):
+    from merge_agent import merge_agent
+    outputs = ctx['session_state'].get('agent_outputs', {})
+    texts = {name: _output_text(outputs.get(name)) for name in PIPELINE_NODES['merge']}
+    # structured outputs let the map-reduce merge slice reports by stage
+    agent_data = {
+        name: outputs[name].get('data')
+        for name in PIPELINE_NODES['merge'] if isinstance(outputs.get(name), dict)
+    }
+    prompt = ctx['custom_prompts'].get('merge')
+    output = merge_agent(
+        **texts,
+        agent_data=agent_data,
+        custom_prompt=prompt,
+        model_name=ctx['model'],
+        temperature=ctx['temperature'],
+        max_tokens=ctx['max_tokens'],
+    )
+    try:
+        from backend.init_db import SessionLocal
+        from backend.data_store import save_merge
+        from llm_router import answered_model
+        with SessionLocal() as session:
+            save_merge(
+                session,
+                model_name=answered_model([output], ctx['model']),
+                prompt=prompt,
+                output=output,
+                run_id=ctx['run_id'],
+                **texts,
+            )
+    except Exception as ex:
+        print(f"[run_pipeline] Warning: Could not save merge to DB: {ex}")
+    return output
+
+
+NODE_RUNNERS = {
+    'soil': _run_soil,
+    'water': _run_water,
+    'weather': _run_weather,
+    'stage': _run_stage,
+    'nutrient': _run_nutrient,
+    'pest': _run_pest,
+    'disease': _run_disease,
+    'irrigation': _run_irrigation,
+    'merge': _run_merge,
+}
+
+
+def node_dependencies(name: str, ctx: dict) -> list:
+    """PIPELINE_NODES[name], minus inputs the node will not use in this run."""
+    deps = PIPELINE_NODES[name]
+    if name == 'stage' and not ctx['custom_prompts'].get('stage'):
+        from phenology import covers
+        if covers(getattr(ctx['farmer_input'], 'crop_name', None)):
+            # the rule-based stage planner only needs the weather
+            deps = ['weather']
+    return deps
+
+
+def critical_path(timings: dict, graph: dict = None) -> list:
+    """
+    Walk back from the last node to finish, always following the dependency
+    that finished last. Returns node names in execution order.
+    """
+    graph = graph or PIPELINE_NODES
+    finished = {n: t for n, t in timings.items() if t.get('finished_at') is not None}
+    if not finished:
+        return []
+    node = max(finished, key=lambda n: finished[n]['finished_at'])
+    path = [node]
+    while True:
+        deps = [d for d in graph.get(node, []) if d in finished]
+        if not deps:
+            break
+        node = max(deps, key=lambda d: finished[d]['finished_at'])
+        path.append(node)
+    return list(reversed(path))
+
+
+def run_pipeline(
+    farmer_input,
+    model: str = None,
+    temperature: float = 0.2,
+    max_tokens: int = 1500,
+    custom_prompts: dict = None,
+    latitude: float = None,
+    longitude: float = None,
+    run_id: int = None,
+    session_state: dict = None,
+    nodes: list = None,
+    max_workers: int = 4,
+    on_node_done=None,
+    bypass_cache: bool = False,
+) -> dict:
+    """
+    Run the advisory pipeline as a dependency graph.
+
+    Args:
+        farmer_input: FarmerInput for the farm
+        session_state: plain dict shared by all nodes (agent_outputs is filled
+            as nodes finish so downstream agents hit it instead of re-fetching).
+            Do not pass Streamlit's session_state; it is not thread-safe.
+        nodes: subset of PIPELINE_NODES to run (dependencies outside the subset
+            are treated as already satisfied)
+        max_workers: thread pool size; 1 gives the old sequential behaviour
+        on_node_done: optional callback(name, timing) invoked as nodes finish
+        bypass_cache: skip LLM cache reads so every agent gives a fresh answer
+
+    Returns:
+        dict with 'run_id', 'outputs', 'timings', 'critical_path',
+        'total_seconds' and 'errors'
+    """
+    selected = list(nodes) if nodes else list(PIPELINE_NODES)
+    unknown = [n for n in selected if n not in PIPELINE_NODES]
+    if unknown:
+        raise ValueError(f"Unknown pipeline nodes: {unknown}")
+
+    if session_state is None:
+        session_state = {}
+    session_state.setdefault('agent_outputs', {})
+    if custom_prompts is None:
+        custom_prompts = session_state.get('custom_prompts') or {}
+    session_state.setdefault('custom_prompts', custom_prompts)
+
+    ctx = {
+        'farmer_input': farmer_input,
+        'model': model,
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+        'custom_prompts': custom_prompts,
+        'latitude': latitude if latitude is not None else getattr(farmer_input, 'latitude', None),
+        'longitude': longitude if longitude is not None else getattr(farmer_input, 'longitude', None),
+        'run_id': run_id,
+        'session_state': session_state,
+    }
+
+    graph = {n: node_dependencies(n, ctx) for n in PIPELINE_NODES}
+    pending = {n: [d for d in graph[n] if d in selected] for n in selected}
+    done = set()
+    outputs = {}
+    timings = {}
+    errors = {}
+    t0 = time.perf_counter()
+
+    def _execute(name):
+        from llm_cache import fresh_answers, is_bypassed
+        start = time.perf_counter()
+        try:
+            with fresh_answers(is_bypassed(bypass_cache)):
+                result = NODE_RUNNERS[name](ctx)
+            error = None
+        except Exception as e:
+            result = f"Error in {name} agent: {e}"
+            error = str(e)
+        end = time.perf_counter()
+        return name, result, error, start - t0, end - t0
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        running = {}
+        while pending or running:
+            ready = [n for n, deps in pending.items() if all(d in done for d in deps)]
+            for name in ready:
+                del pending[name]
+                running[pool.submit(contextvars.copy_context().run, _execute, name)] = name
+
+            if not running:
+                # Only possible with a cyclic graph
+                raise RuntimeError(f"Pipeline stalled; unresolved nodes: {list(pending)}")
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                del running[fut]
+                name, result, error, started_at, finished_at = fut.result()
+                outputs[name] = result
+                session_state['agent_outputs'][name] = result
+                timings[name] = {
+                    'started_at': round(started_at, 3),
+                    'finished_at': round(finished_at, 3),
+                    'duration': round(finished_at - started_at, 3),
+                    'status': 'error' if error else 'ok',
+                }
+                if error:
+                    errors[name] = error
+                done.add(name)
+                print(f"[run_pipeline] {name} finished in {timings[name]['duration']:.2f}s")
+                if on_node_done:
+                    try:
+                        on_node_done(name, timings[name])
+                    except Exception:
+                        pass
+
+    return {
+        'run_id': run_id,
+        'outputs': outputs,
+        'timings': timings,
+        'critical_path': critical_path(timings, graph),
+        'total_seconds': round(time.perf_counter() - t0, 3),
+        'errors': errors,
+    }
@@ -0,0 +1,529 @@
+"""
+Declared output schemas for the agents, and the local JSON validator/repair.
+
+Each agent's answer has a JSON Schema in AGENT_SCHEMAS. Agents listed in
+STRUCTURED_OUTPUTS pass it to call_llm(response_schema=...), which asks the
+provider for JSON (native JSON / schema mode where the provider has one, the
+schema instruction in the system prompt everywhere) and then runs repair()
+once on the answer:
+
+- markdown fences and text around the JSON are dropped; trailing commas,
+  smart quotes, Python literals and truncated output are fixed;
+- the value is coerced to the schema: keys matched case/space-insensitively,
+  missing required fields filled with empty values, scalars wrapped in lists,
+  numbers pulled out of strings.
+
+A bad answer is therefore repaired in one pass instead of being generated
+again. call_llm returns render()'s text (so existing post-processing and the
+UI see a report) with the parsed object on `.data`; agents put it in their
+result dicts under 'data'.
+"""
+
+import os
+import re
+import json
+import math
+
+# Comma-separated agents that request structured (JSON) answers, or "all".
+# The merge agent already answers in JSON, so it is on by default.
+STRUCTURED_OUTPUTS = os.getenv("STRUCTURED_OUTPUTS", "merge")
+
+_STRINGS = {"type": "array", "items": {"type": "string"}}
+_NUMBER = {"type": ["number", "null"]}
+
+
+def _stage_list(**item_properties):
+    return {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {"stage_name": {"type": "string"}, **item_properties},
+            "required": ["stage_name", *item_properties],
+        },
+    }
+
+
+def _risks(name):
+    return {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "risk": {"type": "string", "enum": ["LOW", "MEDIUM", "HIGH", "CRITICAL"]},
+                "symptoms": {"type": "string"},
+                "action": {"type": "string"},
+            },
+            "required": ["name", "risk", "action"],
+        },
+        "description": f"{name} expected in this stage",
+    }
+
+
+AGENT_SCHEMAS = {
+    "soil": {
+        "title": "soil",
+        "type": "object",
+        "properties": {
+            "soil_type": {"type": "string"},
+            "texture": {"type": "string"},
+            "ph": _NUMBER,
+            "organic_carbon_pct": _NUMBER,
+            "nitrogen_kg_ha": _NUMBER,
+            "phosphorus_kg_ha": _NUMBER,
+            "potassium_kg_ha": _NUMBER,
+            "drainage": {"type": "string"},
+            "constraints": _STRINGS,
+            "recommendations": _STRINGS,
+            "summary": {"type": "string"},
+        },
+        "required": ["soil_type", "ph", "recommendations", "summary"],
+    },
+    "water": {
+        "title": "water",
+        "type": "object",
+        "properties": {
+            "source": {"type": "string"},
+            "availability": {"type": "string"},
+            "quality": {"type": "string"},
+            "seasonal_rainfall_mm": _NUMBER,
+            "constraints": _STRINGS,
+            "recommendations": _STRINGS,
+            "summary": {"type": "string"},
+        },
+        "required": ["availability", "quality", "summary"],
+    },
+    "stage": {
+        "title": "stage",
+        "type": "object",
+        "x-render": "stage_plan",
+        "properties": {
+            "location": {"type": "string"},
+            "crop": {"type": "string"},
+            "sowing_date": {"type": "string"},
+            "stages": _stage_list(
+                start_date={"type": "string", "description": "YYYY-MM-DD"},
+                end_date={"type": "string", "description": "YYYY-MM-DD"},
+                duration_days={"type": ["integer", "null"]},
+                confidence=_NUMBER,
+                key_factors={"type": "string"},
+            ),
+            "expected_harvest_date": {"type": "string"},
+            "overall_confidence": _NUMBER,
+            "assumptions": _STRINGS,
+            "alerts": _STRINGS,
+        },
+        "required": ["stages"],
+    },
+    "nutrient": {
+        "title": "nutrient",
+        "type": "object",
+        "properties": {
+            "total_n_kg_ha": _NUMBER,
+            "total_p_kg_ha": _NUMBER,
+            "total_k_kg_ha": _NUMBER,
+            "micronutrients": _STRINGS,
+            "stages": _stage_list(applications=_STRINGS),
+            "summary": {"type": "string"},
+        },
+        "required": ["stages", "summary"],
+    },
+    "irrigation": {
+        "title": "irrigation",
+        "type": "object",
+        "properties": {
+            "total_water_mm": _NUMBER,
+            "method": {"type": "string"},
+            "stages": _stage_list(irrigations=_STRINGS),
+            "alerts": _STRINGS,
+            "summary": {"type": "string"},
+        },
+        "required": ["stages", "summary"],
+    },
+    # pest and disease are asked once per stage
+    "pest": {
+        "title": "pest",
+        "type": "object",
+        "properties": {
+            "stage_name": {"type": "string"},
+            "pests": _risks("Pests"),
+            "alerts": _STRINGS,
+            "summary": {"type": "string"},
+        },
+        "required": ["pests", "summary"],
+    },
+    "disease": {
+        "title": "disease",
+        "type": "object",
+        "properties": {
+            "stage_name": {"type": "string"},
+            "diseases": _risks("Diseases"),
+            "alerts": _STRINGS,
+            "summary": {"type": "string"},
+        },
+        "required": ["diseases", "summary"],
+    },
+    "merge": {
+        "title": "merge",
+        "type": "object",
+        "x-render": "json",
+        "properties": {
+            "stages": _stage_list(
+                start_date={"type": "string"},
+                end_date={"type": "string"},
+                duration_days={"type": ["integer", "null"]},
+                activities=_STRINGS,
+                tips=_STRINGS,
+                alerts=_STRINGS,
+            ),
+            "general_summary": {
+                "type": "object",
+                "properties": {
+                    name: {"type": "string"}
+                    for name in ("soil", "nutrient", "irrigation", "weather", "pest", "disease")
+                },
+                "required": ["soil", "nutrient", "irrigation", "weather", "pest", "disease"],
+            },
+        },
+        "required": ["stages", "general_summary"],
+    },
+    # map-reduce merge (merge_agent.MERGE_MODE=map_reduce): one call per stage, one for the summary
+    "merge_stage": {
+        "title": "merge_stage",
+        "type": "object",
+        "x-render": "json",
+        "properties": {"activities": _STRINGS, "tips": _STRINGS, "alerts": _STRINGS},
+        "required": ["activities", "tips", "alerts"],
+    },
+    "merge_summary": {
+        "title": "merge_summary",
+        "type": "object",
+        "x-render": "json",
+        "properties": {
+            name: {"type": "string"}
+            for name in ("soil", "nutrient", "irrigation", "weather", "pest", "disease")
+        },
+        "required": ["soil", "nutrient", "irrigation", "weather", "pest", "disease"],
+    },
+}
+
+SCHEMA_INSTRUCTION = (
+    "\n\nOUTPUT FORMAT OVERRIDE: respond with ONE JSON object (no markdown, no text "
+    "before or after it) that matches this JSON Schema, instead of any text layout "
+    "given in the instructions. Keep every value short and specific.\n"
+)
+
+
+def structured_enabled(agent: str) -> bool:
+    names = {n.strip().lower() for n in STRUCTURED_OUTPUTS.split(",") if n.strip()}
+    return "all" in names or agent in names
+
+
+def output_schema(agent: str):
+    """The agent's schema when it should answer in JSON, else None (free text)."""
+    return AGENT_SCHEMAS.get(agent) if structured_enabled(agent) else None
+
+
+def schema_instruction(schema: dict) -> str:
+    """Suffix for the system prompt that asks for JSON matching schema."""
+    public = {k: v for k, v in schema.items() if not k.startswith("x-")}
+    return SCHEMA_INSTRUCTION + json.dumps(public, ensure_ascii=False, separators=(",", ":"))
+
+
+# ---------------------------------------------------------------------------
+# Validation
+# ---------------------------------------------------------------------------
+_TYPE_CHECKS = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+def _types(schema):
+    t = schema.get("type")
+    if t is None:
+        return []
+    return list(t) if isinstance(t, list) else [t]
+
+
+def validate(value, schema: dict, path: str = "$") -> list:
+    """Problems with value against the schema subset used here (type/properties/required/items/enum)."""
+    types = _types(schema)
+    if types and not any(_TYPE_CHECKS[t](value) for t in types):
+        return [f"{path}: expected {'/'.join(types)}, got {type(value).__name__}"]
+    errors = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} not in {schema['enum']}")
+    if isinstance(value, dict):
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(f"{path}.{name}: missing")
+        for name, sub in schema.get("properties", {}).items():
+            if name in value:
+                errors.extend(validate(value[name], sub, f"{path}.{name}"))
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+# ---------------------------------------------------------------------------
+# Repair
+# ---------------------------------------------------------------------------
+_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_PY_LITERAL = re.compile(r"\b(True|False|None)\b")
+_NUMBER_IN_TEXT = re.compile(r"-?\d+(?:\.\d+)?")
+_DECODER = json.JSONDecoder()
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+def _json_tail(text: str) -> str:
+    """Text from the first { or [ on (fences removed)."""
+    text = _FENCE.sub("", text or "").strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    return text[min(starts):] if starts else text
+
+
+def _close_truncated(text: str) -> str:
+    """Close an unterminated string and any open brackets (output cut at max_tokens)."""
+    stack = []
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(",")
+    if text.endswith(":"):
+        text += " null"
+    return text + "".join(reversed(stack))
+
+
+def _decode(text: str):
+    # raw_decode ignores whatever follows the first complete value
+    return _DECODER.raw_decode(text)[0]
+
+
+def _loads(text: str):
+    """(value, fixes) from model output, or (None, fixes) when it is not JSON at all."""
+    fixes = []
+    tail = _json_tail(text)
+    if tail != (text or "").strip():
+        fixes.append("stripped text before the JSON")
+    try:
+        return _decode(tail), fixes
+    except ValueError:
+        pass
+    fixed = tail.translate(_SMART_QUOTES)
+    fixed = _PY_LITERAL.sub(lambda m: _PY_LITERALS[m.group(1)], fixed)
+    fixed = _TRAILING_COMMA.sub(r"\1", fixed)
+    try:
+        value = _decode(fixed)
+    except ValueError:
+        # cut off at max_tokens (or prose after an unclosed value): close what is open
+        try:
+            value = _decode(_TRAILING_COMMA.sub(r"\1", _close_truncated(fixed)))
+        except ValueError as ex:
+            fixes.append(f"unparseable JSON: {ex}")
+            return None, fixes
+    fixes.append("repaired malformed JSON")
+    return value, fixes
+
+
+def _norm_key(key) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", str(key).lower()).strip("_")
+
+
+def _empty(schema):
+    types = _types(schema)
+    if "null" in types:
+        return None
+    first = types[0] if types else "string"
+    if first == "object":
+        return {name: _empty(sub) for name, sub in schema.get("properties", {}).items() if name in schema.get("required", [])}
+    return {"array": [], "string": "", "integer": None, "number": None, "boolean": False}[first]
+
+
+def _coerce(value, schema, path, fixes):
+    types = _types(schema)
+    if not types or any(_TYPE_CHECKS[t](value) for t in types):
+        if isinstance(value, dict) and "properties" in schema:
+            return _coerce_object(value, schema, path, fixes)
+        if isinstance(value, list) and "items" in schema:
+            return [_coerce(item, schema["items"], f"{path}[{i}]", fixes) for i, item in enumerate(value)]
+        if "enum" in schema and isinstance(value, str) and value not in schema["enum"]:
+            match = next((e for e in schema["enum"] if str(e).lower() in value.lower()), None)
+            if match is not None:
+                fixes.append(f"{path}: mapped {value!r} to {match!r}")
+                return match
+        return value
+
+    fixes.append(f"{path}: coerced {type(value).__name__} to {'/'.join(types)}")
+    if "array" in types:
+        items = [] if value is None else [value]
+        return [_coerce(item, schema.get("items", {}), f"{path}[{i}]", fixes) for i, item in enumerate(items)]
+    if "object" in types:
+        return _coerce_object(value if isinstance(value, dict) else {}, schema, path, fixes)
+    if "string" in types:
+        if value is None:
+            return ""
+        if isinstance(value, list):
+            return "; ".join(str(v) for v in value)
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    if "number" in types or "integer" in types:
+        if isinstance(value, str):
+            m = _NUMBER_IN_TEXT.search(value)
+            value = float(m.group()) if m else None
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+            # an integer field given 30.0 (or "30 days") keeps its value
+            return int(value) if "number" not in types else value
+        return _empty(schema)
+    if "boolean" in types:
+        return str(value).strip().lower() in ("true", "yes", "1")
+    return _empty(schema)
+
+
+def _coerce_object(value: dict, schema, path, fixes):
+    out = dict(value)
+    by_norm = {_norm_key(k): k for k in value}
+    for name, sub in schema.get("properties", {}).items():
+        if name not in out:
+            alias = by_norm.get(_norm_key(name))
+            if alias is not None and alias != name:
+                out[name] = out.pop(alias)
+                fixes.append(f"{path}.{name}: renamed from {alias!r}")
+            elif name in schema.get("required", []):
+                out[name] = _empty(sub)
+                fixes.append(f"{path}.{name}: filled missing field")
+                continue
+            else:
+                continue
+        out[name] = _coerce(out[name], sub, f"{path}.{name}", fixes)
+    return out
+
+
+def repair(text, schema: dict):
+    """
+    Parse model output against schema in a single pass.
+
+    Returns (value, fixes): value conforms to the schema (None when the
+    output contains no JSON at all), fixes lists what had to be changed.
+    """
+    value, fixes = _loads(text if isinstance(text, str) else str(text or ""))
+    if value is None:
+        return None, fixes
+    if isinstance(value, list) and "object" in _types(schema):
+        # a bare list is taken as the first array property (usually "stages")
+        array_field = next((n for n, s in schema.get("properties", {}).items() if "array" in _types(s)), None)
+        if array_field is not None:
+            value = {array_field: value}
+            fixes.append(f"$: wrapped list as {array_field}")
+    return _coerce(value, schema, "$", fixes), fixes
+
+
+def stage_results_data(stages, results):
+    """
+    {"stages": [...]} for per-stage answers (pest, disease): each answer's
+    .data with the stage name and dates from the parsed plan, or None when
+    no answer was structured. results are in the order of stages.
+    """
+    items = []
+    for stage, result in zip(stages, results):
+        data = getattr(result, "data", None)
+        if data is None:
+            continue
+        items.append({**data, "stage_name": stage.name, "start_date": stage.start.isoformat(), "end_date": stage.end.isoformat()})
+    return {"stages": items} if items else None
+
+
+# ---------------------------------------------------------------------------
+# Rendering
+# ---------------------------------------------------------------------------
+_LABELS = {"ph": "pH"}
+
+
+def _label(name: str) -> str:
+    return _LABELS.get(name) or name.replace("_", " ").strip().capitalize()
+
+
+def _render_value(name, value, indent=""):
+    if isinstance(value, list):
+        if not value:
+            return []
+        lines = [f"{indent}{_label(name)}:"]
+        for item in value:
+            if isinstance(item, dict):
+                parts = [f"{_label(k)}: {v}" for k, v in item.items() if v not in (None, "", [])]
+                lines.append(f"{indent}- " + "; ".join(parts))
+            else:
+                lines.append(f"{indent}- {item}")
+        return lines
+    if isinstance(value, dict):
+        lines = [f"{indent}{_label(name)}:"]
+        for k, v in value.items():
+            lines += _render_value(k, v, indent + "  ")
+        return lines
+    if value in (None, ""):
+        return []
+    return [f"{indent}{_label(name)}: {value}"]
+
+
+def _render_stage_plan(data: dict) -> str:
+    lines = []
+    for name, label in (("location", "Location"), ("crop", "Crop"), ("sowing_date", "Sowing Date")):
+        if data.get(name):
+            lines.append(f"{label}: {data[name]}")
+    rule = "━" * 44
+    lines += ["", "GROWTH STAGE PLAN:", rule, ""]
+    for i, stage in enumerate(data.get("stages") or [], 1):
+        lines += [
+            f"Stage {i}: {stage.get('stage_name', '')}",
+            f"├─ Start Date: {stage.get('start_date', '')}",
+            f"├─ End Date: {stage.get('end_date', '')}",
+        ]
+        if stage.get("duration_days") is not None:
+            lines.append(f"├─ Duration: {stage['duration_days']} days")
+        if stage.get("confidence") is not None:
+            lines.append(f"├─ Confidence: {stage['confidence']:.2f}")
+        lines += [f"└─ Key Factors: {stage.get('key_factors') or '-'}", ""]
+    lines.append(rule)
+    if data.get("expected_harvest_date"):
+        lines.append(f"EXPECTED HARVEST DATE: {data['expected_harvest_date']}")
+    if data.get("overall_confidence") is not None:
+        lines.append(f"OVERALL CONFIDENCE: {data['overall_confidence']:.2f}")
+    if data.get("assumptions"):
+        lines += ["", "CRITICAL ASSUMPTIONS:"] + [f"- {a}" for a in data["assumptions"]]
+    if data.get("alerts"):
+        lines += ["", "CRITICAL ALERTS (if any):"] + [f"- {a}" for a in data["alerts"]]
+    return "\n".join(lines) + "\n"
+
+
+def render(data, schema: dict) -> str:
+    """Text form of a structured answer, in the layout the agent's consumers read."""
+    style = schema.get("x-render")
+    if style == "json":
+        return json.dumps(data, indent=2, ensure_ascii=False)
+    if style == "stage_plan":
+        return _render_stage_plan(data)
+    lines = [f"{schema.get('title', 'agent').upper()} REPORT"]
+    for name, value in (data or {}).items():
+        lines += _render_value(name, value)
+    return "\n".join(lines)
@@ -8,7 +8,9 @@ from together import Together
 from dataclasses import dataclass
 from langgraph.graph import StateGraph
 from openai import OpenAI
-from llm_router import call_llm
+from llm_router import call_llm, acall_llm, answered_model
+from schemas import output_schema
+import asyncio
 
 load_dotenv()
 
@@ -85,7 +87,7 @@ SOIL_SYSTEM_PROMPT="""
     """
 
 
-def run_soil_agent(
+def _soil_request(
     location: str,
     crop_name: str = "",
     crop_variety: str = "",
@@ -107,28 +109,8 @@ def run_soil_agent(
     water_source: str = None,
     custom_prompt: str = None,
     model: str = None,
-    temperature: float = 0.1,
-    max_tokens: int = 1200,
-    save_to_db: bool = True,
-    run_id: int = None
-    ) -> dict:  # returns {'output': ..., 'id': ...}
-
-    """
-    Calls the SOIL AGENT and returns soil analysis report.
-    
-    Args:
-        location: Location name (district, state)
-        crop_name: Name of the crop
-        crop_variety: Variety of the crop
-        sowing_date: Sowing date (YYYY-MM-DD)
-        area: Farm area in hectares
-        latitude: Latitude coordinate (optional)
-        longitude: Longitude coordinate (optional)
-        soil_type: Soil type if know
-        custom_prompt: Custom system prompt
-        model: Model name to use
-    """
-
+):
+    """Build (system_prompt, user_msg, chosen_model) for the soil agent."""
     # Build detailed user message with all context
     location_info = location
     if latitude and longitude:
@@ -163,17 +145,10 @@ def run_soil_agent(
     
     system_prompt = custom_prompt if custom_prompt else SOIL_SYSTEM_PROMPT
     chosen_model = model if model else llama_model_name
+    return system_prompt, user_msg, chosen_model
 
-    try:
-        text = call_llm(
-            model=chosen_model,
-            system_prompt=system_prompt,
-            user_message=user_msg,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-    except Exception as e:
-        return f"Error calling model {chosen_model}: {e}"
+
+def _save_soil_result(text, location, crop_name, chosen_model, system_prompt, save_to_db=True, run_id=None) -> dict:
     if save_to_db:
         print(" ----------------soil agent")
         try:
@@ -185,11 +160,138 @@ def run_soil_agent(
                     import json
                     output_str = json.dumps(output_str, ensure_ascii=False)
                 print('[DEBUG][run_soil_agent] output_str type:', type(output_str))
-                obj = save_soil(session, location, crop_name, chosen_model, system_prompt, output_str, run_id=run_id)
+                obj = save_soil(session, location, crop_name, answered_model([text], chosen_model), system_prompt, output_str, run_id=run_id)
                 print("TYPE of obj:", type(obj))
                 print("obj.id =", obj.id)
                 print("-----------------------object>",obj)
-                return {'output': output_str, 'id': obj.id}
+                return {'output': output_str, 'id': obj.id, 'data': getattr(text, 'data', None)}
         except Exception as ex:
             print(f'[run_soil_agent] Warning: Could not save to DB: {ex}')
-    return {'output': text, 'id': None}
+    return {'output': text, 'id': None, 'data': getattr(text, 'data', None)}
+
+
+def run_soil_agent(
+    location: str,
+    crop_name: str = "",
+    crop_variety: str = "",
+    sowing_date: str = "",
+    area: float = 0.0,
+    latitude: float = None,
+    longitude: float = None,
+    soil_type: str = "",
+    soil_texture: str = None,
+    drainage: str = None,
+    waterlogging: str = None,
+    salinity_signs: str = None,
+    field_slope: str = None,
+    hardpan_crusting: str = None,
+    farming_method: str = None,
+    planting_method: str = None,
+    irrigation_type: str = None,
+    irrigation_method: str = None,
+    water_source: str = None,
+    custom_prompt: str = None,
+    model: str = None,
+    temperature: float = 0.1,
+    max_tokens: int = 1200,
+    save_to_db: bool = True,
+    run_id: int = None
+    ) -> dict:  # returns {'output': ..., 'id': ...}
+
+    """
+    Calls the SOIL AGENT and returns soil analysis report.
+    
+    Args:
+        location: Location name (district, state)
+        crop_name: Name of the crop
+        crop_variety: Variety of the crop
+        sowing_date: Sowing date (YYYY-MM-DD)
+        area: Farm area in hectares
+        latitude: Latitude coordinate (optional)
+        longitude: Longitude coordinate (optional)
+        soil_type: Soil type if know
+        custom_prompt: Custom system prompt
+        model: Model name to use
+    """
+    system_prompt, user_msg, chosen_model = _soil_request(
+        location, crop_name, crop_variety, sowing_date, area, latitude, longitude,
+        soil_type, soil_texture, drainage, waterlogging, salinity_signs, field_slope,
+        hardpan_crusting, farming_method, planting_method, irrigation_type,
+        irrigation_method, water_source, custom_prompt, model,
+    )
+
+    try:
+        text = call_llm(
+            model=chosen_model,
+            system_prompt=system_prompt,
+            user_message=user_msg,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            agent="soil",
+            response_schema=output_schema("soil"),
+        )
+    except Exception as e:
+        return f"Error calling model {chosen_model}: {e}"
+    return _save_soil_result(text, location, crop_name, chosen_model, system_prompt, save_to_db, run_id)
+
+
+async def arun_soil_agent(
+    location: str,
+    crop_name: str = "",
+    crop_variety: str = "",
+    sowing_date: str = "",
+    area: float = 0.0,
+    latitude: float = None,
+    longitude: float = None,
+    soil_type: str = "",
+    soil_texture: str = None,
+    drainage: str = None,
+    waterlogging: str = None,
+    salinity_signs: str = None,
+    field_slope: str = None,
+    hardpan_crusting: str = None,
+    farming_method: str = None,
+    planting_method: str = None,
+    irrigation_type: str = None,
+    irrigation_method: str = None,
+    water_source: str = None,
+    custom_prompt: str = None,
+    model: str = None,
+    temperature: float = 0.1,
+    max_tokens: int = 1200,
+    save_to_db: bool = True,
+    run_id: int = None
+    ) -> dict:
+    """
+    Async variant of run_soil_agent (same arguments). The LLM call uses
+    acall_llm; the DB save runs in a worker thread.
+    """
+    system_prompt, user_msg, chosen_model = _soil_request(
+        location, crop_name, crop_variety, sowing_date, area, latitude, longitude,
+        soil_type, soil_texture, drainage, waterlogging, salinity_signs, field_slope,
+        hardpan_crusting, farming_method, planting_method, irrigation_type,
+        irrigation_method, water_source, custom_prompt, model,
+    )
+
+    try:
+        text = await acall_llm(
+            model=chosen_model,
+            system_prompt=system_prompt,
+            user_message=user_msg,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            agent="soil",
+            response_schema=output_schema("soil"),
+        )
+    except Exception as e:
+        return f"Error calling model {chosen_model}: {e}"
+    return await asyncio.to_thread(
+        _save_soil_result,
+        text,
+        location,
+        crop_name,
+        chosen_model,
+        system_prompt,
+        save_to_db,
+        run_id,
+    )
@@ -5,10 +5,12 @@ from dotenv import load_dotenv
 from together import Together
 from dataclasses import dataclass
 from openai import OpenAI
-from llm_router import call_llm
+from llm_router import call_llm, acall_llm, answered_model
+from schemas import output_schema
+import asyncio
 
 from langgraph.graph import StateGraph
-from soil import FarmerInput
+from soil import FarmerInput, llama_model_name
 from soil import run_soil_agent
 from water import water_agent
 from weather import weather_7day_compact
@@ -112,24 +114,17 @@ stage_system_prompt = """
 
     """
 
-def stage_planner_agent(
+def _stage_planner_request(
     location: str,
     crop: str,
     sowing_date: str,
     soil_report: str,
     water_report: str,
     weather_report: str,
-    model_name: str = None,
-    temperature: float = 0.1,
-    max_tokens: int = 1200,
     custom_prompt: str = None,
     model: str = None,
-    save_to_db: bool = True  # This will now work!
-) -> str:
-    """Build prompt correctly and call Together/Qwen, return plain-text model output."""
-    if model_name is None:
-        model_name = MODEL_NAME
-
+):
+    """Build (system_prompt, user_message, chosen_model) for the stage planner."""
     # ensure sowing_date in YYYY-MM-DD
     sd = sowing_date
     try:
@@ -160,6 +155,31 @@ def stage_planner_agent(
         weather_report=esc(weather_report),
         today_date=esc(str(today_date)),
     )
+    return system_prompt, user_message, chosen_model
+
+
+def stage_planner_agent(
+    location: str,
+    crop: str,
+    sowing_date: str,
+    soil_report: str,
+    water_report: str,
+    weather_report: str,
+    model_name: str = None,
+    temperature: float = 0.1,
+    max_tokens: int = 1200,
+    custom_prompt: str = None,
+    model: str = None,
+    save_to_db: bool = True  # This will now work!
+) -> str:
+    """Build prompt correctly and call Together/Qwen, return plain-text model output."""
+    if model_name is None:
+        model_name = MODEL_NAME
+
+    system_prompt, user_message, chosen_model = _stage_planner_request(
+        location, crop, sowing_date, soil_report, water_report, weather_report,
+        custom_prompt=custom_prompt, model=model,
+    )
     try:
         text = call_llm(
             model=chosen_model,
@@ -167,6 +187,40 @@ def stage_planner_agent(
             user_message=user_message,
             temperature=temperature,
             max_tokens=max_tokens,
+            agent="stage",
+            response_schema=output_schema("stage"),
+        )
+        return text, system_prompt
+    except Exception as e:
+        return f"Error calling StagePlanner model: {e}"
+
+
+async def astage_planner_agent(
+    location: str,
+    crop: str,
+    sowing_date: str,
+    soil_report: str,
+    water_report: str,
+    weather_report: str,
+    temperature: float = 0.1,
+    max_tokens: int = 1200,
+    custom_prompt: str = None,
+    model: str = None,
+):
+    """Async variant of stage_planner_agent using acall_llm."""
+    system_prompt, user_message, chosen_model = _stage_planner_request(
+        location, crop, sowing_date, soil_report, water_report, weather_report,
+        custom_prompt=custom_prompt, model=model,
+    )
+    try:
+        text = await acall_llm(
+            model=chosen_model,
+            system_prompt=system_prompt,
+            user_message=user_message,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            agent="stage",
+            response_schema=output_schema("stage"),
         )
         return text, system_prompt
     except Exception as e:
@@ -179,104 +233,11 @@ def parse_stage_plan_and_current_stage(report_text, sowing_date_str):
     - Sowing date in future  -> crop not yet sown
     - Today after last stage -> crop already harvested
     """
-    
-
-    # ---------- Parse sowing date safely ----------
-    sowing_date = None
-    if sowing_date_str:
-        for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
-            try:
-                sowing_date = datetime.strptime(sowing_date_str, fmt).date()
-                break
-            except Exception:
-                continue
-
-    # ---------- Extract all stages with dates ----------
-    pattern = (
-        r"Stage\s*\d+[:：]\s*(.+?)\s*[\n\r]+"  # Accepts : or ：, flexible whitespace
-        r".*?Start[\s_-]*Date[:：]?\s*(\d{4}-\d{2}-\d{2})[\s\n\r]*"
-        r".*?End[\s_-]*Date[:：]?\s*(\d{4}-\d{2}-\d{2})"
-    )
-    matches = re.findall(pattern, report_text, re.DOTALL)
-
-    if not matches:
-        return "\n\nCURRENT STAGE: Could not parse stages from report.\n"
-
-    today = date.today()
-
-    # ---------- Check: sowing in future ----------
-    if sowing_date and sowing_date > today:
-        return (
-            f"\n\nCURRENT STAGE: Crop not yet sown. "
-            f"(Sowing date is in future: {sowing_date.isoformat()}).\n"
-        )
-
-    # ---------- Build structured stage list ----------
-    stages = []
-    for stage_name, start_date_str, end_date_str in matches:
-        start = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-        end = datetime.strptime(end_date_str, "%Y-%m-%d").date()
-        stages.append((stage_name.strip(), start, end))
-
-    # Sort just in case LLM ne order ulta kar diya ho
-    stages.sort(key=lambda x: x[1])
-
-    first_stage_start = stages[0][1]
-    last_stage_end = stages[-1][2]
-
-    # ---------- Check: today after last stage (already harvested) ----------
-    if today > last_stage_end:
-        return (
-            f"\n\nCURRENT STAGE: Crop has already been harvested. "
-            f"(Last stage ended on {last_stage_end.isoformat()}).\n"
-        )
-
-    # Optional: before first stage but sowing ho chuki hai / data mismatch
-    if today < first_stage_start:
-        return (
-            f"\n\nCURRENT STAGE: Crop growth not yet started. "
-            f"(First stage starts on {first_stage_start.isoformat()}).\n"
-        )
-
-    # ---------- Find stage in which 'today' falls ----------
-    for stage_name, start, end in stages:
-        if start <= today <= end:
-            total_days = (end - start).days + 1
-            completed_days = (today - start).days + 1
-            remaining_days = (end - today).days
-            progress_pct = (completed_days / total_days) * 100
-
-            result = "\n\nCURRENT STAGE:\n"
-            result += f"- Stage Name: {stage_name}\n"
-            result += f"- Start Date: {start.isoformat()}\n"
-            result += f"- End Date: {end.isoformat()}\n"
-            result += f"- Days Completed: {completed_days}/{total_days} days\n"
-            result += f"- Progress: {progress_pct:.1f}%\n"
-            result += f"- Days Remaining: {remaining_days} days\n"
-            result += (
-                f"- Explanation: Crop is currently in '{stage_name}' stage "
-                f"(Today: {today.isoformat()}).\n"
-            )
-            return result
+    from stage_tracker import parse_stages, current_stage_text
 
-    # Fallback: dates parse ho gaye but today kisi bhi range me nahi aaya
-    return "\n\nCURRENT STAGE: Could not determine stage from date ranges.\n"
-
-def stage_generation(
-    farmer_input, 
-    model, 
-    save_to_db=True, 
-    temperature: float = None,
-    max_tokens: int = None,
-    latitude: float = None, 
-    longitude: float = None, 
-    soil_data=None, 
-    water_data=None, 
-    weather_data=None,
-    session_state=None,  # NEW: pass session_state
-    run_id: int = None
-    ):  
+    return current_stage_text(parse_stages(report_text), sowing_date_str)
 
+def _stage_system_prompt(session_state=None):
     system_prompt = None
     try:
         if session_state and isinstance(session_state, dict):
@@ -286,18 +247,16 @@ def stage_generation(
         system_prompt = None
     if not system_prompt:
         system_prompt = stage_system_prompt
+    return system_prompt
 
-    """
-    Generate crop growth stage plan.
-    Uses cached data from session_state or database before making new API calls.
-    """
+
+def _stage_dependencies(farmer_input, model, latitude=None, longitude=None, soil_data=None, water_data=None, weather_data=None, session_state=None, run_id=None):
+    """Resolve soil/water/weather inputs (session/DB first) for the stage planner."""
     from agent_helper import (
         get_or_fetch_soil, 
         get_or_fetch_water, 
         get_or_fetch_weather,
-        extract_output_text
     )
-    import re
     
     # Fetch dependencies intelligently (checks session/DB first)
     dependencies = {
@@ -311,35 +270,50 @@ def stage_generation(
             data = func(*args)
         dependencies[name] = data
     
-    soil_data, water_data, weather_data = dependencies.values()
+    return tuple(dependencies.values())
 
-    # Convert to strings
-    soil_text = extract_output_text(soil_data)
-    water_text = extract_output_text(water_data)
-    weather_text = extract_output_text(weather_data)
 
-    temp_to_use = temperature if temperature is not None else 0.1
-    max_tokens_to_use = max_tokens if max_tokens is not None else 1200
+def _uses_phenology(farmer_input, system_prompt) -> bool:
+    """Rule-based planning applies to covered crops unless the stage prompt was customised."""
+    from phenology import covers
+    return system_prompt is stage_system_prompt and covers(getattr(farmer_input, 'crop_name', None))
 
-    # Generate stage plan from LLM
-    stages_data = stage_planner_agent(
-        location=farmer_input.location,
-        crop=farmer_input.crop_name,
-        sowing_date=farmer_input.sowing_date,
-        soil_report=soil_text,
-        water_report=water_text,
-        weather_report=weather_text,
-        temperature=temp_to_use,
-        max_tokens=max_tokens_to_use,
-        model=model,
-        save_to_db=False,  # We'll save at the end
-        custom_prompt=system_prompt
-    )
 
+def _phenology_stage_plan(farmer_input, latitude=None, longitude=None, soil_data=None, water_data=None, weather_data=None, session_state=None, run_id=None):
+    """
+    Fast path: plan stages from thermal time. Only the weather is needed;
+    soil/water are passed through when already available (for the saved ids).
+    Returns (plan or None, soil_data, water_data, weather_data).
+    """
+    from agent_helper import get_or_fetch_weather
+    from phenology import stage_plan
+
+    outputs = (session_state or {}).get('agent_outputs', {})
+    soil_data = soil_data if soil_data is not None else outputs.get('soil')
+    water_data = water_data if water_data is not None else outputs.get('water')
+    if weather_data is None:
+        weather_data = get_or_fetch_weather(farmer_input, session_state or {}, latitude, longitude, "", run_id)
+    record = weather_data.get('data') if isinstance(weather_data, dict) else None
+    return stage_plan(farmer_input, record, latitude, longitude), soil_data, water_data, weather_data
+
+
+def _stage_data(stages_data) -> dict:
+    """Compact stage fields (the stage schema's shape): the structured answer, else the parsed plan."""
+    data = getattr(stages_data, 'data', None)
+    if data is not None:
+        return data
+    from stage_parser import plan_data
+    return plan_data(stages_data)
+
+
+def _finish_stage_generation(stages_data, farmer_input, model, system_prompt, soil_data, water_data, weather_data, save_to_db=True, run_id=None):
+    """Replace the LLM's CURRENT STAGE section with a computed one and optionally save."""
     # If stage_planner_agent returned tuple (text, system_prompt) normalize it:
     if isinstance(stages_data, tuple) and len(stages_data) >= 1:
         # assume first item is text
         stages_data = stages_data[0]
+    answered = answered_model([stages_data], model)
+    data = _stage_data(stages_data)
         
     # Remove LLM's CURRENT STAGE section (if exists)
     stages_data = re.sub(
@@ -379,15 +353,135 @@ def stage_generation(
                     soil_id=ids['soil'],
                     water_id=ids['water'],
                     weather_id=ids['weather'],
-                    model_name=model,
+                    model_name=answered,
                     prompt=system_prompt,
                     output=final_report,
                     run_id=run_id
                 )
                 
+                from stage_tracker import save_plan_background
+                save_plan_background(obj.id, stages_data, farmer_input, weather_data)
+
                 # Return with ID for future reference
-                return {'id': obj.id, 'output': final_report}
+                return {'id': obj.id, 'output': final_report, 'data': data}
         except Exception as ex:
             print(f'[stage_generation] Warning: Could not save to DB: {ex}')
     
-    return final_report
\ No newline at end of file
+    return final_report
+
+
+def stage_generation(
+    farmer_input, 
+    model, 
+    save_to_db=True, 
+    temperature: float = None,
+    max_tokens: int = None,
+    latitude: float = None, 
+    longitude: float = None, 
+    soil_data=None, 
+    water_data=None, 
+    weather_data=None,
+    session_state=None,  # NEW: pass session_state
+    run_id: int = None
+    ):  
+    """
+    Generate crop growth stage plan.
+    Crops in phenology.CROP_PHENOLOGY are planned from thermal time without an
+    LLM call (unless the stage prompt is customised); others go to the LLM.
+    Uses cached data from session_state or database before making new API calls.
+    """
+    from agent_helper import extract_output_text
+
+    system_prompt = _stage_system_prompt(session_state)
+
+    if _uses_phenology(farmer_input, system_prompt):
+        plan, soil_p, water_p, weather_p = _phenology_stage_plan(
+            farmer_input, latitude, longitude, soil_data, water_data, weather_data, session_state, run_id
+        )
+        if plan is not None:
+            return _finish_stage_generation(
+                plan, farmer_input, model, None, soil_p, water_p, weather_p, save_to_db, run_id
+            )
+
+    soil_data, water_data, weather_data = _stage_dependencies(
+        farmer_input, model, latitude, longitude, soil_data, water_data, weather_data, session_state, run_id
+    )
+
+    temp_to_use = temperature if temperature is not None else 0.1
+    max_tokens_to_use = max_tokens if max_tokens is not None else 1200
+
+    # Generate stage plan from LLM
+    stages_data = stage_planner_agent(
+        location=farmer_input.location,
+        crop=farmer_input.crop_name,
+        sowing_date=farmer_input.sowing_date,
+        soil_report=extract_output_text(soil_data),
+        water_report=extract_output_text(water_data),
+        weather_report=extract_output_text(weather_data),
+        temperature=temp_to_use,
+        max_tokens=max_tokens_to_use,
+        model=model,
+        save_to_db=False,  # We'll save at the end
+        custom_prompt=system_prompt
+    )
+
+    return _finish_stage_generation(
+        stages_data, farmer_input, model, system_prompt, soil_data, water_data, weather_data, save_to_db, run_id
+    )
+
+
+async def astage_generation(
+    farmer_input,
+    model,
+    save_to_db=True,
+    temperature: float = None,
+    max_tokens: int = None,
+    latitude: float = None,
+    longitude: float = None,
+    soil_data=None,
+    water_data=None,
+    weather_data=None,
+    session_state=None,
+    run_id: int = None
+    ):
+    """
+    Async variant of stage_generation. Dependency lookups and the DB save run
+    in worker threads; the stage planner call uses acall_llm.
+    """
+    from agent_helper import extract_output_text
+
+    system_prompt = _stage_system_prompt(session_state)
+
+    if _uses_phenology(farmer_input, system_prompt):
+        plan, soil_p, water_p, weather_p = await asyncio.to_thread(
+            _phenology_stage_plan,
+            farmer_input, latitude, longitude, soil_data, water_data, weather_data, session_state, run_id
+        )
+        if plan is not None:
+            return await asyncio.to_thread(
+                _finish_stage_generation,
+                plan, farmer_input, model, None, soil_p, water_p, weather_p, save_to_db, run_id
+            )
+
+    soil_data, water_data, weather_data = await asyncio.to_thread(
+        _stage_dependencies,
+        farmer_input, model, latitude, longitude, soil_data, water_data, weather_data, session_state, run_id
+    )
+
+    stages_data = await astage_planner_agent(
+        location=farmer_input.location,
+        crop=farmer_input.crop_name,
+        sowing_date=farmer_input.sowing_date,
+        soil_report=extract_output_text(soil_data),
+        water_report=extract_output_text(water_data),
+        weather_report=extract_output_text(weather_data),
+        temperature=temperature if temperature is not None else 0.1,
+        max_tokens=max_tokens if max_tokens is not None else 1200,
+        model=model,
+        custom_prompt=system_prompt
+    )
+
+    return await asyncio.to_thread(
+        _finish_stage_generation,
+        stages_data, farmer_input, model, system_prompt, soil_data, water_data, weather_data, save_to_db, run_id
+    )
@@ -0,0 +1,243 @@
+"""
+The one parser for GROWTH STAGE PLAN text (stage agent, phenology engine).
+
+parse_stage_plan() scans the text line by line with anchored, precompiled
+patterns, so it is linear in the text length and tolerant of the variations
+LLMs produce (case, "：", bullets/box characters, bold markers, dd/mm/yyyy
+dates). Results are memoized by a hash of the text; the returned tuple and
+its StageRecords are shared between callers and must not be modified.
+
+stages_for() adds a fallback for text that does not parse: the CURRENT STAGE
+block, then the rule-based phenology plan, then a generic template from the
+sowing date. It never calls an LLM.
+"""
+
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+STAGE_PARSER_CACHE_SIZE = int(os.getenv("STAGE_PARSER_CACHE_SIZE", "256"))
+
+_DECOR = r"[\s├└│─|*•\-–—>#]*"
+_HEADER = re.compile(r"^" + _DECOR + r"Stage\s*(\d+)\s*[:：.)\-–]\s*(.+?)[\s*]*$", re.IGNORECASE)
+_FIELD = re.compile(
+    r"^" + _DECOR + r"(start[\s_-]*date|end[\s_-]*date|duration|confidence)[\s*]*[:：]?[\s*]*(.*?)\s*$",
+    re.IGNORECASE,
+)
+_CURRENT = re.compile(r"^" + _DECOR + r"CURRENT STAGE\s*[:：]", re.IGNORECASE)
+_CURRENT_NAME = re.compile(r"^" + _DECOR + r"Stage\s*Name\s*[:：]\s*(.+?)\s*$", re.IGNORECASE)
+_DATE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})|(\d{1,2})/(\d{1,2})/(\d{4})")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+# Stage template used when neither the text nor the phenology table help
+TEMPLATE_STAGES = [("Establishment", 20), ("Vegetative Growth", 40), ("Reproductive", 30), ("Maturity", 30)]
+
+
+class StageRecord:
+    """One stage of a plan. start/end are dates; duration is in days."""
+
+    __slots__ = ("number", "name", "start", "end", "duration", "confidence")
+
+    def __init__(self, number, name, start, end, duration=None, confidence=None):
+        self.number = number
+        self.name = name
+        self.start = start
+        self.end = end
+        self.duration = duration if duration is not None else (end - start).days + 1
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"StageRecord({self.number}, {self.name!r}, {self.start}, {self.end})"
+
+    def to_dict(self) -> dict:
+        return {
+            "number": self.number,
+            "name": self.name,
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "duration": self.duration,
+            "confidence": self.confidence,
+        }
+
+
+_cache = OrderedDict()  # sha1 of text -> tuple of StageRecord
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _date(text):
+    m = _DATE.search(text or "")
+    if not m:
+        return None
+    try:
+        if m.group(1):
+            return datetime(int(m.group(1)), int(m.group(2)), int(m.group(3))).date()
+        return datetime(int(m.group(6)), int(m.group(5)), int(m.group(4))).date()
+    except ValueError:
+        return None
+
+
+def _number(text, kind):
+    m = _NUMBER.search(text or "")
+    if not m:
+        return None
+    return int(float(m.group())) if kind == "duration" else float(m.group())
+
+
+def _scan(text: str):
+    records = []
+    current = None
+
+    def _close():
+        if current and current["start"] and current["end"] and current["end"] >= current["start"]:
+            records.append(StageRecord(
+                current["number"], current["name"], current["start"], current["end"],
+                current["duration"], current["confidence"],
+            ))
+
+    for line in text.splitlines():
+        header = _HEADER.match(line)
+        if header:
+            _close()
+            current = {
+                "number": int(header.group(1)),
+                "name": header.group(2).strip().strip("*").strip(),
+                "start": None, "end": None, "duration": None, "confidence": None,
+            }
+            continue
+        if current is None:
+            continue
+        if _CURRENT.match(line):
+            # the CURRENT STAGE block repeats dates; it never belongs to the last stage
+            _close()
+            current = None
+            continue
+        field = _FIELD.match(line)
+        if field:
+            kind = re.sub(r"[\s_-]+", "", field.group(1).lower())
+            value = field.group(2)
+            if kind == "startdate" and current["start"] is None:
+                current["start"] = _date(value)
+            elif kind == "enddate" and current["end"] is None:
+                current["end"] = _date(value)
+            elif kind in ("duration", "confidence") and current[kind] is None:
+                current[kind] = _number(value, kind)
+    _close()
+    records.sort(key=lambda r: r.start)
+    return tuple(records)
+
+
+def parse_stage_plan(text) -> tuple:
+    """StageRecords (sorted by start date) for a stage plan text; () if none parse."""
+    text = text if isinstance(text, str) else str(text or "")
+    key = hashlib.sha1(text.encode("utf-8")).digest()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            _cache_stats["hits"] += 1
+            return cached
+    records = _scan(text)
+    with _cache_lock:
+        _cache_stats["misses"] += 1
+        _cache[key] = records
+        while len(_cache) > STAGE_PARSER_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return records
+
+
+def plan_data(text) -> dict:
+    """The parsed plan in the shape of schemas.AGENT_SCHEMAS["stage"]: {"stages": [...]}."""
+    return {"stages": [
+        {
+            "stage_name": s.name,
+            "start_date": s.start.isoformat(),
+            "end_date": s.end.isoformat(),
+            "duration_days": s.duration,
+            "confidence": s.confidence,
+        }
+        for s in parse_stage_plan(text)
+    ]}
+
+
+def parse_current_stage(text):
+    """The CURRENT STAGE block as a single StageRecord, or None."""
+    inside = False
+    name = start = end = None
+    for line in (text or "").splitlines():
+        if _CURRENT.match(line):
+            inside = True
+            continue
+        if not inside:
+            continue
+        m = _CURRENT_NAME.match(line)
+        if m:
+            name = m.group(1)
+            continue
+        field = _FIELD.match(line)
+        if field:
+            kind = re.sub(r"[\s_-]+", "", field.group(1).lower())
+            if kind == "startdate":
+                start = _date(field.group(2))
+            elif kind == "enddate":
+                end = _date(field.group(2))
+    if name and start and end and end >= start:
+        return StageRecord(1, name, start, end)
+    return None
+
+
+def _template_stages(sowing):
+    records = []
+    start = sowing
+    for number, (name, days) in enumerate(TEMPLATE_STAGES, 1):
+        end = start + timedelta(days=days - 1)
+        records.append(StageRecord(number, name, start, end, days, 0.5))
+        start = end + timedelta(days=1)
+    return tuple(records)
+
+
+def stages_for(text, farmer_input=None, weather_record: dict = None):
+    """
+    (records, source) for a stage report, where source is "parsed",
+    "current_stage", "phenology", "template" or "none". The fallbacks never
+    call an LLM; "template" needs farmer_input.sowing_date.
+    """
+    records = parse_stage_plan(text)
+    if records:
+        return records, "parsed"
+    current = parse_current_stage(text if isinstance(text, str) else str(text or ""))
+    if current is not None:
+        return (current,), "current_stage"
+    if farmer_input is None:
+        return (), "none"
+    try:
+        from phenology import stage_plan
+        plan = stage_plan(farmer_input, weather_record)
+    except Exception as ex:
+        print(f"[stage_parser] Warning: phenology fallback failed: {ex}")
+        plan = None
+    if plan:
+        records = parse_stage_plan(plan)
+        if records:
+            return records, "phenology"
+    sowing = _date(str(getattr(farmer_input, "sowing_date", "") or ""))
+    if sowing is not None:
+        return _template_stages(sowing), "template"
+    return (), "none"
+
+
+def cache_stats() -> dict:
+    with _cache_lock:
+        out = dict(_cache_stats)
+        out["size"] = len(_cache)
+    return out
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        for name in _cache_stats:
+            _cache_stats[name] = 0
@@ -0,0 +1,277 @@
+"""
+Structured stage plans and the daily current-stage refresh.
+
+Every saved stage plan is also stored as `stage_plan_row` rows (stage name,
+start/end date and the cumulative GDD expected at each boundary). The daily
+job refresh_active_stages() then works from those rows alone:
+
+- the current stage is found with a bisect over the stage start dates and
+  the CURRENT STAGE section of the saved report is rewritten (which also
+  keeps get_latest_stage serving the plan);
+- the GDD actually observed since sowing (weather_history accumulator) is
+  compared with the GDD the plan expected by yesterday; only plans that
+  drifted more than STAGE_DRIFT_TOLERANCE are generated again.
+"""
+
+import os
+import re
+import json
+import dataclasses
+import threading
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+from stage_parser import parse_stage_plan
+
+STAGE_DRIFT_TOLERANCE = float(os.getenv("STAGE_DRIFT_TOLERANCE", "0.15"))
+# Early in the season a few warm days are a large fraction; wait for this much thermal time
+STAGE_DRIFT_MIN_GDD = float(os.getenv("STAGE_DRIFT_MIN_GDD", "100"))
+
+_plan_pool = None
+_plan_pool_lock = threading.Lock()
+
+CURRENT_STAGE_PATTERN = re.compile(r"CURRENT STAGE:.*?(?=CRITICAL ASSUMPTIONS:|CRITICAL ALERTS:|$)", re.DOTALL)
+
+
+def _parse_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(str(value), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_stages(report_text: str):
+    """[(name, start, end)] from a GROWTH STAGE PLAN text, sorted by start date."""
+    return [(s.name, s.start, s.end) for s in parse_stage_plan(report_text)]
+
+
+def find_stage(starts, today):
+    """Index of the last stage starting on or before today (bisect over sorted starts), or -1."""
+    return bisect_right(starts, today) - 1
+
+
+def current_stage_text(stages, sowing_date=None, today=None) -> str:
+    """
+    The CURRENT STAGE section for sorted (name, start, end) stages, as
+    appended to stage reports.
+    """
+    if not stages:
+        return "\n\nCURRENT STAGE: Could not parse stages from report.\n"
+    today = today or date.today()
+    sowing_date = _parse_date(sowing_date)
+
+    if sowing_date and sowing_date > today:
+        return (
+            f"\n\nCURRENT STAGE: Crop not yet sown. "
+            f"(Sowing date is in future: {sowing_date.isoformat()}).\n"
+        )
+    last_stage_end = stages[-1][2]
+    if today > last_stage_end:
+        return (
+            f"\n\nCURRENT STAGE: Crop has already been harvested. "
+            f"(Last stage ended on {last_stage_end.isoformat()}).\n"
+        )
+    first_stage_start = stages[0][1]
+    if today < first_stage_start:
+        return (
+            f"\n\nCURRENT STAGE: Crop growth not yet started. "
+            f"(First stage starts on {first_stage_start.isoformat()}).\n"
+        )
+
+    i = find_stage([s[1] for s in stages], today)
+    stage_name, start, end = stages[i]
+    if not start <= today <= end:
+        return "\n\nCURRENT STAGE: Could not determine stage from date ranges.\n"
+    total_days = (end - start).days + 1
+    completed_days = (today - start).days + 1
+    remaining_days = (end - today).days
+    progress_pct = (completed_days / total_days) * 100
+
+    result = "\n\nCURRENT STAGE:\n"
+    result += f"- Stage Name: {stage_name}\n"
+    result += f"- Start Date: {start.isoformat()}\n"
+    result += f"- End Date: {end.isoformat()}\n"
+    result += f"- Days Completed: {completed_days}/{total_days} days\n"
+    result += f"- Progress: {progress_pct:.1f}%\n"
+    result += f"- Days Remaining: {remaining_days} days\n"
+    result += (
+        f"- Explanation: Crop is currently in '{stage_name}' stage "
+        f"(Today: {today.isoformat()}).\n"
+    )
+    return result
+
+
+def plan_rows(report_text: str, farmer_input, weather_data=None, latitude: float = None, longitude: float = None):
+    """StagePlanRow column dicts for a stage report, with expected GDD at each boundary."""
+    from phenology import cumulative_gdd
+    from weather_history import farm_key
+
+    stages = parse_stages(report_text)
+    if not stages:
+        return []
+    record = weather_data.get("data") if isinstance(weather_data, dict) else None
+    location = (record or {}).get("location") or {}
+    if latitude is None or longitude is None:
+        latitude, longitude = location.get("latitude"), location.get("longitude")
+    sowing = _parse_date(getattr(farmer_input, "sowing_date", None)) or stages[0][1]
+
+    boundaries = [start - timedelta(days=1) for _, start, _ in stages] + [end for _, _, end in stages]
+    try:
+        gdd = cumulative_gdd(farmer_input.crop_name, sowing, boundaries, latitude, longitude, record)
+    except Exception as ex:
+        print(f"[stage_tracker] Warning: could not compute expected GDD: {ex}")
+        gdd = [None] * len(boundaries)
+    key = farm_key(farmer_input.location, farmer_input.crop_name, sowing)
+    inputs = dataclasses.asdict(farmer_input) if dataclasses.is_dataclass(farmer_input) else dict(vars(farmer_input))
+    inputs = json.dumps(inputs, default=str)
+    rows = []
+    for i, (name, start, end) in enumerate(stages):
+        rows.append({
+            "farm_key": key,
+            "location": farmer_input.location,
+            "crop_name": farmer_input.crop_name,
+            "sowing_date": sowing,
+            "latitude": latitude,
+            "longitude": longitude,
+            "farmer_input": inputs,
+            "name": name,
+            "start_date": start,
+            "end_date": end,
+            "gdd_start": gdd[i],
+            "gdd_end": gdd[len(stages) + i],
+        })
+    return rows
+
+
+def save_plan(stage_id: int, report_text: str, farmer_input, weather_data=None, latitude: float = None, longitude: float = None):
+    """Store the structured rows for a saved stage report (best effort)."""
+    try:
+        from backend.init_db import SessionLocal
+        from backend.data_store import save_stage_plan_rows
+
+        rows = plan_rows(report_text, farmer_input, weather_data, latitude, longitude)
+        if rows:
+            with SessionLocal() as session:
+                save_stage_plan_rows(session, stage_id, rows)
+    except Exception as ex:
+        print(f"[stage_tracker] Warning: Could not save stage plan rows: {ex}")
+
+
+def save_plan_background(stage_id: int, report_text: str, farmer_input, weather_data=None, latitude: float = None, longitude: float = None):
+    """
+    save_plan on a background thread: the expected GDD needs the season's
+    weather series (possibly an archive fetch), which should not hold up
+    the nodes waiting on the stage report. Returns the Future.
+    """
+    global _plan_pool
+    with _plan_pool_lock:
+        if _plan_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _plan_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="stage-plan")
+    return _plan_pool.submit(save_plan, stage_id, report_text, farmer_input, weather_data, latitude, longitude)
+
+
+def expected_gdd(rows, day):
+    """GDD the plan expected by the end of `day`, interpolated within its stage."""
+    i = find_stage([r.start_date for r in rows], day)
+    if i < 0:
+        return 0.0
+    row = rows[i]
+    if row.gdd_start is None or row.gdd_end is None:
+        return None
+    if day >= row.end_date:
+        return row.gdd_end
+    span = (row.end_date - row.start_date).days + 1
+    done = (day - row.start_date).days + 1
+    return row.gdd_start + (row.gdd_end - row.gdd_start) * done / span
+
+
+def plan_drift(rows, today=None):
+    """
+    Relative difference between observed and planned GDD by yesterday, or
+    None when it cannot be judged yet (no coordinates/thresholds, too early).
+    """
+    from weather_history import update_accumulator
+
+    first = rows[0]
+    yesterday = (today or date.today()) - timedelta(days=1)
+    if first.latitude is None or first.longitude is None or first.sowing_date is None or yesterday < first.sowing_date:
+        return None
+    planned = expected_gdd(rows, yesterday)
+    if not planned or planned < STAGE_DRIFT_MIN_GDD:
+        return None
+    observed = update_accumulator(first.location, first.crop_name, first.sowing_date, first.latitude, first.longitude, through=yesterday)
+    if observed["days"] == 0 or observed["missing_days"] > observed["days"] / 2:
+        return None
+    return (observed["gdd"] - planned) / planned
+
+
+def _replan(rows, model=None):
+    from user_input import FarmerInput
+    from stage_agent import stage_generation
+
+    first = rows[0]
+    # replan with the farm's full inputs (variety, area, ...), so only the weather differs
+    try:
+        inputs = json.loads(first.farmer_input or "{}")
+    except ValueError:
+        inputs = {}
+    known = {f.name for f in dataclasses.fields(FarmerInput)}
+    inputs = {k: v for k, v in inputs.items() if k in known}
+    inputs.update(
+        crop_name=first.crop_name,
+        location=first.location,
+        sowing_date=first.sowing_date.isoformat(),
+        latitude=first.latitude,
+        longitude=first.longitude,
+    )
+    farmer_input = FarmerInput(**inputs)
+    stage_generation(farmer_input, model, save_to_db=True, latitude=first.latitude, longitude=first.longitude, session_state={})
+
+
+def refresh_active_stages(today=None, model: str = None, replan: bool = True, tolerance: float = None) -> dict:
+    """
+    Daily job over every active planting (latest plan per farm that has not
+    ended). Plans within `tolerance` of the observed GDD get their CURRENT
+    STAGE rewritten; drifted plans are generated again when `replan` is set.
+    """
+    from backend.init_db import SessionLocal
+    from backend.data_store import get_active_stage_plans, update_stage_output
+    from backend.db_models import Stage
+
+    today = today or date.today()
+    tolerance = STAGE_DRIFT_TOLERANCE if tolerance is None else tolerance
+    summary = {"plans": 0, "refreshed": 0, "drifted": 0, "replanned": 0, "failed": 0}
+    with SessionLocal() as session:
+        plans = get_active_stage_plans(session, today)
+    summary["plans"] = len(plans)
+
+    for stage_id, rows in plans.items():
+        try:
+            try:
+                drift = plan_drift(rows, today)
+            except Exception as ex:
+                print(f"[stage_tracker] Warning: drift check failed for {rows[0].farm_key}: {ex}")
+                drift = None
+            if drift is not None and abs(drift) > tolerance:
+                summary["drifted"] += 1
+                if replan:
+                    _replan(rows, model)
+                    summary["replanned"] += 1
+                continue
+            stages = [(r.name, r.start_date, r.end_date) for r in rows]
+            with SessionLocal() as session:
+                stage = session.get(Stage, stage_id)
+                if stage is None:
+                    continue
+                body = CURRENT_STAGE_PATTERN.sub("", stage.output or "").rstrip() + "\n"
+                update_stage_output(session, stage_id, body + current_stage_text(stages, rows[0].sowing_date, today))
+            summary["refreshed"] += 1
+        except Exception as ex:
+            summary["failed"] += 1
+            print(f"[stage_tracker] Warning: stage refresh failed for plan {stage_id}: {ex}")
+    return summary
@@ -1,5 +1,6 @@
 import streamlit as st
 import json
+import time
 import zipfile
 from io import BytesIO
 from datetime import datetime
@@ -13,6 +14,9 @@ from pest import Pest_system_prompt, pest_agent
 from disease import Disease_system_prompt, disease_agent
 from irrigation import irrigation_agent, irrigation_system_prompt
 from merge_agent import Merge_system_prompt, merge_agent
+from pipeline import run_pipeline
+from llm_cache import fresh_answers
+from llm_router import stream_to
 import folium
 from streamlit_folium import st_folium
 from folium.plugins import Draw, Fullscreen
@@ -240,21 +244,9 @@ def _render_db_snapshot(snapshot, title: str = "Database (latest rows)"):
 
 
 def _estimate_tokens(text: str, model_name: str = "") -> int:
-    if not text:
-        return 0
-
-    try:
-        import tiktoken
-
-        m = (model_name or "").strip()
-        try:
-            enc = tiktoken.encoding_for_model(m)
-        except Exception:
-            enc = tiktoken.get_encoding("cl100k_base")
-        return len(enc.encode(text))
-    except Exception:
-        # Rough fallback: ~4 chars per token
-        return max(1, int(len(text) / 4))
+    # Same estimator the rate limiter uses in llm_router
+    from llm_router import estimate_tokens
+    return estimate_tokens(text, model_name)
 
 
 def _estimate_total_tokens_for_run(run_id: int) -> int:
@@ -597,6 +589,36 @@ if nav == "Agents":
             st.markdown(f"**Generation tokens (latest run):** {tok.get('completion_tokens', 0)}")
             st.markdown(f"**Total tokens (latest run):** {tok.get('total_tokens', 0)}")
 
+    with st.expander("Timings", expanded=False):
+        last_timings = st.session_state.get('last_pipeline_timings')
+        if not last_timings:
+            st.caption("Use 'Run All Agents' to see per-agent timings.")
+        else:
+            st.markdown(f"**Wall clock (latest run):** {last_timings.get('total_seconds', 0):.2f}s")
+            st.markdown(f"**Critical path:** {' → '.join(last_timings.get('critical_path') or [])}")
+            st.dataframe(
+                [
+                    {'agent': name, **t}
+                    for name, t in sorted(
+                        (last_timings.get('timings') or {}).items(),
+                        key=lambda kv: kv[1].get('started_at', 0),
+                    )
+                ],
+                use_container_width=True,
+            )
+
+    with st.expander("LLM cache", expanded=False):
+        from llm_cache import stats as llm_cache_stats
+        cache_stats = llm_cache_stats()
+        st.markdown(
+            f"**Hit rate:** {cache_stats['hit_rate']:.0%} "
+            f"({cache_stats['hits']} memory + {cache_stats['db_hits']} DB hits, {cache_stats['misses']} misses)"
+        )
+        st.caption(
+            f"Bypassed: {cache_stats['bypassed']} · Writes: {cache_stats['writes']} · "
+            f"Evictions: {cache_stats['evictions']} · In memory: {cache_stats['lru_size']}"
+        )
+
 
 # Initialize session state
 if 'selected_agent' not in st.session_state:
@@ -614,6 +636,8 @@ if 'temperature' not in st.session_state:
     st.session_state.temperature = 0.2
 if 'max_tokens' not in st.session_state:
     st.session_state.max_tokens = 1500
+if 'bypass_llm_cache' not in st.session_state:
+    st.session_state.bypass_llm_cache = False
 
 if 'location_coords' not in st.session_state:
     st.session_state.location_coords = None
@@ -689,6 +713,7 @@ with st.sidebar:
             "Claude 3.5 Sonnet (Anthropic)": "claude-3-5-sonnet-20240620",
             "Claude 3.5 Haiku (Anthropic)": "claude-3-5-haiku-20241022",
             "Gemini 2.5 Flash (Google)": "gemini-2.5-flash",
+            "Fake LLM (offline, no API key)": "fake:",
         }
         selected_model_name = st.selectbox(
             "Select Model",
@@ -711,6 +736,11 @@ with st.sidebar:
             value=int(st.session_state.max_tokens),
             step=100,
         )
+        st.session_state.bypass_llm_cache = st.checkbox(
+            "Fresh answers (skip LLM cache)",
+            value=bool(st.session_state.bypass_llm_cache),
+            help="Regenerate instead of reusing a cached response for an identical prompt.",
+        )
         
         st.markdown("---")
         
@@ -1111,115 +1141,28 @@ if st.session_state.form_submitted:
                 lat = st.session_state.location_coords[0] if st.session_state.location_coords else None
                 lon = st.session_state.location_coords[1] if st.session_state.location_coords else None
 
-                # Run each agent under the same run_id
-                st.session_state.agent_outputs['soil'] = run_soil_agent(
-                    location=farmer_input.location,
-                    crop_name=farmer_input.crop_name,
-                    crop_variety=farmer_input.crop_variety,
-                    sowing_date=farmer_input.sowing_date,
-                    area=farmer_input.area,
-                    latitude=lat,
-                    longitude=lon,
-                    soil_type="",
-                    custom_prompt=st.session_state.custom_prompts['soil'],
-                    model=st.session_state.selected_model,
-                    temperature=st.session_state.temperature,
-                    max_tokens=st.session_state.max_tokens,
-                    run_id=run_id,
-                )
-
-                st.session_state.agent_outputs['water'] = water_agent(
-                    farmer_input,
-                    custom_prompt=st.session_state.custom_prompts['water'],
-                    model=st.session_state.selected_model,
-                    temperature=st.session_state.temperature,
-                    max_tokens=st.session_state.max_tokens,
-                    run_id=run_id,
-                )
-
-                st.session_state.agent_outputs['weather'] = weather_7day_compact(
-                    location=farmer_input.location,
-                    latitude=lat,
-                    longitude=lon,
-                    days=7,
-                    save_to_db=True,
-                    model_name=st.session_state.selected_model,
-                    crop_name=farmer_input.crop_name,
-                    run_id=run_id,
-                )
-
-                st.session_state.agent_outputs['stage'] = stage_generation(
-                    farmer_input,
-                    model=st.session_state.selected_model,
-                    temperature=st.session_state.temperature,
-                    max_tokens=st.session_state.max_tokens,
-                    latitude=lat,
-                    longitude=lon,
-                    session_state=st.session_state,
-                    run_id=run_id,
-                )
-
-                st.session_state.agent_outputs['nutrient'] = nutrient_agent(
-                    farmer_input,
-                    custom_prompt=st.session_state.custom_prompts['nutrient'],
-                    model=st.session_state.selected_model,
-                    temperature=st.session_state.temperature,
-                    max_tokens=st.session_state.max_tokens,
-                    session_state=st.session_state,
-                    latitude=lat,
-                    longitude=lon,
-                    run_id=run_id,
-                )
-
-                st.session_state.agent_outputs['pest'] = pest_agent(
-                    farmer_input,
-                    custom_prompt=st.session_state.custom_prompts['pest'],
-                    model=st.session_state.selected_model,
-                    temperature=st.session_state.temperature,
-                    max_tokens=st.session_state.max_tokens,
-                    session_state=st.session_state,
-                    latitude=lat,
-                    longitude=lon,
-                    run_id=run_id,
-                )
-
-                st.session_state.agent_outputs['disease'] = disease_agent(
+                # Run the agent graph under the same run_id (independent agents run concurrently)
+                pipeline_state = {
+                    'agent_outputs': {},
+                    'custom_prompts': dict(st.session_state.custom_prompts),
+                }
+                result = run_pipeline(
                     farmer_input,
-                    custom_prompt=st.session_state.custom_prompts['disease'],
                     model=st.session_state.selected_model,
                     temperature=st.session_state.temperature,
                     max_tokens=st.session_state.max_tokens,
-                    session_state=st.session_state,
-                    latitude=lat,
-                    longitude=lon,
-                    run_id=run_id,
-                )
-
-                st.session_state.agent_outputs['irrigation'] = irrigation_agent(
-                    farmer_input,
-                    custom_prompt=st.session_state.custom_prompts['irrigation'],
-                    model_name=st.session_state.selected_model,
-                    temperature=st.session_state.temperature,
-                    max_tokens=st.session_state.max_tokens,
-                    session_state=st.session_state,
                     latitude=lat,
                     longitude=lon,
                     run_id=run_id,
+                    session_state=pipeline_state,
+                    bypass_cache=st.session_state.bypass_llm_cache,
                 )
-
-                st.session_state.agent_outputs['merge'] = merge_agent(
-                    soil=st.session_state.agent_outputs.get('soil'),
-                    nutrient=st.session_state.agent_outputs.get('nutrient'),
-                    irrigation=st.session_state.agent_outputs.get('irrigation'),
-                    pest=st.session_state.agent_outputs.get('pest'),
-                    disease=st.session_state.agent_outputs.get('disease'),
-                    weather=st.session_state.agent_outputs.get('weather'),
-                    stage=st.session_state.agent_outputs.get('stage'),
-                    custom_prompt=st.session_state.custom_prompts['merge'],
-                    model_name=st.session_state.selected_model,
-                    temperature=st.session_state.temperature,
-                    max_tokens=st.session_state.max_tokens,
-                )
+                st.session_state.agent_outputs.update(result['outputs'])
+                st.session_state.last_pipeline_timings = {
+                    'timings': result['timings'],
+                    'critical_path': result['critical_path'],
+                    'total_seconds': result['total_seconds'],
+                }
                 st.success("✅ Agent completed successfully!")
                 st.rerun()
                 
@@ -1442,141 +1385,163 @@ if st.session_state.selected_agent:
                     if agent_id != 'weather' and prompt_to_use:
                         _save_prompt_event(agent_id, prompt_source, 'used', prompt_to_use)
 
-                    if agent_id == 'soil':
-                        output = run_soil_agent(
-                            location=farmer_input.location,
-                            crop_name=farmer_input.crop_name,
-                            crop_variety=farmer_input.crop_variety,
-                            sowing_date=farmer_input.sowing_date,
-                            area=farmer_input.area,
-                            latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
-                            longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
-                            soil_type="",
-                            custom_prompt=prompt_to_use,
-                            model=st.session_state.selected_model,
-                            temperature=st.session_state.temperature,
-                            max_tokens=st.session_state.max_tokens,
-                            run_id=run_id,
-                        )
-                    elif agent_id == 'water':
-                        output = water_agent(
-                            farmer_input,
-                            custom_prompt=prompt_to_use,
-                            model=st.session_state.selected_model,
-                            temperature=st.session_state.temperature,
-                            max_tokens=st.session_state.max_tokens,
-                            run_id=run_id,
-                        )
-                    elif agent_id == 'weather':
-                        output = weather_7day_compact(
-                            location=location_name,
-                            latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
-                            longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
-                            days=7,
-                            save_to_db=True,
-                            model_name=st.session_state.selected_model,
-                            crop_name=farmer_input.crop_name,
-                            run_id=run_id,
-                        )
-                        #     )
-                    elif agent_id == 'stage':
-                        output = stage_generation(
-                            farmer_input,
-                            model=st.session_state.selected_model,
-                            temperature=st.session_state.temperature,
-                            max_tokens=st.session_state.max_tokens,
-                            latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
-                            longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
-                            session_state=st.session_state,
-                            run_id=run_id,
-                        )
-                    elif agent_id == 'nutrient':
-                        output = nutrient_agent(
-                            farmer_input,
-                            custom_prompt=prompt_to_use,
-                            model=st.session_state.selected_model,
-                            temperature=st.session_state.temperature,
-                            max_tokens=st.session_state.max_tokens,
-                            session_state=st.session_state,
-                            latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
-                            longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
-                            run_id=run_id,
-                        )
-                    elif agent_id == 'pest':
-                        output = pest_agent(
-                            farmer_input,
-                            custom_prompt=prompt_to_use,
-                            model=st.session_state.selected_model,
-                            temperature=st.session_state.temperature,
-                            max_tokens=st.session_state.max_tokens,
-                            session_state=st.session_state,
-                            latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
-                            longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
-                            run_id=run_id,
-                        )
-                    elif agent_id == 'disease':
-                        output = disease_agent(
-                            farmer_input,
-                            custom_prompt=prompt_to_use,
-                            model=st.session_state.selected_model,
-                            temperature=st.session_state.temperature,
-                            max_tokens=st.session_state.max_tokens,
-                            latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
-                            longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
-                            run_id=run_id,
-                        )
-                    elif agent_id == 'irrigation':
-                        output = irrigation_agent(
-                            farmer_input,
-                            custom_prompt=prompt_to_use,
-                            model_name=st.session_state.selected_model,
-                            temperature=st.session_state.temperature,
-                            max_tokens=st.session_state.max_tokens,
-                            latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
-                            longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
-                            run_id=run_id,
-                        )
-                    elif agent_id == 'merge':
-                        output = merge_agent(
-                            soil=st.session_state.agent_outputs.get('soil'),
-                            nutrient=st.session_state.agent_outputs.get('nutrient'),
-                            irrigation=st.session_state.agent_outputs.get('irrigation'),
-                            pest=st.session_state.agent_outputs.get('pest'),
-                            disease=st.session_state.agent_outputs.get('disease'),
-                            weather=st.session_state.agent_outputs.get('weather'),
-                            stage=st.session_state.agent_outputs.get('stage'),
-                            custom_prompt=prompt_to_use,
-                            model_name=st.session_state.selected_model,
-                            temperature=st.session_state.temperature,
-                            max_tokens=st.session_state.max_tokens,
-                        )
+                    # Render tokens as they arrive; the saved output replaces this on rerun
+                    stream_box = st.empty()
+                    streamed = {'agent': None, 'text': '', 'shown': 0.0}
+
+                    def _on_chunk(stream_agent, chunk):
+                        if stream_agent != streamed['agent']:
+                            streamed['agent'] = stream_agent
+                            streamed['text'] = ''
+                        streamed['text'] += chunk
+                        now = time.monotonic()
+                        if now - streamed['shown'] >= 0.1:
+                            streamed['shown'] = now
+                            stream_box.code(f"[{stream_agent or agent_id}]\n{streamed['text']}", language="text")
+
+                    # 'Fresh answer' skips LLM cache reads for this run
+                    with fresh_answers(st.session_state.bypass_llm_cache), stream_to(_on_chunk):
+                        if agent_id == 'soil':
+                            output = run_soil_agent(
+                                location=farmer_input.location,
+                                crop_name=farmer_input.crop_name,
+                                crop_variety=farmer_input.crop_variety,
+                                sowing_date=farmer_input.sowing_date,
+                                area=farmer_input.area,
+                                latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
+                                longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
+                                soil_type="",
+                                custom_prompt=prompt_to_use,
+                                model=st.session_state.selected_model,
+                                temperature=st.session_state.temperature,
+                                max_tokens=st.session_state.max_tokens,
+                                run_id=run_id,
+                            )
+                        elif agent_id == 'water':
+                            output = water_agent(
+                                farmer_input,
+                                custom_prompt=prompt_to_use,
+                                model=st.session_state.selected_model,
+                                temperature=st.session_state.temperature,
+                                max_tokens=st.session_state.max_tokens,
+                                run_id=run_id,
+                            )
+                        elif agent_id == 'weather':
+                            output = weather_7day_compact(
+                                location=location_name,
+                                latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
+                                longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
+                                days=7,
+                                save_to_db=True,
+                                model_name=st.session_state.selected_model,
+                                crop_name=farmer_input.crop_name,
+                                run_id=run_id,
+                            )
+                            #     )
+                        elif agent_id == 'stage':
+                            output = stage_generation(
+                                farmer_input,
+                                model=st.session_state.selected_model,
+                                temperature=st.session_state.temperature,
+                                max_tokens=st.session_state.max_tokens,
+                                latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
+                                longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
+                                session_state=st.session_state,
+                                run_id=run_id,
+                            )
+                        elif agent_id == 'nutrient':
+                            output = nutrient_agent(
+                                farmer_input,
+                                custom_prompt=prompt_to_use,
+                                model=st.session_state.selected_model,
+                                temperature=st.session_state.temperature,
+                                max_tokens=st.session_state.max_tokens,
+                                session_state=st.session_state,
+                                latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
+                                longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
+                                run_id=run_id,
+                            )
+                        elif agent_id == 'pest':
+                            output = pest_agent(
+                                farmer_input,
+                                custom_prompt=prompt_to_use,
+                                model=st.session_state.selected_model,
+                                temperature=st.session_state.temperature,
+                                max_tokens=st.session_state.max_tokens,
+                                session_state=st.session_state,
+                                latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
+                                longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
+                                run_id=run_id,
+                            )
+                        elif agent_id == 'disease':
+                            output = disease_agent(
+                                farmer_input,
+                                custom_prompt=prompt_to_use,
+                                model=st.session_state.selected_model,
+                                temperature=st.session_state.temperature,
+                                max_tokens=st.session_state.max_tokens,
+                                latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
+                                longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
+                                run_id=run_id,
+                            )
+                        elif agent_id == 'irrigation':
+                            output = irrigation_agent(
+                                farmer_input,
+                                custom_prompt=prompt_to_use,
+                                model_name=st.session_state.selected_model,
+                                temperature=st.session_state.temperature,
+                                max_tokens=st.session_state.max_tokens,
+                                latitude=st.session_state.location_coords[0] if st.session_state.location_coords else None,
+                                longitude=st.session_state.location_coords[1] if st.session_state.location_coords else None,
+                                run_id=run_id,
+                            )
+                        elif agent_id == 'merge':
+                            output = merge_agent(
+                                soil=st.session_state.agent_outputs.get('soil'),
+                                nutrient=st.session_state.agent_outputs.get('nutrient'),
+                                irrigation=st.session_state.agent_outputs.get('irrigation'),
+                                pest=st.session_state.agent_outputs.get('pest'),
+                                disease=st.session_state.agent_outputs.get('disease'),
+                                weather=st.session_state.agent_outputs.get('weather'),
+                                stage=st.session_state.agent_outputs.get('stage'),
+                                agent_data={
+                                    name: value.get('data')
+                                    for name, value in st.session_state.agent_outputs.items()
+                                    if isinstance(value, dict)
+                                },
+                                custom_prompt=prompt_to_use,
+                                model_name=st.session_state.selected_model,
+                                temperature=st.session_state.temperature,
+                                max_tokens=st.session_state.max_tokens,
+                            )
 
-                        try:
-                            from backend.init_db import SessionLocal
-                            from backend.data_store import save_merge
-
-                            def _txt(v):
-                                if isinstance(v, dict) and 'output' in v:
-                                    return v.get('output')
-                                return v
-
-                            with SessionLocal() as session:
-                                save_merge(
-                                    session,
-                                    soil=_txt(st.session_state.agent_outputs.get('soil')),
-                                    nutrient=_txt(st.session_state.agent_outputs.get('nutrient')),
-                                    irrigation=_txt(st.session_state.agent_outputs.get('irrigation')),
-                                    pest=_txt(st.session_state.agent_outputs.get('pest')),
-                                    disease=_txt(st.session_state.agent_outputs.get('disease')),
-                                    weather=_txt(st.session_state.agent_outputs.get('weather')),
-                                    stage=_txt(st.session_state.agent_outputs.get('stage')),
-                                    model_name=st.session_state.selected_model,
-                                    prompt=prompt_to_use,
-                                    output=output,
-                                    run_id=run_id,
-                                )
-                        except Exception:
-                            pass
+                            try:
+                                from backend.init_db import SessionLocal
+                                from backend.data_store import save_merge
+                                from llm_router import answered_model
+
+                                def _txt(v):
+                                    if isinstance(v, dict) and 'output' in v:
+                                        return v.get('output')
+                                    return v
+
+                                with SessionLocal() as session:
+                                    save_merge(
+                                        session,
+                                        soil=_txt(st.session_state.agent_outputs.get('soil')),
+                                        nutrient=_txt(st.session_state.agent_outputs.get('nutrient')),
+                                        irrigation=_txt(st.session_state.agent_outputs.get('irrigation')),
+                                        pest=_txt(st.session_state.agent_outputs.get('pest')),
+                                        disease=_txt(st.session_state.agent_outputs.get('disease')),
+                                        weather=_txt(st.session_state.agent_outputs.get('weather')),
+                                        stage=_txt(st.session_state.agent_outputs.get('stage')),
+                                        model_name=answered_model([output], st.session_state.selected_model),
+                                        prompt=prompt_to_use,
+                                        output=output,
+                                        run_id=run_id,
+                                    )
+                            except Exception:
+                                pass
                     
                     st.session_state.agent_outputs[agent_id] = output
                     st.success("✅ Agent completed successfully!")
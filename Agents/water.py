@@ -8,7 +8,9 @@ from together import Together
 from dataclasses import dataclass
 from openai import OpenAI
 from langgraph.graph import StateGraph
-from llm_router import call_llm
+from llm_router import call_llm, acall_llm, answered_model
+from schemas import output_schema
+import asyncio
 
 load_dotenv()
 
@@ -102,16 +104,8 @@ water_system_prompt = """
     """
 
 
-def water_agent(farmer: FarmerInput, 
-    custom_prompt: str = None, 
-    model: str = None,  
-    temperature: float = 0.1, 
-    max_tokens: int = 1200, 
-    save_to_db: bool = True,
-    run_id: int = None) -> dict:  # returns {'output': ..., 'id': ...}
-    """
-    Water Agent that uses FarmerInput dataclass.
-    """
+def _water_request(farmer: FarmerInput, custom_prompt: str = None, model: str = None):
+    """Build (system_prompt, user_msg, chosen_model) for the water agent."""
     location = farmer.location
     crop = farmer.crop_name
     water_source = farmer.water_source if farmer.water_source else ""
@@ -133,6 +127,33 @@ def water_agent(farmer: FarmerInput,
 
     system_prompt = custom_prompt if custom_prompt else water_system_prompt
     chosen_model = model if model else MODEL_NAME
+    return system_prompt, user_msg, chosen_model
+
+
+def _save_water_result(text, farmer: FarmerInput, chosen_model, system_prompt, save_to_db=True, run_id=None) -> dict:
+    if save_to_db:
+        try:
+            from backend.init_db import SessionLocal
+            from backend.data_store import save_water
+            with SessionLocal() as session:
+                obj = save_water(session, farmer.location, farmer.crop_name, answered_model([text], chosen_model), system_prompt, text, run_id=run_id)
+                return {'output': text, 'id': obj.id, 'data': getattr(text, 'data', None)}
+        except Exception as ex:
+            print(f'[water_agent] Warning: Could not save to DB: {ex}')
+    return {'output': text, 'id': None, 'data': getattr(text, 'data', None)}
+
+
+def water_agent(farmer: FarmerInput, 
+    custom_prompt: str = None, 
+    model: str = None,  
+    temperature: float = 0.1, 
+    max_tokens: int = 1200, 
+    save_to_db: bool = True,
+    run_id: int = None) -> dict:  # returns {'output': ..., 'id': ...}
+    """
+    Water Agent that uses FarmerInput dataclass.
+    """
+    system_prompt, user_msg, chosen_model = _water_request(farmer, custom_prompt, model)
 
     try:
         text = call_llm(
@@ -141,17 +162,38 @@ def water_agent(farmer: FarmerInput,
             user_message=user_msg,
             temperature=temperature,
             max_tokens=max_tokens,
+            agent="water",
+            response_schema=output_schema("water"),
         )
     except Exception as e:
         return f"Error calling model {chosen_model}: {e}"
 
-    if save_to_db:
-        try:
-            from backend.init_db import SessionLocal
-            from backend.data_store import save_water
-            with SessionLocal() as session:
-                obj = save_water(session, location, crop, chosen_model, system_prompt, text, run_id=run_id)
-                return {'output': text, 'id': obj.id}
-        except Exception as ex:
-            print(f'[water_agent] Warning: Could not save to DB: {ex}')
-    return {'output': text, 'id': None}
\ No newline at end of file
+    return _save_water_result(text, farmer, chosen_model, system_prompt, save_to_db, run_id)
+
+
+async def awater_agent(farmer: FarmerInput,
+    custom_prompt: str = None,
+    model: str = None,
+    temperature: float = 0.1,
+    max_tokens: int = 1200,
+    save_to_db: bool = True,
+    run_id: int = None) -> dict:
+    """
+    Async variant of water_agent using acall_llm.
+    """
+    system_prompt, user_msg, chosen_model = _water_request(farmer, custom_prompt, model)
+
+    try:
+        text = await acall_llm(
+            model=chosen_model,
+            system_prompt=system_prompt,
+            user_message=user_msg,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            agent="water",
+            response_schema=output_schema("water"),
+        )
+    except Exception as e:
+        return f"Error calling model {chosen_model}: {e}"
+
+    return await asyncio.to_thread(_save_water_result, text, farmer, chosen_model, system_prompt, save_to_db, run_id)
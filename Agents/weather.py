@@ -1,7 +1,14 @@
+import os
+import re
+import time
+import threading
 import requests
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import math
 import json 
+import numpy as np
+from weather_columns import to_columns, daily_means, closest_hour_index
 try:
     from zoneinfo import ZoneInfo
 except Exception:
@@ -27,11 +34,176 @@ DAILY_VARS = [
 
 TZ_OFFSET_FALLBACK = {"Asia/Kolkata": 5.5, "UTC": 0.0}
 
+# Service base URLs; point them at a mirror or the local stand-in
+# (benchmarks/weather_standin.py) for offline runs and load tests.
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com").rstrip("/")
+OPEN_METEO_GEOCODING_URL = os.getenv("OPEN_METEO_GEOCODING_URL", "https://geocoding-api.open-meteo.com").rstrip("/")
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org").rstrip("/")
+NOMINATIM_HEADERS = {"User-Agent": "CropAdvisorySystem/1.0 (your@email.com)"}
+# The public Nominatim usage policy allows at most 1 request per second
+NOMINATIM_MIN_INTERVAL = float(os.getenv(
+    "NOMINATIM_MIN_INTERVAL",
+    "1.0" if NOMINATIM_URL == "https://nominatim.openstreetmap.org" else "0",
+))
+
+# Geocode cache: forward lookups are keyed by normalized name, reverse lookups
+# by lat/lon snapped to a GEOCODE_GRID_DEGREES grid (0.01 deg is ~1 km), so
+# farms in the same village share an entry. In-process LRU first, then the
+# geocode_cache table.
+GEOCODE_GRID_DEGREES = float(os.getenv("GEOCODE_GRID_DEGREES", "0.01"))
+GEOCODE_TTL_SECONDS = int(os.getenv("GEOCODE_TTL_SECONDS", str(90 * 24 * 3600)))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "4096"))
+
+# Forecast tile cache: the raw Open-Meteo response does not depend on the crop,
+# so it is stored once per WEATHER_TILE_GRID_DEGREES cell (0.05 deg is ~5 km,
+# finer than the model grid) + timezone + days and shared by every farm in the
+# cell. A tile is fresh for the current issue window (WEATHER_TILE_ISSUE_HOURS);
+# after that it is served stale for up to WEATHER_TILE_MAX_STALE_SECONDS while
+# a background refresh fetches the new issue.
+WEATHER_TILE_GRID_DEGREES = float(os.getenv("WEATHER_TILE_GRID_DEGREES", "0.05"))
+WEATHER_TILE_ISSUE_HOURS = max(1, int(os.getenv("WEATHER_TILE_ISSUE_HOURS", "1")))
+WEATHER_TILE_MAX_STALE_SECONDS = int(os.getenv("WEATHER_TILE_MAX_STALE_SECONDS", str(6 * 3600)))
+WEATHER_TILE_MAX_ENTRIES = int(os.getenv("WEATHER_TILE_MAX_ENTRIES", "1024"))
+# Multi-location requests (fetch_open_meteo_batch): cells per request and
+# requests in flight.
+WEATHER_BATCH_SIZE = int(os.getenv("WEATHER_BATCH_SIZE", "50"))
+WEATHER_BATCH_WORKERS = int(os.getenv("WEATHER_BATCH_WORKERS", "4"))
+
+_geo_lru = OrderedDict()  # key -> (stored_at, geo dict)
+_geo_lock = threading.Lock()
+_geo_stats = {"hits": 0, "db_hits": 0, "misses": 0}
+_nominatim_lock = threading.Lock()
+_nominatim_next_slot = 0.0
+_tile_lru = OrderedDict()  # key -> (issued_at, raw forecast dict)
+_tile_lock = threading.Lock()
+_tile_stats = {"fresh": 0, "stale": 0, "db_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+_tile_refreshing = set()
+_tile_pool = None
+
+
+def normalize_location_name(name: str) -> str:
+    """Case/punctuation/whitespace-insensitive form of a place name."""
+    return " ".join(re.sub(r"[,;.()/_-]+", " ", (name or "").lower()).split())
+
+
+def snap_to_grid(lat: float, lon: float, grid: float = None):
+    """Snap coordinates to the nearest grid point (multiples of grid degrees)."""
+    grid = grid or GEOCODE_GRID_DEGREES
+    return round(round(lat / grid) * grid, 6), round(round(lon / grid) * grid, 6)
+
+
+def _forward_key(location: str) -> str:
+    return f"fwd:{normalize_location_name(location)}"
+
+
+def _reverse_key(lat: float, lon: float) -> str:
+    slat, slon = snap_to_grid(lat, lon)
+    return f"rev:{GEOCODE_GRID_DEGREES:g}:{slat:.6f},{slon:.6f}"
+
+
+def _cached_geo(key: str):
+    now = time.time()
+    with _geo_lock:
+        entry = _geo_lru.get(key)
+        if entry is not None:
+            if now - entry[0] <= GEOCODE_TTL_SECONDS:
+                _geo_lru.move_to_end(key)
+                _geo_stats["hits"] += 1
+                return dict(entry[1])
+            del _geo_lru[key]
+    try:
+        from backend.init_db import SessionLocal
+        from backend.data_store import get_geocode
+
+        with SessionLocal() as session:
+            row = get_geocode(session, key, max_age_seconds=GEOCODE_TTL_SECONDS)
+            if row is not None:
+                geo = {
+                    "name": row.name,
+                    "latitude": row.latitude,
+                    "longitude": row.longitude,
+                    "country": row.country,
+                    "admin1": row.admin1,
+                    "timezone": row.timezone,
+                }
+                _remember_geo(key, geo)
+                with _geo_lock:
+                    _geo_stats["db_hits"] += 1
+                return dict(geo)
+    except Exception as ex:
+        print(f"[weather] Warning: geocode cache lookup failed: {ex}")
+    with _geo_lock:
+        _geo_stats["misses"] += 1
+    return None
+
+
+def _remember_geo(key: str, geo: dict):
+    with _geo_lock:
+        _geo_lru[key] = (time.time(), dict(geo))
+        _geo_lru.move_to_end(key)
+        while len(_geo_lru) > GEOCODE_CACHE_MAX_ENTRIES:
+            _geo_lru.popitem(last=False)
+
+
+def _store_geo(key: str, geo: dict, source: str):
+    _remember_geo(key, geo)
+    try:
+        from backend.init_db import SessionLocal
+        from backend.data_store import save_geocode
+
+        with SessionLocal() as session:
+            save_geocode(session, key, geo, source=source)
+    except Exception as ex:
+        print(f"[weather] Warning: Could not save geocode to DB: {ex}")
+
+
+def geocode_cache_stats() -> dict:
+    with _geo_lock:
+        out = dict(_geo_stats)
+        out["lru_size"] = len(_geo_lru)
+    return out
+
+
+def clear_geocode_cache():
+    """Drop the in-process tier and zero the counters (the DB tier is kept)."""
+    with _geo_lock:
+        _geo_lru.clear()
+        for name in _geo_stats:
+            _geo_stats[name] = 0
+
+
+def _nominatim_get(path: str, params: dict):
+    """GET a Nominatim endpoint, spacing requests NOMINATIM_MIN_INTERVAL apart."""
+    global _nominatim_next_slot
+    if NOMINATIM_MIN_INTERVAL > 0:
+        with _nominatim_lock:
+            now = time.monotonic()
+            slot = max(now, _nominatim_next_slot)
+            _nominatim_next_slot = slot + NOMINATIM_MIN_INTERVAL
+        if slot > now:
+            time.sleep(slot - now)
+    r = requests.get(f"{NOMINATIM_URL}{path}", params=params, headers=NOMINATIM_HEADERS, timeout=10)
+    r.raise_for_status()
+    return r.json()
+
 
 def geocode_location(location: str):
-    """Geocode a location using Open-Meteo API with a Nominatim fallback."""
+    """Geocode a location using Open-Meteo API with a Nominatim fallback.
+    Results are cached by normalized name (see GEOCODE_TTL_SECONDS)."""
+    key = _forward_key(location)
+    cached = _cached_geo(key)
+    if cached is not None:
+        return cached
+    geo, source = _geocode_location_remote(location)
+    if geo and geo.get("latitude") is not None and geo.get("longitude") is not None:
+        _store_geo(key, geo, source)
+    return geo
+
+
+def _geocode_location_remote(location: str):
+    """Returns (geo, source) or (None, None)."""
     try:
-        url = "https://geocoding-api.open-meteo.com/v1/search"
+        url = f"{OPEN_METEO_GEOCODING_URL}/v1/search"
         params = {"name": location, "count": 1, "language": "en", "format": "json"}
         r = requests.get(url, params=params, timeout=10)
         r.raise_for_status()
@@ -45,22 +217,18 @@ def geocode_location(location: str):
                 "country": res.get("country"),
                 "admin1": res.get("admin1"),
                 "timezone": res.get("timezone")
-            }
+            }, "open-meteo"
     except Exception:
         pass
 
     try:
-        url = "https://nominatim.openstreetmap.org/search"
         params = {
             "q": location,
             "format": "json",
             "limit": 1,
             "addressdetails": 1,
         }
-        headers = {"User-Agent": "CropAdvisorySystem/1.0 (your@email.com)"}
-        r = requests.get(url, params=params, headers=headers, timeout=10)
-        r.raise_for_status()
-        data = r.json()
+        data = _nominatim_get("/search", params)
         if isinstance(data, list) and len(data) > 0:
             res = data[0]
             addr = res.get("address", {}) or {}
@@ -71,20 +239,41 @@ def geocode_location(location: str):
                 "country": addr.get("country", "Unknown"),
                 "admin1": addr.get("state", ""),
                 "timezone": "Asia/Kolkata",
-            }
+            }, "nominatim"
     except Exception:
         pass
 
-    return None
+    return None, None
 
 
 def reverse_geocode(lat: float, lon: float):
     """
     Reverse geocode coordinates to get location name using Nominatim (OpenStreetMap).
+    Results are cached per grid cell (GEOCODE_GRID_DEGREES); the returned
+    latitude/longitude are always the ones passed in.
     """
+    key = _reverse_key(lat, lon)
+    cached = _cached_geo(key)
+    if cached is not None:
+        cached.update({"latitude": lat, "longitude": lon})
+        return cached
+    geo = _reverse_geocode_remote(lat, lon)
+    if geo is not None:
+        _store_geo(key, geo, "nominatim")
+        return geo
+    return {
+        "name": f"Location ({lat:.4f}, {lon:.4f})",
+        "latitude": lat,
+        "longitude": lon,
+        "country": "Unknown",
+        "admin1": "",
+        "timezone": "Asia/Kolkata"
+    }
+
+
+def _reverse_geocode_remote(lat: float, lon: float):
+    """Returns the geo dict, or None if the lookup failed."""
     try:
-        # Use nominatim-style reverse geocoding
-        url = "https://nominatim.openstreetmap.org/reverse"
         # Search for closest location to these coordinates
         params = {
             "lat": lat,
@@ -93,10 +282,7 @@ def reverse_geocode(lat: float, lon: float):
             "zoom": 10,
             "addressdetails": 1
         }
-        headers = {"User-Agent": "CropAdvisorySystem/1.0 (your@email.com)"}
-        r = requests.get(url, params=params, headers=headers, timeout=10)
-        r.raise_for_status()
-        data = r.json()
+        data = _nominatim_get("/reverse", params)
         display_name = data.get("display_name", "")
         return {
             "name": display_name,
@@ -107,21 +293,13 @@ def reverse_geocode(lat: float, lon: float):
             "timezone": "Asia/Kolkata"
         }
     except Exception:
-        return {
-            "name": f"Location ({lat:.4f}, {lon:.4f})",
-            "latitude": lat,
-            "longitude": lon,
-            "country": "Unknown",
-            "admin1": "",
-            "timezone": "Asia/Kolkata"
-        }
+        return None
 
 
-def fetch_open_meteo(lat, lon, timezone_name, days=7):
+def _forecast_params(lat, lon, timezone_name, days):
     start_date = datetime.utcnow().date()
     end_date = start_date + timedelta(days=days)
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
+    return {
         "latitude": lat,
         "longitude": lon,
         "timezone": timezone_name,
@@ -130,11 +308,253 @@ def fetch_open_meteo(lat, lon, timezone_name, days=7):
         "start_date": start_date.isoformat(),
         "end_date": end_date.isoformat()
     }
-    r = requests.get(url, params=params, timeout=15)
+
+
+def fetch_open_meteo(lat, lon, timezone_name, days=7):
+    url = f"{OPEN_METEO_URL}/v1/forecast"
+    r = requests.get(url, params=_forecast_params(lat, lon, timezone_name, days), timeout=15)
     r.raise_for_status()
     return r.json()
 
 
+def _fetch_open_meteo_chunk(cells, timezone_name, days):
+    """One multi-location request; returns the responses in `cells` order."""
+    params = _forecast_params(
+        ",".join(f"{lat:.6f}" for lat, _ in cells),
+        ",".join(f"{lon:.6f}" for _, lon in cells),
+        timezone_name,
+        days,
+    )
+    r = requests.get(f"{OPEN_METEO_URL}/v1/forecast", params=params, timeout=15 + 2 * len(cells) ** 0.5)
+    r.raise_for_status()
+    data = r.json()
+    # a single location comes back as an object, several as a list
+    results = data if isinstance(data, list) else [data]
+    if len(results) != len(cells):
+        raise ValueError(f"expected {len(cells)} forecasts, got {len(results)}")
+    return results
+
+
+def fetch_open_meteo_batch(points, days: int = 7, chunk_size: int = None, max_workers: int = None):
+    """
+    Fetch forecasts for many points with multi-location Open-Meteo requests.
+
+    points: iterable of (lat, lon) or (lat, lon, timezone_name); the timezone
+    defaults to Asia/Kolkata. Points are reduced to distinct forecast tiles
+    (see get_forecast), grouped by timezone and sent WEATHER_BATCH_SIZE cells
+    per request, WEATHER_BATCH_WORKERS requests at a time. Every tile fetched
+    is stored in the tile cache.
+
+    Returns a list aligned with points: the raw forecast for each point's
+    tile, or None where its chunk failed.
+    """
+    chunk_size = max(1, chunk_size or WEATHER_BATCH_SIZE)
+    max_workers = max(1, max_workers or WEATHER_BATCH_WORKERS)
+    issued_at = _issue_time()
+
+    point_keys = []
+    cells = {}  # tile key -> (snapped lat, snapped lon, timezone)
+    for point in points:
+        lat, lon = float(point[0]), float(point[1])
+        timezone_name = (point[2] if len(point) > 2 else None) or "Asia/Kolkata"
+        key = tile_key(lat, lon, timezone_name, days)
+        point_keys.append(key)
+        if key not in cells:
+            slat, slon = snap_to_grid(lat, lon, WEATHER_TILE_GRID_DEGREES)
+            cells[key] = (slat, slon, timezone_name)
+
+    by_timezone = {}
+    for key, (slat, slon, timezone_name) in cells.items():
+        by_timezone.setdefault(timezone_name, []).append((key, slat, slon))
+    chunks = [
+        (timezone_name, group[i:i + chunk_size])
+        for timezone_name, group in by_timezone.items()
+        for i in range(0, len(group), chunk_size)
+    ]
+
+    def _run(chunk):
+        timezone_name, members = chunk
+        results = _fetch_open_meteo_chunk([(slat, slon) for _, slat, slon in members], timezone_name, days)
+        for (_, slat, slon), raw in zip(members, results):
+            store_forecast_tile(slat, slon, timezone_name, days, raw, issued_at=issued_at)
+        return {key: raw for (key, _, _), raw in zip(members, results)}
+
+    fetched = {}
+    if chunks:
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks)), thread_name_prefix="weather-batch") as pool:
+            futures = {pool.submit(_run, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    fetched.update(future.result())
+                except Exception as ex:
+                    timezone_name, members = futures[future]
+                    print(f"[weather] Warning: batch forecast for {len(members)} tiles ({timezone_name}) failed: {ex}")
+    return [fetched.get(key) for key in point_keys]
+
+
+def refresh_registered_farms(days: int = 7) -> dict:
+    """Nightly job: pre-fetch forecast tiles for every registered farm with coordinates."""
+    from backend.init_db import SessionLocal
+    from backend.user_store import get_farm_coordinates
+
+    with SessionLocal() as session:
+        points = get_farm_coordinates(session)
+    results = fetch_open_meteo_batch(points, days=days)
+    return {
+        "farms": len(points),
+        "tiles": len({tile_key(lat, lon, "Asia/Kolkata", days) for lat, lon in points}),
+        "failed": sum(1 for raw in results if raw is None),
+    }
+
+
+def _issue_time(now: datetime = None) -> datetime:
+    """Start of the current forecast issue window (UTC, naive)."""
+    now = now or datetime.utcnow()
+    return now.replace(minute=0, second=0, microsecond=0, hour=now.hour - now.hour % WEATHER_TILE_ISSUE_HOURS)
+
+
+def tile_key(lat: float, lon: float, timezone_name: str = "Asia/Kolkata", days: int = 7) -> str:
+    slat, slon = snap_to_grid(lat, lon, WEATHER_TILE_GRID_DEGREES)
+    return f"wx:{WEATHER_TILE_GRID_DEGREES:g}:{slat:.6f},{slon:.6f}:{timezone_name}:{days}"
+
+
+def _cached_tile(key: str):
+    """Returns (issued_at, raw) from the in-process tier or the DB, or None."""
+    with _tile_lock:
+        entry = _tile_lru.get(key)
+        if entry is not None:
+            _tile_lru.move_to_end(key)
+            return entry
+    try:
+        from backend.init_db import SessionLocal
+        from backend.data_store import get_weather_tile
+
+        with SessionLocal() as session:
+            row = get_weather_tile(session, key)
+            if row is not None and row.issued_at is not None and row.data:
+                entry = (row.issued_at, json.loads(row.data))
+                _remember_tile(key, *entry)
+                with _tile_lock:
+                    _tile_stats["db_hits"] += 1
+                return entry
+    except Exception as ex:
+        print(f"[weather] Warning: forecast tile lookup failed: {ex}")
+    return None
+
+
+def _remember_tile(key: str, issued_at: datetime, raw: dict):
+    with _tile_lock:
+        current = _tile_lru.get(key)
+        if current is not None and current[0] > issued_at:
+            return
+        _tile_lru[key] = (issued_at, raw)
+        _tile_lru.move_to_end(key)
+        while len(_tile_lru) > WEATHER_TILE_MAX_ENTRIES:
+            _tile_lru.popitem(last=False)
+
+
+def store_forecast_tile(lat: float, lon: float, timezone_name: str, days: int, raw: dict, issued_at: datetime = None):
+    """Put a raw Open-Meteo response into the tile cache (memory and DB)."""
+    issued_at = issued_at or _issue_time()
+    key = tile_key(lat, lon, timezone_name, days)
+    _remember_tile(key, issued_at, raw)
+    try:
+        from backend.init_db import SessionLocal
+        from backend.data_store import save_weather_tile
+
+        slat, slon = snap_to_grid(lat, lon, WEATHER_TILE_GRID_DEGREES)
+        with SessionLocal() as session:
+            save_weather_tile(session, key, slat, slon, timezone_name, days, issued_at, json.dumps(raw))
+    except Exception as ex:
+        print(f"[weather] Warning: Could not save forecast tile to DB: {ex}")
+
+
+def _fetch_tile(lat: float, lon: float, timezone_name: str, days: int):
+    """Fetch the forecast for the snapped grid point and store it."""
+    slat, slon = snap_to_grid(lat, lon, WEATHER_TILE_GRID_DEGREES)
+    issued_at = _issue_time()
+    raw = fetch_open_meteo(slat, slon, timezone_name, days=days)
+    store_forecast_tile(lat, lon, timezone_name, days, raw, issued_at=issued_at)
+    return raw
+
+
+def _refresh_tile(key: str, lat: float, lon: float, timezone_name: str, days: int):
+    try:
+        _fetch_tile(lat, lon, timezone_name, days)
+        with _tile_lock:
+            _tile_stats["refreshes"] += 1
+    except Exception as ex:
+        with _tile_lock:
+            _tile_stats["refresh_errors"] += 1
+        print(f"[weather] Warning: forecast tile refresh failed for {key}: {ex}")
+    finally:
+        with _tile_lock:
+            _tile_refreshing.discard(key)
+
+
+def _schedule_refresh(key: str, lat: float, lon: float, timezone_name: str, days: int):
+    """Refresh a stale tile in the background, at most once at a time per key."""
+    global _tile_pool
+    with _tile_lock:
+        if key in _tile_refreshing:
+            return
+        _tile_refreshing.add(key)
+        if _tile_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _tile_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weather-tile")
+    _tile_pool.submit(_refresh_tile, key, lat, lon, timezone_name, days)
+
+
+def get_forecast(lat: float, lon: float, timezone_name: str = "Asia/Kolkata", days: int = 7):
+    """
+    Raw Open-Meteo forecast for the grid cell containing (lat, lon).
+    Fresh tiles are returned as is; stale ones (older issue, within
+    WEATHER_TILE_MAX_STALE_SECONDS) are returned immediately while a refresh
+    runs in the background. Only a miss waits on the network, and concurrent
+    misses for the same cell share one request.
+    """
+    key = tile_key(lat, lon, timezone_name, days)
+    entry = _cached_tile(key)
+    if entry is not None:
+        issued_at, raw = entry
+        current = _issue_time()
+        if issued_at >= current:
+            with _tile_lock:
+                _tile_stats["fresh"] += 1
+            return raw
+        if (current - issued_at).total_seconds() <= WEATHER_TILE_MAX_STALE_SECONDS:
+            with _tile_lock:
+                _tile_stats["stale"] += 1
+            _schedule_refresh(key, lat, lon, timezone_name, days)
+            return raw
+
+    with _tile_lock:
+        _tile_stats["misses"] += 1
+    try:
+        from agent_helper import singleflight
+    except Exception:
+        return _fetch_tile(lat, lon, timezone_name, days)
+    return singleflight(("weather_tile", key), lambda: _fetch_tile(lat, lon, timezone_name, days))
+
+
+def forecast_tile_stats() -> dict:
+    with _tile_lock:
+        out = dict(_tile_stats)
+        out["lru_size"] = len(_tile_lru)
+        out["refreshing"] = len(_tile_refreshing)
+    return out
+
+
+def clear_forecast_tiles():
+    """Drop the in-process tier and zero the counters (the DB tier is kept)."""
+    with _tile_lock:
+        _tile_lru.clear()
+        for name in _tile_stats:
+            _tile_stats[name] = 0
+
+
 def quality_check(raw_json):
     hourly = raw_json.get("hourly", {})
     daily = raw_json.get("daily", {})
@@ -151,21 +571,10 @@ def pick_closest_hourly_sample(hourly: dict):
     if not times or not temps:
         return None
 
-    now_hour = datetime.now().hour
-
-    best_idx = 0
-    best_diff = 999
-
-    for i, tstr in enumerate(times):
-        try:
-            hour = int(tstr.split("T")[1].split(":")[0])
-        except:
-            continue
-
-        diff = abs(hour - now_hour)
-        if diff < best_diff:
-            best_diff = diff
-            best_idx = i
+    try:
+        best_idx = closest_hour_index(np.array(times, dtype="datetime64[m]"), datetime.now().hour)
+    except ValueError:
+        best_idx = 0
 
     return {
         "time": times[best_idx],
@@ -173,52 +582,48 @@ def pick_closest_hourly_sample(hourly: dict):
     }
 
 
+# hourly variable -> metrics key for its per-day mean
+DAILY_MEAN_VARS = {
+    "relativehumidity_2m": "rh_mean_by_day",
+    "windspeed_10m": "wind_mean_by_day",
+    "shortwave_radiation": "swr_mean_by_day",
+    "vapour_pressure_deficit": "vpd_mean_by_day",
+    "dewpoint_2m": "dewpoint_mean_by_day",
+}
+
+
 def minimal_metrics_from_raw(raw):
+    """
+    Daily summary of a forecast. Built on the columnar view in
+    weather_columns, so the per-day means are NumPy reductions.
+    """
     daily = raw.get("daily", {})
     hourly = raw.get("hourly", {})
+    cols = to_columns({"daily": daily, "hourly": hourly})
 
-    d_time = daily.get("time", [])
-    d_tmin = daily.get("temperature_2m_min", [])
-    d_tmax = daily.get("temperature_2m_max", [])
     d_precip = daily.get("precipitation_sum", [])
-    d_swr = daily.get("shortwave_radiation_sum", [])
-
     precip7 = None
-    if d_precip:
-        precip7 = sum([p for p in d_precip if p is not None])
-
-    h_time = hourly.get("time", [])
-    h_rh = hourly.get("relativehumidity_2m", [])
-    h_wind = hourly.get("windspeed_10m", [])
-    h_swr = hourly.get("shortwave_radiation", [])
-
-    def hourly_daily_means(h_times, h_vals):
-        if not h_times or not h_vals:
-            return {}
-        day_map = {}
-        for ts, v in zip(h_times, h_vals):
-            if v is None:
-                continue
-            date = ts.split("T")[0]
-            day_map.setdefault(date, []).append(v)
-        return {d: (sum(vals)/len(vals)) for d, vals in day_map.items()}
-
-    rh_mean_by_day = hourly_daily_means(h_time, h_rh)
-    wind_mean_by_day = hourly_daily_means(h_time, h_wind)
-    swr_mean_by_day = hourly_daily_means(h_time, h_swr)
+    if "precipitation_sum" in cols["daily"] and d_precip:
+        precip7 = float(np.nansum(cols["daily"]["precipitation_sum"]))
 
-    return {
-        "daily_time": d_time,
-        "daily_tmin": d_tmin,
-        "daily_tmax": d_tmax,
+    metrics = {
+        "daily_time": daily.get("time", []),
+        "daily_tmin": daily.get("temperature_2m_min", []),
+        "daily_tmax": daily.get("temperature_2m_max", []),
         "daily_precip": d_precip,
-        "daily_swr_sum": d_swr,
+        "daily_swr_sum": daily.get("shortwave_radiation_sum", []),
         "precip_7d_total": precip7,
-        "rh_mean_by_day": rh_mean_by_day,
-        "wind_mean_by_day": wind_mean_by_day,
-        "swr_mean_by_day": swr_mean_by_day,
-        "hourly": hourly
+        "hourly": hourly,
+        "columns": cols,
     }
+    for var, key in DAILY_MEAN_VARS.items():
+        metrics[key] = {}
+        if var not in cols["hourly"] or cols["hourly_time"].size == 0:
+            continue
+        days, means = daily_means(cols["hourly_time"], cols["hourly"][var])
+        valid = ~np.isnan(means)
+        metrics[key] = dict(zip(days[valid].astype(str).tolist(), means[valid].tolist()))
+    return metrics
 
 
 def format_compact_table(geo, metrics, sample):
@@ -237,23 +642,20 @@ def format_compact_table(geo, metrics, sample):
         lines.append(f"Rainfall (next 7 days total): {p7:.1f} mm → Water availability: {avail}")
     lines.append("")
     lines.append("7-day compact table (Date | Tmin/Tmax °C | Precip mm | MeanRH% | Wind m/s | Shortwave sum):")
-    for d, tmin, tmax, p in zip(metrics.get("daily_time", []), metrics.get("daily_tmin", []), metrics.get("daily_tmax", []), metrics.get("daily_precip", [])):
+    daily_time = metrics.get("daily_time", [])
+    swr_sums = metrics.get("daily_swr_sum") or []
+    rh_by_day = metrics.get("rh_mean_by_day", {})
+    wind_by_day = metrics.get("wind_mean_by_day", {})
+    for i, (d, tmin, tmax, p) in enumerate(zip(daily_time, metrics.get("daily_tmin", []), metrics.get("daily_tmax", []), metrics.get("daily_precip", []))):
         parts = [f"{d}"]
         if tmin is not None and tmax is not None:
             parts.append(f"{tmin:.1f}/{tmax:.1f}°C")
         else:
             parts.append("-")
         parts.append(f"{p:.1f}" if p is not None else "-")
-        rh = metrics.get("rh_mean_by_day", {}).get(d)
-        wind = metrics.get("wind_mean_by_day", {}).get(d)
-        swr_sum = metrics.get("daily_swr_sum", [])
-        swr_val = None
-        if metrics.get("daily_swr_sum"):
-            try:
-                idx = metrics["daily_time"].index(d)
-                swr_val = metrics.get("daily_swr_sum")[idx]
-            except Exception:
-                swr_val = None
+        rh = rh_by_day.get(d)
+        wind = wind_by_day.get(d)
+        swr_val = swr_sums[i] if i < len(swr_sums) else None
         parts.append(f"{rh:.0f}%" if rh is not None else "-")
         parts.append(f"{wind:.1f}" if wind is not None else "-")
         parts.append(f"{swr_val:.1f}" if swr_val is not None else "-")
@@ -263,6 +665,95 @@ def format_compact_table(geo, metrics, sample):
     return "\n".join(lines)
 
 
+# Daily fields of a weather record: record field -> (metrics key, per-day dict?)
+RECORD_DAILY_FIELDS = {
+    "tmin": ("daily_tmin", False),
+    "tmax": ("daily_tmax", False),
+    "precip": ("daily_precip", False),
+    "swr_sum": ("daily_swr_sum", False),
+    "rh_mean": ("rh_mean_by_day", True),
+    "wind_mean": ("wind_mean_by_day", True),
+    "vpd_mean": ("vpd_mean_by_day", True),
+    "dewpoint_mean": ("dewpoint_mean_by_day", True),
+}
+
+# record field -> (column label, format)
+RECORD_FIELD_FORMATS = {
+    "tmin": ("Tmin °C", "{:.1f}"),
+    "tmax": ("Tmax °C", "{:.1f}"),
+    "precip": ("Precip mm", "{:.1f}"),
+    "swr_sum": ("Shortwave sum", "{:.1f}"),
+    "rh_mean": ("MeanRH%", "{:.0f}%"),
+    "wind_mean": ("Wind m/s", "{:.1f}"),
+    "vpd_mean": ("VPD kPa", "{:.2f}"),
+    "dewpoint_mean": ("Dewpoint °C", "{:.1f}"),
+}
+
+
+def _rounded(value, digits=3):
+    return None if value is None else round(float(value), digits)
+
+
+def weather_record(geo, metrics, sample, tile: str = None) -> dict:
+    """
+    Structured form of a forecast, stored in Weather.data next to the text:
+    location, current sample, rainfall total and one column per daily field
+    (RECORD_DAILY_FIELDS) aligned with daily["time"]. `tile` is the
+    weather_tile key holding the raw hourly response.
+    """
+    days = list(metrics.get("daily_time", []))
+    daily = {"time": days}
+    for field, (key, by_day) in RECORD_DAILY_FIELDS.items():
+        source = metrics.get(key) or ({} if by_day else [])
+        if by_day:
+            daily[field] = [_rounded(source.get(d)) for d in days]
+        else:
+            daily[field] = [_rounded(source[i]) if i < len(source) else None for i in range(len(days))]
+    return {
+        "version": 1,
+        "location": {k: geo.get(k) for k in ("name", "admin1", "country", "latitude", "longitude", "timezone")},
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "current": sample,
+        "precip_total": _rounded(metrics.get("precip_7d_total"), 1),
+        "daily": daily,
+        "tile": tile,
+    }
+
+
+def weather_window(record: dict, start=None, end=None, fields=None) -> dict:
+    """
+    The days of record's daily table within [start, end] (dates or
+    YYYY-MM-DD strings, either may be None), restricted to `fields`.
+    """
+    daily = (record or {}).get("daily") or {}
+    days = daily.get("time", [])
+    start = str(start) if start is not None else None
+    end = str(end) if end is not None else None
+    keep = [i for i, d in enumerate(days) if (start is None or d >= start) and (end is None or d <= end)]
+    out = {"time": [days[i] for i in keep]}
+    for field in fields or RECORD_DAILY_FIELDS:
+        values = daily.get(field)
+        if values is not None:
+            out[field] = [values[i] for i in keep]
+    return out
+
+
+def render_weather_window(record: dict, start=None, end=None, fields=("tmin", "tmax", "precip", "rh_mean")) -> str:
+    """Short text table of weather_window(...), for prompts."""
+    window = weather_window(record, start, end, fields)
+    if not window["time"]:
+        return "No forecast days in this window."
+    fields = [f for f in fields if f in window]
+    lines = ["Date | " + " | ".join(RECORD_FIELD_FORMATS[f][0] for f in fields)]
+    for i, d in enumerate(window["time"]):
+        cells = [
+            RECORD_FIELD_FORMATS[f][1].format(window[f][i]) if window[f][i] is not None else "-"
+            for f in fields
+        ]
+        lines.append(f"{d} | " + " | ".join(cells))
+    return "\n".join(lines)
+
+
 def weather_7day_compact(location: str = None, days: int = 7, latitude: float = None, longitude: float = None, crop_name: str = "", save_to_db: bool = True, model_name: str = "", run_id: int = None):
     """
     Fetch 7-day weather forecast using either:
@@ -295,11 +786,12 @@ def weather_7day_compact(location: str = None, days: int = 7, latitude: float =
     if not geo:
         return f"Error: Could not determine location from {'coordinates' if latitude else 'name'}."
     
-    raw = fetch_open_meteo(geo["latitude"], geo["longitude"], geo.get("timezone") or "Asia/Kolkata", days=days)
+    raw = get_forecast(geo["latitude"], geo["longitude"], geo.get("timezone") or "Asia/Kolkata", days=days)
     cleaned = {"daily": raw.get("daily", {}), "hourly": raw.get("hourly", {})}
     metrics = minimal_metrics_from_raw(cleaned)
     sample = pick_closest_hourly_sample(cleaned.get("hourly", {}))
     report_text = format_compact_table(geo, metrics, sample)
+    record = weather_record(geo, metrics, sample, tile=tile_key(geo["latitude"], geo["longitude"], geo.get("timezone") or "Asia/Kolkata", days))
     
     if save_to_db:
         try:
@@ -323,13 +815,15 @@ def weather_7day_compact(location: str = None, days: int = 7, latitude: float =
                     model_name,
                     "",
                     output_str,
-                    run_id=run_id
+                    run_id=run_id,
+                    data=record,
                 )
                 print("-----------------------object>",obj)
                 print("weather object id ----------------->",obj.id)
                 return {
                 "id": obj.id,
-                "output": output_str
+                "output": output_str,
+                "data": record,
                 } 
         except Exception as ex:
             print(f"[weather_7day_compact] Warning: Could not save to DB: {ex}")
\ No newline at end of file
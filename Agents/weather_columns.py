@@ -0,0 +1,94 @@
+"""
+Columnar view of Open-Meteo forecast responses.
+
+to_columns() turns a /v1/forecast response (or the list returned for a
+multi-location request) into NumPy arrays: datetime64 timestamps for the
+hourly/daily axes and float arrays per variable, with missing values as NaN.
+A single location gives 1-D arrays; a list of locations sharing one time axis
+gives 2-D arrays shaped (locations, time).
+
+Daily aggregations (daily_means) and the "closest hour" lookup are vectorized
+reductions over those arrays, so a 16-day or multi-location response costs
+the same number of Python operations as a 7-day one.
+"""
+
+import numpy as np
+
+
+def _times(values, unit):
+    if not values:
+        return np.array([], dtype=f"datetime64[{unit}]")
+    return np.array(values, dtype=f"datetime64[{unit}]")
+
+
+def _values(values):
+    # None -> NaN
+    return np.array(values, dtype=float)
+
+
+def _section(raws, name, unit):
+    blocks = [raw.get(name) or {} for raw in raws]
+    times = _times(blocks[0].get("time", []), unit)
+    for block in blocks[1:]:
+        if not np.array_equal(_times(block.get("time", []), unit), times):
+            raise ValueError(f"{name} time axes differ between locations")
+    variables = {}
+    names = [k for k in blocks[0] if k != "time"]
+    for var in names:
+        if all(block.get(var) is not None and len(block[var]) == len(times) for block in blocks):
+            variables[var] = np.vstack([_values(block[var]) for block in blocks]) if len(blocks) > 1 else _values(blocks[0][var])
+    return times, variables
+
+
+def to_columns(raw) -> dict:
+    """
+    Returns {"hourly_time", "hourly", "daily_time", "daily", "locations"}:
+    hourly_time is datetime64[m], daily_time is datetime64[D], hourly/daily map
+    variable name -> float array, locations is None for a single response or
+    the number of stacked locations.
+    """
+    raws = raw if isinstance(raw, list) else [raw]
+    if not raws:
+        raise ValueError("no forecast responses")
+    hourly_time, hourly = _section(raws, "hourly", "m")
+    daily_time, daily = _section(raws, "daily", "D")
+    return {
+        "hourly_time": hourly_time,
+        "hourly": hourly,
+        "daily_time": daily_time,
+        "daily": daily,
+        "locations": len(raws) if isinstance(raw, list) else None,
+    }
+
+
+def daily_means(hourly_time, values):
+    """
+    Mean of hourly `values` per calendar day, ignoring NaN.
+
+    Returns (days, means): days is the sorted datetime64[D] array of days that
+    appear in hourly_time, means has the shape of values with the time axis
+    replaced by days (NaN where a day has no valid samples).
+    """
+    days_of = hourly_time.astype("datetime64[D]")
+    days, day_index = np.unique(days_of, return_inverse=True)
+    values = np.asarray(values, dtype=float)
+    rows = values.reshape(-1, values.shape[-1])
+    n_days = len(days)
+
+    # one bincount over (row, day) buckets covers every location at once
+    buckets = (np.arange(rows.shape[0])[:, None] * n_days + day_index[None, :]).ravel()
+    valid = ~np.isnan(rows)
+    totals = np.bincount(buckets, weights=np.where(valid, rows, 0.0).ravel(), minlength=rows.shape[0] * n_days)
+    counts = np.bincount(buckets, weights=valid.ravel().astype(float), minlength=rows.shape[0] * n_days)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts > 0, totals / counts, np.nan)
+    return days, means.reshape(values.shape[:-1] + (n_days,))
+
+
+def closest_hour_index(hourly_time, hour: int):
+    """Index of the first timestamp whose hour of day is closest to `hour`, or None."""
+    if hourly_time.size == 0:
+        return None
+    hours = (hourly_time - hourly_time.astype("datetime64[D]")).astype("timedelta64[h]").astype(int)
+    return int(np.argmin(np.abs(hours - hour)))
+
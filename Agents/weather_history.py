@@ -0,0 +1,300 @@
+"""
+Observed daily weather per grid cell, and per-farm growing-degree-day totals.
+
+Daily Tmin/Tmax/precipitation are stored in the `weather_day` table, keyed by
+a history cell (lat/lon snapped to HISTORY_GRID_DEGREES) and date. Missing days
+are filled from the Open-Meteo archive API. The archive lags real time by a
+few days (ARCHIVE_LAG_DAYS), so the most recent days come from the forecast
+API's `past_days` instead. Both URLs can point at the local stand-in.
+
+update_accumulator() keeps running GDD / chill / rainfall totals for a farm
+since sowing in `farm_accumulator`. Each call only adds the days after the
+last one it counted, so a daily refresh costs O(1) per farm regardless of how
+long the crop has been in the ground.
+"""
+
+import os
+import requests
+from datetime import date, datetime, timedelta
+
+import weather
+
+OPEN_METEO_ARCHIVE_URL = os.getenv("OPEN_METEO_ARCHIVE_URL", "https://archive-api.open-meteo.com").rstrip("/")
+ARCHIVE_LAG_DAYS = int(os.getenv("WEATHER_ARCHIVE_LAG_DAYS", "5"))
+# ERA5-Land is ~0.1 deg, so finer cells would only duplicate rows
+HISTORY_GRID_DEGREES = float(os.getenv("WEATHER_HISTORY_GRID_DEGREES", "0.1"))
+HISTORY_VARS = ["temperature_2m_max", "temperature_2m_min", "precipitation_sum"]
+
+# Chill is counted as degree-days of daily mean temperature below this
+CHILL_BASE_C = 7.0
+
+# crop -> (base temperature, upper cutoff) in °C for GDD
+CROP_GDD_TEMPS = {
+    "wheat": (0.0, 30.0),
+    "barley": (0.0, 30.0),
+    "mustard": (5.0, 30.0),
+    "chickpea": (5.0, 30.0),
+    "rice": (10.0, 35.0),
+    "paddy": (10.0, 35.0),
+    "maize": (10.0, 30.0),
+    "soybean": (10.0, 30.0),
+    "cotton": (15.5, 32.0),
+    "sugarcane": (12.0, 35.0),
+}
+DEFAULT_GDD_TEMPS = (10.0, 30.0)
+
+
+def gdd_temps(crop_name: str):
+    return CROP_GDD_TEMPS.get((crop_name or "").strip().lower(), DEFAULT_GDD_TEMPS)
+
+
+def daily_gdd(tmin, tmax, base: float, upper: float = None):
+    """Growing degree days for one day: mean of Tmin/Tmax clipped to [base, upper], minus base."""
+    if tmin is None or tmax is None:
+        return None
+    hi = upper if upper is not None else max(tmin, tmax, base)
+    return (min(max(tmax, base), hi) + min(max(tmin, base), hi)) / 2.0 - base
+
+
+def daily_chill(tmin, tmax):
+    if tmin is None or tmax is None:
+        return None
+    return max(0.0, CHILL_BASE_C - (tmin + tmax) / 2.0)
+
+
+def cell_key(lat: float, lon: float) -> str:
+    slat, slon = weather.snap_to_grid(lat, lon, HISTORY_GRID_DEGREES)
+    return f"{HISTORY_GRID_DEGREES:g}:{slat:.4f},{slon:.4f}"
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if value is None or isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+def _parse_daily(data, start, end):
+    daily = (data or {}).get("daily") or {}
+
+    def _at(name, i):
+        values = daily.get(name) or []
+        return values[i] if i < len(values) else None
+
+    out = []
+    for i, day in enumerate(daily.get("time", [])):
+        day = _as_date(day)
+        if start <= day <= end:
+            out.append({
+                "day": day,
+                "tmax": _at("temperature_2m_max", i),
+                "tmin": _at("temperature_2m_min", i),
+                "precip": _at("precipitation_sum", i),
+            })
+    return out
+
+
+def fetch_archive(lat: float, lon: float, start, end, timezone_name: str = "Asia/Kolkata"):
+    """Daily observations from the Open-Meteo archive API."""
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "timezone": timezone_name,
+        "daily": ",".join(HISTORY_VARS),
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+    }
+    r = requests.get(f"{OPEN_METEO_ARCHIVE_URL}/v1/archive", params=params, timeout=30)
+    r.raise_for_status()
+    return _parse_daily(r.json(), start, end)
+
+
+def fetch_recent(lat: float, lon: float, start, end, timezone_name: str = "Asia/Kolkata"):
+    """Recent days the archive does not have yet, from the forecast API's past_days."""
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "timezone": timezone_name,
+        "daily": ",".join(HISTORY_VARS),
+        "past_days": min(92, max(1, (date.today() - start).days)),
+        "forecast_days": 1,
+    }
+    r = requests.get(f"{weather.OPEN_METEO_URL}/v1/forecast", params=params, timeout=15)
+    r.raise_for_status()
+    return _parse_daily(r.json(), start, end)
+
+
+def _fill(key: str, lat: float, lon: float, start, end, timezone_name: str) -> list:
+    """Fetch and store the days in [start, end] not stored yet; returns the (start, end) spans that failed."""
+    from backend.init_db import SessionLocal
+    from backend.data_store import get_weather_days, save_weather_days
+
+    with SessionLocal() as session:
+        have = {row.day for row in get_weather_days(session, key, start, end)}
+    missing = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    missing = [d for d in missing if d not in have]
+    if not missing:
+        return []
+
+    slat, slon = weather.snap_to_grid(lat, lon, HISTORY_GRID_DEGREES)
+    archive_end = date.today() - timedelta(days=ARCHIVE_LAG_DAYS + 1)
+    spans = []
+    if missing[0] <= archive_end:
+        spans.append((fetch_archive, "archive", missing[0], min(missing[-1], archive_end)))
+    if missing[-1] > archive_end:
+        spans.append((fetch_recent, "forecast", max(missing[0], archive_end + timedelta(days=1)), missing[-1]))
+    failed = []
+    for fetch, source, span_start, span_end in spans:
+        try:
+            days = fetch(slat, slon, span_start, span_end, timezone_name)
+        except Exception as ex:
+            print(f"[weather_history] Warning: {source} fetch {span_start}..{span_end} failed: {ex}")
+            failed.append((span_start, span_end))
+            continue
+        with SessionLocal() as session:
+            save_weather_days(session, key, slat, slon, days, source=source)
+    return failed
+
+
+def ensure_history(lat: float, lon: float, start, end, timezone_name: str = "Asia/Kolkata"):
+    """
+    Daily observations for the cell containing (lat, lon) with
+    start <= day <= end (capped at yesterday), fetching only days not yet
+    stored. Returns dicts with day/tmin/tmax/precip, oldest first; days that
+    could not be fetched are absent.
+    """
+    return _ensure_history(lat, lon, start, end, timezone_name)[0]
+
+
+def _ensure_history(lat: float, lon: float, start, end, timezone_name: str):
+    """ensure_history plus the (start, end) spans whose fetch failed this time."""
+    from backend.init_db import SessionLocal
+    from backend.data_store import get_weather_days
+
+    start = _as_date(start)
+    end = min(_as_date(end), date.today() - timedelta(days=1))
+    if start > end:
+        return [], []
+    key = cell_key(lat, lon)
+    try:
+        from agent_helper import singleflight
+    except ImportError:
+        failed = _fill(key, lat, lon, start, end, timezone_name)
+    else:
+        failed = singleflight(("weather_history", key, start, end), lambda: _fill(key, lat, lon, start, end, timezone_name))
+    with SessionLocal() as session:
+        rows = [
+            {"day": row.day, "tmin": row.tmin, "tmax": row.tmax, "precip": row.precip}
+            for row in get_weather_days(session, key, start, end)
+        ]
+    return rows, failed or []
+
+
+def farm_key(location: str, crop_name: str, sowing_date) -> str:
+    return "|".join([
+        weather.normalize_location_name(location),
+        (crop_name or "").strip().lower(),
+        str(_as_date(sowing_date)),
+    ])
+
+
+def _snapshot(row) -> dict:
+    return {
+        "farm_key": row.farm_key,
+        "crop_name": row.crop_name,
+        "sowing_date": row.sowing_date.isoformat() if row.sowing_date else None,
+        "through_day": row.through_day.isoformat() if row.through_day else None,
+        "base_temp": row.base_temp,
+        "days": row.days or 0,
+        "missing_days": row.missing_days or 0,
+        "gdd": round(row.gdd or 0.0, 1),
+        "chill": round(row.chill or 0.0, 1),
+        "rainfall": round(row.rainfall or 0.0, 1),
+    }
+
+
+def update_accumulator(location: str, crop_name: str, sowing_date, latitude: float, longitude: float, through=None, timezone_name: str = "Asia/Kolkata") -> dict:
+    """
+    Bring the farm's GDD / chill / rainfall totals up to `through`
+    (default: yesterday) and return them. Only days after the stored
+    through_day are fetched and added; a changed sowing date, crop or cell
+    starts the totals again. Totals stop before the first day whose fetch
+    failed, so the next update retries it; a day the source answered
+    without counts as missing.
+    """
+    from backend.init_db import SessionLocal
+    from backend.data_store import get_farm_accumulator, save_farm_accumulator
+
+    key = farm_key(location, crop_name, sowing_date)
+    sowing = _as_date(sowing_date)
+    cell = cell_key(latitude, longitude)
+    base, upper = gdd_temps(crop_name)
+    through = min(_as_date(through) if through else date.today(), date.today() - timedelta(days=1))
+
+    with SessionLocal() as session:
+        row = get_farm_accumulator(session, key)
+        resume = row is not None and row.cell_key == cell and row.base_temp == base and row.through_day is not None
+        if resume:
+            totals = {
+                "days": row.days or 0,
+                "missing_days": row.missing_days or 0,
+                "gdd": row.gdd or 0.0,
+                "chill": row.chill or 0.0,
+                "rainfall": row.rainfall or 0.0,
+            }
+            last = row.through_day
+        else:
+            totals = {"days": 0, "missing_days": 0, "gdd": 0.0, "chill": 0.0, "rainfall": 0.0}
+            last = sowing - timedelta(days=1)
+        if resume and last >= through:
+            return _snapshot(row)
+
+    days, failed = _ensure_history(latitude, longitude, last + timedelta(days=1), through, timezone_name) if last < through else ([], [])
+    by_day = {d["day"]: d for d in days}
+    day = last + timedelta(days=1)
+    while day <= through:
+        obs = by_day.get(day)
+        if obs is None and any(a <= day <= b for a, b in failed):
+            # not fetched (outage); leave it for the next update
+            break
+        gdd = daily_gdd(obs["tmin"], obs["tmax"], base, upper) if obs else None
+        if gdd is None:
+            totals["missing_days"] += 1
+        else:
+            totals["gdd"] += gdd
+            totals["chill"] += daily_chill(obs["tmin"], obs["tmax"])
+        if obs and obs.get("precip") is not None:
+            totals["rainfall"] += obs["precip"]
+        totals["days"] += 1
+        day += timedelta(days=1)
+
+    with SessionLocal() as session:
+        row = save_farm_accumulator(
+            session, key,
+            cell_key=cell,
+            crop_name=(crop_name or "").strip().lower(),
+            sowing_date=sowing,
+            base_temp=base,
+            through_day=day - timedelta(days=1),
+            **totals,
+        )
+        return _snapshot(row)
+
+
+def update_registered_farms() -> dict:
+    """Nightly job: advance the accumulator of every registered farm with coordinates."""
+    from backend.init_db import SessionLocal
+    from backend.user_store import get_registered_farms
+
+    with SessionLocal() as session:
+        farms = get_registered_farms(session)
+    updated = failed = 0
+    for farm in farms:
+        try:
+            update_accumulator(farm["location"], farm["crop_name"], farm["sowing_date"], farm["latitude"], farm["longitude"])
+            updated += 1
+        except Exception as ex:
+            failed += 1
+            print(f"[weather_history] Warning: accumulator update failed for {farm['location']}: {ex}")
+    return {"farms": len(farms), "updated": updated, "failed": failed}
@@ -1,11 +1,12 @@
 import os
 import sys
+import asyncio
 from typing import Optional, Dict, Any
 
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
 from Agents.weather import weather_7day_compact
-from Agents.irrigation import irrigation_agent
+from Agents.irrigation import irrigation_agent, airrigation_agent
 
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 AGENTS_DIR = os.path.join(PROJECT_ROOT, "Agents")
@@ -58,6 +59,44 @@ class IrrigationRequest(BaseModel):
 
     save_to_db: bool = True
     run_id: Optional[int] = None
+    bypass_cache: bool = False  # skip cached LLM responses (fresh answer)
+
+
+class RunAllRequest(BaseModel):
+    crop_name: str
+    crop_variety: Optional[str] = ""
+    location: str
+    sowing_date: Optional[str] = None  # YYYY-MM-DD
+    area: Optional[float] = None
+
+    previous_crop_sowed: Optional[str] = None
+    soil_type: Optional[str] = None
+    irrigation_type: Optional[str] = "rainfed"
+    irrigation_method: Optional[str] = None
+    water_source: Optional[str] = None
+    water_reliability: Optional[str] = "unknown"
+    irrigation_water_quality: Optional[str] = "unknown"
+    soil_texture: Optional[str] = "unknown"
+    drainage: Optional[str] = "unknown"
+    waterlogging: Optional[str] = "unknown"
+    salinity_signs: Optional[str] = "unknown"
+    field_slope: Optional[str] = "unknown"
+    hardpan_crusting: Optional[str] = "unknown"
+    farming_method: Optional[str] = None
+    planting_method: Optional[str] = None
+    last_season_pest_pressure: Optional[str] = "unknown"
+    last_season_disease_pressure: Optional[str] = "unknown"
+
+    model_name: Optional[str] = None
+    temperature: float = 0.2
+    max_tokens: int = 1500
+    custom_prompts: Optional[Dict[str, str]] = None
+
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+    run_id: Optional[int] = None
+    bypass_cache: bool = False  # skip cached LLM responses (fresh answer)
 
 
 def _create_run(triggered_agent_id: str, payload: Dict[str, Any]) -> Optional[int]:
@@ -85,6 +124,14 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/llm-metrics")
+def llm_metrics():
+    """Per-provider attempt counts and latency percentiles (p50/p95/p99)."""
+    from llm_router import llm_metrics as router_metrics
+
+    return router_metrics()
+
+
 @app.post("/weather")
 def weather(req: WeatherRequest):
     try:
@@ -116,59 +163,168 @@ def weather(req: WeatherRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _irrigation_run_id(req: IrrigationRequest) -> Optional[int]:
+    if req.run_id is not None or not req.save_to_db:
+        return req.run_id
+    return _create_run(
+        "irrigation",
+        {
+            "location": req.location,
+            "crop_name": req.crop_name,
+            "sowing_date": req.sowing_date,
+            "model_name": req.model_name,
+        },
+    )
+
+
+def _irrigation_farmer_input(req: IrrigationRequest):
+    from Agents.user_input import FarmerInput
+
+    return FarmerInput(
+        crop_name=req.crop_name,
+        location=req.location,
+        sowing_date=req.sowing_date,
+        area=req.area,
+        irrigation_type=req.irrigation_type,
+        irrigation_method=req.irrigation_method,
+        water_source=req.water_source,
+        water_reliability=req.water_reliability,
+        irrigation_water_quality=req.irrigation_water_quality,
+        soil_texture=req.soil_texture,
+        drainage=req.drainage,
+        waterlogging=req.waterlogging,
+        salinity_signs=req.salinity_signs,
+        field_slope=req.field_slope,
+        hardpan_crusting=req.hardpan_crusting,
+        farming_method=req.farming_method,
+        planting_method=req.planting_method,
+        latitude=req.latitude,
+        longitude=req.longitude,
+    )
+
+
 @app.post("/irrigation")
-def irrigation(req: IrrigationRequest):
+async def irrigation(req: IrrigationRequest):
+    try:
+        run_id = await asyncio.to_thread(_irrigation_run_id, req)
+        farmer_input = _irrigation_farmer_input(req)
+
+        from llm_cache import fresh_answers
+
+        with fresh_answers(req.bypass_cache):
+            result = await airrigation_agent(
+                farmer_input=farmer_input,
+                model_name=req.model_name,
+                temperature=req.temperature,
+                max_tokens=req.max_tokens,
+                custom_prompt=req.custom_prompt,
+                latitude=req.latitude,
+                longitude=req.longitude,
+                save_to_db=req.save_to_db,
+                run_id=run_id,
+            )
+
+        if isinstance(result, dict):
+            return {"run_id": run_id, **result}
+        return {"run_id": run_id, "output": result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/irrigation/stream")
+def irrigation_stream(req: IrrigationRequest):
+    """
+    Same inputs as /irrigation, answered as Server-Sent Events:
+    `chunk` events ({"agent", "text"}) while the model generates (dependency
+    agents that have to run first stream too), then one `done` event with the
+    saved result, or an `error` event.
+    """
+    import json
+    import queue
+    import threading
+    from fastapi.responses import StreamingResponse
+    from llm_cache import fresh_answers
+    from llm_router import stream_to
+
+    events = queue.Queue()
+
+    def _send(event, data):
+        events.put(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n")
+
+    def _worker():
+        try:
+            run_id = _irrigation_run_id(req)
+            with fresh_answers(req.bypass_cache), stream_to(lambda agent, chunk: _send("chunk", {"agent": agent, "text": chunk})):
+                result = irrigation_agent(
+                    farmer_input=_irrigation_farmer_input(req),
+                    model_name=req.model_name,
+                    temperature=req.temperature,
+                    max_tokens=req.max_tokens,
+                    custom_prompt=req.custom_prompt,
+                    latitude=req.latitude,
+                    longitude=req.longitude,
+                    save_to_db=req.save_to_db,
+                    run_id=run_id,
+                )
+            if isinstance(result, dict):
+                _send("done", {"run_id": run_id, **result})
+            else:
+                _send("done", {"run_id": run_id, "output": result})
+        except Exception as e:
+            _send("error", {"detail": str(e)})
+        finally:
+            events.put(None)
+
+    threading.Thread(target=_worker, daemon=True).start()
+
+    def _stream():
+        while True:
+            item = events.get()
+            if item is None:
+                break
+            yield item
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/run-all")
+def run_all(req: RunAllRequest):
     try:
         from Agents.user_input import FarmerInput
+        from pipeline import run_pipeline
 
         run_id = req.run_id
-        if run_id is None and req.save_to_db:
+        if run_id is None:
             run_id = _create_run(
-                "irrigation",
+                "all",
                 {
                     "location": req.location,
                     "crop_name": req.crop_name,
+                    "crop_variety": req.crop_variety,
                     "sowing_date": req.sowing_date,
                     "model_name": req.model_name,
                 },
             )
 
-        farmer_input = FarmerInput(
-            crop_name=req.crop_name,
-            location=req.location,
-            sowing_date=req.sowing_date,
-            area=req.area,
-            irrigation_type=req.irrigation_type,
-            irrigation_method=req.irrigation_method,
-            water_source=req.water_source,
-            water_reliability=req.water_reliability,
-            irrigation_water_quality=req.irrigation_water_quality,
-            soil_texture=req.soil_texture,
-            drainage=req.drainage,
-            waterlogging=req.waterlogging,
-            salinity_signs=req.salinity_signs,
-            field_slope=req.field_slope,
-            hardpan_crusting=req.hardpan_crusting,
-            farming_method=req.farming_method,
-            planting_method=req.planting_method,
-            latitude=req.latitude,
-            longitude=req.longitude,
-        )
+        fields = req.dict(exclude={"model_name", "temperature", "max_tokens", "custom_prompts", "run_id", "bypass_cache"})
+        farmer_input = FarmerInput(**fields)
 
-        result = irrigation_agent(
-            farmer_input=farmer_input,
-            model_name=req.model_name,
+        result = run_pipeline(
+            farmer_input,
+            model=req.model_name,
             temperature=req.temperature,
             max_tokens=req.max_tokens,
-            custom_prompt=req.custom_prompt,
+            custom_prompts=req.custom_prompts or {},
             latitude=req.latitude,
             longitude=req.longitude,
-            save_to_db=req.save_to_db,
             run_id=run_id,
+            bypass_cache=req.bypass_cache,
         )
-
-        if isinstance(result, dict):
-            return {"run_id": run_id, **result}
-        return {"run_id": run_id, "output": result}
+        result["run_id"] = run_id
+        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
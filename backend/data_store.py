@@ -1,4 +1,6 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from .db_models import (
     AgentRun,
     Soil,
@@ -12,6 +14,12 @@ from .db_models import (
     Merge,
     PromptEvent,
     PromptPreference,
+    LLMCache,
+    GeocodeCache,
+    WeatherTile,
+    WeatherDay,
+    FarmAccumulator,
+    StagePlanRow,
 )
 import json
 from datetime import datetime,timedelta
@@ -191,18 +199,21 @@ def save_water(session: Session, location: str, crop_name: str, model_name: str
     return water
 
 
-def save_weather(session: Session, location: str, crop_name: str = None, model_name: str = None, prompt: str = None, output=None, run_id: int = None):
+def save_weather(session: Session, location: str, crop_name: str = None, model_name: str = None, prompt: str = None, output=None, run_id: int = None, data=None):
     if isinstance(output, dict):
         output_to_save = json.dumps(output, ensure_ascii=False)
     else:
         output_to_save = output
+    if isinstance(data, dict):
+        data = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
     weather = Weather(
         run_id=run_id,
         location=location,
         crop_name=crop_name,
         model_name="open-meteo",
         prompt=prompt,
-        output=output_to_save
+        output=output_to_save,
+        data=data,
     )
     session.add(weather)
     session.commit()
@@ -455,16 +466,244 @@ def get_latest_stage(session: Session, location: str, crop_name: str, sowing_dat
     """
     cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
     
+    # updated_at moves when the daily stage refresh rewrites the current stage,
+    # which keeps a plan that still matches the weather in use
     result = session.query(Stage).filter(
         Stage.location == location,
         Stage.crop_name == crop_name,
         Stage.sowing_date == sowing_date,
-        Stage.created_at >= cutoff
+        func.coalesce(Stage.updated_at, Stage.created_at) >= cutoff
     ).order_by(Stage.created_at.desc()).first()
     
     return result
 
 
+def get_llm_cache(session: Session, cache_key: str, max_age_seconds: int = None):
+    """
+    Get a cached LLM response by key, or None if missing or older than max_age_seconds.
+    A hit refreshes last_used_at so eviction keeps recently used rows.
+    """
+    row = session.query(LLMCache).filter(LLMCache.cache_key == cache_key).first()
+    if row is None:
+        return None
+    if max_age_seconds is not None and row.created_at is not None:
+        if row.created_at < datetime.utcnow() - timedelta(seconds=max_age_seconds):
+            return None
+    row.last_used_at = datetime.utcnow()
+    session.commit()
+    return row
+
+
+def save_llm_cache(session: Session, cache_key: str, agent_id: str = None, model_name: str = None, output: str = None):
+    """
+    Insert or replace the cached response for cache_key. Concurrent identical
+    misses may both insert; the loser updates the winner's row instead.
+    """
+    now = datetime.utcnow()
+    for attempt in range(2):
+        row = session.query(LLMCache).filter(LLMCache.cache_key == cache_key).first()
+        if row is None:
+            row = LLMCache(cache_key=cache_key)
+            session.add(row)
+        row.agent_id = agent_id
+        row.model_name = model_name
+        row.output = output
+        row.created_at = now
+        row.last_used_at = now
+        try:
+            session.commit()
+            return row
+        except IntegrityError:
+            session.rollback()
+            if attempt:
+                raise
+
+
+def prune_llm_cache(session: Session, max_rows: int):
+    """Keep only the max_rows most recently used cache rows. Returns rows deleted."""
+    stale_ids = [
+        row_id
+        for (row_id,) in session.query(LLMCache.id)
+        .order_by(LLMCache.last_used_at.desc())
+        .offset(max_rows)
+        .all()
+    ]
+    if not stale_ids:
+        return 0
+    deleted = session.query(LLMCache).filter(LLMCache.id.in_(stale_ids)).delete(synchronize_session=False)
+    session.commit()
+    return deleted
+
+
+def get_geocode(session: Session, cache_key: str, max_age_seconds: int = None):
+    """Get a cached geocode row by key, or None if missing or older than max_age_seconds."""
+    row = session.query(GeocodeCache).filter(GeocodeCache.cache_key == cache_key).first()
+    if row is None:
+        return None
+    if max_age_seconds is not None and row.created_at is not None:
+        if row.created_at < datetime.utcnow() - timedelta(seconds=max_age_seconds):
+            return None
+    row.last_used_at = datetime.utcnow()
+    session.commit()
+    return row
+
+
+def save_geocode(session: Session, cache_key: str, geo: dict, source: str = None):
+    """Insert or replace the geocode result (name/latitude/longitude/country/admin1/timezone) for cache_key."""
+    now = datetime.utcnow()
+    row = session.query(GeocodeCache).filter(GeocodeCache.cache_key == cache_key).first()
+    if row is None:
+        row = GeocodeCache(cache_key=cache_key)
+        session.add(row)
+    row.name = geo.get("name")
+    row.latitude = geo.get("latitude")
+    row.longitude = geo.get("longitude")
+    row.country = geo.get("country")
+    row.admin1 = geo.get("admin1")
+    row.timezone = geo.get("timezone")
+    row.source = source
+    row.created_at = now
+    row.last_used_at = now
+    session.commit()
+    return row
+
+
+def get_weather_tile(session: Session, cache_key: str):
+    """Get the stored forecast tile for cache_key (any age), or None."""
+    return session.query(WeatherTile).filter(WeatherTile.cache_key == cache_key).first()
+
+
+def save_weather_tile(
+    session: Session,
+    cache_key: str,
+    latitude: float,
+    longitude: float,
+    timezone: str,
+    days: int,
+    issued_at,
+    data: str,
+):
+    """Insert or replace the forecast tile for cache_key. An older issue never
+    overwrites a newer one (refreshes can finish out of order)."""
+    row = session.query(WeatherTile).filter(WeatherTile.cache_key == cache_key).first()
+    if row is None:
+        row = WeatherTile(cache_key=cache_key)
+        session.add(row)
+    elif row.issued_at is not None and issued_at is not None and row.issued_at > issued_at:
+        return row
+    row.latitude = latitude
+    row.longitude = longitude
+    row.timezone = timezone
+    row.days = days
+    row.issued_at = issued_at
+    row.data = data
+    row.created_at = datetime.utcnow()
+    session.commit()
+    return row
+
+
+def get_weather_days(session: Session, cell_key: str, start, end):
+    """Stored daily weather rows for a history cell with start <= day <= end, oldest first."""
+    return (
+        session.query(WeatherDay)
+        .filter(WeatherDay.cell_key == cell_key, WeatherDay.day >= start, WeatherDay.day <= end)
+        .order_by(WeatherDay.day)
+        .all()
+    )
+
+
+def save_weather_days(session: Session, cell_key: str, latitude: float, longitude: float, days, source: str = None):
+    """
+    Insert daily weather rows (dicts with day/tmin/tmax/precip) for a history
+    cell. Days already stored are left as they are. Returns the number added.
+    """
+    days = [d for d in days if d.get("day") is not None]
+    if not days:
+        return 0
+    existing = {
+        row.day
+        for row in session.query(WeatherDay.day).filter(
+            WeatherDay.cell_key == cell_key,
+            WeatherDay.day >= min(d["day"] for d in days),
+            WeatherDay.day <= max(d["day"] for d in days),
+        )
+    }
+    added = 0
+    for d in days:
+        if d["day"] in existing:
+            continue
+        existing.add(d["day"])
+        session.add(WeatherDay(
+            cell_key=cell_key,
+            day=d["day"],
+            latitude=latitude,
+            longitude=longitude,
+            tmin=d.get("tmin"),
+            tmax=d.get("tmax"),
+            precip=d.get("precip"),
+            source=source,
+        ))
+        added += 1
+    session.commit()
+    return added
+
+
+def get_farm_accumulator(session: Session, farm_key: str):
+    return session.query(FarmAccumulator).filter(FarmAccumulator.farm_key == farm_key).first()
+
+
+def save_farm_accumulator(session: Session, farm_key: str, **fields):
+    """Insert or update the accumulator row for farm_key with the given columns."""
+    row = get_farm_accumulator(session, farm_key)
+    if row is None:
+        row = FarmAccumulator(farm_key=farm_key)
+        session.add(row)
+    for name, value in fields.items():
+        setattr(row, name, value)
+    session.commit()
+    return row
+
+
+def save_stage_plan_rows(session: Session, stage_id: int, rows):
+    """Store the structured stages of a saved plan (dicts with the StagePlanRow columns)."""
+    for position, row in enumerate(rows, 1):
+        session.add(StagePlanRow(stage_id=stage_id, position=position, **row))
+    session.commit()
+
+
+def get_active_stage_plans(session: Session, today):
+    """
+    Latest plan per farm whose last stage has not ended before `today`, as
+    {stage_id: [StagePlanRow, ...]} with rows in stage order.
+    """
+    latest = (
+        session.query(func.max(StagePlanRow.stage_id))
+        .group_by(StagePlanRow.farm_key)
+        .scalar_subquery()
+    )
+    plans = {}
+    rows = (
+        session.query(StagePlanRow)
+        .filter(StagePlanRow.stage_id.in_(latest))
+        .order_by(StagePlanRow.stage_id, StagePlanRow.position)
+        .all()
+    )
+    for row in rows:
+        plans.setdefault(row.stage_id, []).append(row)
+    return {stage_id: rows for stage_id, rows in plans.items() if max(r.end_date for r in rows) >= today}
+
+
+def update_stage_output(session: Session, stage_id: int, output: str):
+    """Rewrite a saved stage report (bumps updated_at)."""
+    stage = session.get(Stage, stage_id)
+    if stage is None:
+        return None
+    stage.output = output
+    stage.updated_at = datetime.utcnow()
+    session.commit()
+    return stage
+
+
 def clear_old_cache(session: Session, days_old: int = 7):
     """
     Utility function to clean up very old cached data.
@@ -477,6 +716,8 @@ def clear_old_cache(session: Session, days_old: int = 7):
         'water': session.query(Water).filter(Water.created_at < cutoff).delete(),
         'weather': session.query(Weather).filter(Weather.created_at < cutoff).delete(),
         'stage': session.query(Stage).filter(Stage.created_at < cutoff).delete(),
+        'llm_cache': session.query(LLMCache).filter(LLMCache.created_at < cutoff).delete(),
+        'weather_tile': session.query(WeatherTile).filter(WeatherTile.created_at < cutoff).delete(),
     }
     
     session.commit()
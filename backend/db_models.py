@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, func
+from sqlalchemy import Column, Integer, String, Text, DateTime, Date, Float, UniqueConstraint, func
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy import ForeignKey
@@ -72,6 +72,7 @@ class Weather(Base):
     model_name = Column(String)
     prompt = Column(Text)
     output = Column(Text)
+    data = Column(Text)  # JSON weather record (see weather_record in Agents/weather.py)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -192,3 +193,102 @@ class Merge(Base):
     output = Column(Text)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class LLMCache(Base):
+    """Persistent tier of the LLM response cache (see Agents/llm_cache.py)."""
+    __tablename__ = "llm_cache"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    cache_key = Column(String(64), nullable=False, unique=True, index=True)
+    agent_id = Column(String)
+    model_name = Column(String)
+    output = Column(Text)
+    created_at = Column(DateTime, default=func.now())
+    last_used_at = Column(DateTime, default=func.now())
+
+
+class GeocodeCache(Base):
+    """Persistent tier of the geocode cache (see geocode_location/reverse_geocode in Agents/weather.py)."""
+    __tablename__ = "geocode_cache"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    cache_key = Column(String(255), nullable=False, unique=True, index=True)
+    name = Column(String)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    country = Column(String)
+    admin1 = Column(String)
+    timezone = Column(String)
+    source = Column(String)
+    created_at = Column(DateTime, default=func.now())
+    last_used_at = Column(DateTime, default=func.now())
+
+
+class WeatherTile(Base):
+    """Raw Open-Meteo forecast for one grid cell, shared by every farm and crop in it
+    (see get_forecast in Agents/weather.py)."""
+    __tablename__ = "weather_tile"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    cache_key = Column(String(255), nullable=False, unique=True, index=True)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    timezone = Column(String)
+    days = Column(Integer)
+    issued_at = Column(DateTime)
+    data = Column(Text)
+    created_at = Column(DateTime, default=func.now())
+
+
+class WeatherDay(Base):
+    """Observed daily weather for one history grid cell (see Agents/weather_history.py)."""
+    __tablename__ = "weather_day"
+    __table_args__ = (UniqueConstraint("cell_key", "day", name="uq_weather_day_cell_day"),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    cell_key = Column(String(64), nullable=False, index=True)
+    day = Column(Date, nullable=False)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    tmin = Column(Float)
+    tmax = Column(Float)
+    precip = Column(Float)
+    source = Column(String)
+    created_at = Column(DateTime, default=func.now())
+
+
+class FarmAccumulator(Base):
+    """Running GDD / chill / rainfall totals for one farm since sowing, through through_day."""
+    __tablename__ = "farm_accumulator"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    farm_key = Column(String(255), nullable=False, unique=True, index=True)
+    cell_key = Column(String(64))
+    crop_name = Column(String)
+    sowing_date = Column(Date)
+    base_temp = Column(Float)
+    through_day = Column(Date)
+    days = Column(Integer, default=0)
+    missing_days = Column(Integer, default=0)
+    gdd = Column(Float, default=0.0)
+    chill = Column(Float, default=0.0)
+    rainfall = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+
+class StagePlanRow(Base):
+    """One stage of a saved stage plan (see Agents/stage_tracker.py). gdd_start/gdd_end
+    are the cumulative GDD since sowing expected at the stage boundaries when planned."""
+    __tablename__ = "stage_plan_row"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    stage_id = Column(Integer, ForeignKey('stage.id'), nullable=False, index=True)
+    farm_key = Column(String(255), nullable=False, index=True)
+    location = Column(String)
+    crop_name = Column(String)
+    sowing_date = Column(Date)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    farmer_input = Column(Text)  # JSON of the FarmerInput the plan was made for (used to replan)
+    position = Column(Integer, nullable=False)
+    name = Column(String)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    gdd_start = Column(Float)
+    gdd_end = Column(Float)
+    created_at = Column(DateTime, default=func.now())
@@ -54,6 +54,9 @@ def _migrate_db():
                         f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS run_id INTEGER REFERENCES agent_runs(id);"
                     )
                 )
+
+            conn.execute(text("ALTER TABLE weather ADD COLUMN IF NOT EXISTS data TEXT;"))
+            conn.execute(text("ALTER TABLE stage_plan_row ADD COLUMN IF NOT EXISTS farmer_input TEXT;"))
     except Exception:
         # Migration is best-effort; app should still be usable without logs.
         pass
@@ -17,3 +17,36 @@ def save_previous_crop_sowed(session: Session, crop_name: str, crop_variety: str
     session.commit()
     print("------------------data is saved in database")
     return user
+
+
+def get_farm_coordinates(session: Session):
+    """(lat, lon) of every registered farm that has usable coordinates."""
+    points = []
+    for latitude, longitude in session.query(User.latitude, User.longitude).filter(
+        User.latitude.isnot(None), User.longitude.isnot(None)
+    ):
+        try:
+            points.append((float(latitude), float(longitude)))
+        except (TypeError, ValueError):
+            continue
+    return points
+
+
+def get_registered_farms(session: Session):
+    """Registered farms with usable coordinates, crop and sowing date, as dicts."""
+    farms = []
+    for user in session.query(User).filter(User.latitude.isnot(None), User.longitude.isnot(None)):
+        try:
+            latitude, longitude = float(user.latitude), float(user.longitude)
+        except (TypeError, ValueError):
+            continue
+        if not user.crop_name or not user.sowing_date:
+            continue
+        farms.append({
+            "location": user.location,
+            "crop_name": user.crop_name,
+            "sowing_date": user.sowing_date,
+            "latitude": latitude,
+            "longitude": longitude,
+        })
+    return farms
@@ -0,0 +1,206 @@
+"""
+Shared setup for the offline benchmarks.
+
+prepare() must run before any Agents/backend module is imported: it points
+DATABASE_URL at a throwaway SQLite file (unless one is given), puts Agents/ on
+sys.path and creates the tables. After that:
+
+- the LLM is the fake provider (Agents/fake_llm.py, model "fake:...")
+- Open-Meteo and the geocoders are served by benchmarks/weather_standin.py
+  (or replaced in-process by stub_weather())
+- every SQL statement is counted against the pipeline node that issued it
+  (count_db_round_trips / tag_pipeline_nodes)
+"""
+
+import os
+import sys
+import math
+import random
+import tempfile
+import threading
+import contextvars
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AGENTS_DIR = os.path.join(PROJECT_ROOT, "Agents")
+
+_current_node = contextvars.ContextVar("bench_node", default="other")
+_db_lock = threading.Lock()
+_db_round_trips = defaultdict(int)
+
+
+def prepare(database_url: str = None) -> str:
+    """Configure paths and the database; returns the DATABASE_URL in use."""
+    if database_url is None:
+        path = os.path.join(tempfile.mkdtemp(prefix="crop-bench-"), "bench.db")
+        database_url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = database_url
+    # several agent modules build a Together client at import time; the fake
+    # provider never uses it, but the constructor insists on a key
+    os.environ.setdefault("TOGETHER_API_KEY", "offline-benchmark")
+    for path in (AGENTS_DIR, PROJECT_ROOT):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    from backend.init_db import init_db
+    init_db()
+    return database_url
+
+
+# ---------------------------------------------------------------------------
+# DB round trips
+# ---------------------------------------------------------------------------
+def count_db_round_trips():
+    """Count every statement the shared engine sends, per pipeline node."""
+    from sqlalchemy import event
+    from backend.init_db import engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        with _db_lock:
+            _db_round_trips[_current_node.get()] += 1
+
+
+def db_round_trips(reset: bool = False) -> dict:
+    with _db_lock:
+        out = dict(_db_round_trips)
+        if reset:
+            _db_round_trips.clear()
+    return out
+
+
+def tag_pipeline_nodes():
+    """Wrap pipeline.NODE_RUNNERS so work done by a node (including its
+    fan-out threads, which copy the context) is attributed to it."""
+    import pipeline
+
+    def _tagged(name, runner):
+        def run(ctx):
+            token = _current_node.set(name)
+            try:
+                return runner(ctx)
+            finally:
+                _current_node.reset(token)
+        return run
+
+    for name, runner in list(pipeline.NODE_RUNNERS.items()):
+        pipeline.NODE_RUNNERS[name] = _tagged(name, runner)
+
+
+# ---------------------------------------------------------------------------
+# Weather stubs
+# ---------------------------------------------------------------------------
+def forecast_fixture(lat: float, lon: float, timezone_name: str = "Asia/Kolkata", days: int = 7, seed: int = 0, start=None) -> dict:
+    """An Open-Meteo /v1/forecast shaped response with plausible values, from
+    `start` (default today) for days + 1 days."""
+    rng = random.Random(f"{seed}:{round(lat, 2)}:{round(lon, 2)}")
+    start = start or datetime.utcnow().date()
+    day_list = [start + timedelta(days=i) for i in range(days + 1)]
+    hourly = {"time": []}
+    for name in ("temperature_2m", "relativehumidity_2m", "dewpoint_2m", "precipitation",
+                 "windspeed_10m", "shortwave_radiation", "vapour_pressure_deficit"):
+        hourly[name] = []
+    for day in day_list:
+        base = rng.uniform(18, 30)
+        for hour in range(24):
+            swing = 6 * math.sin((hour - 9) / 24 * 2 * math.pi)
+            temp = round(base + swing, 1)
+            hourly["time"].append(f"{day.isoformat()}T{hour:02d}:00")
+            hourly["temperature_2m"].append(temp)
+            hourly["relativehumidity_2m"].append(round(rng.uniform(40, 90)))
+            hourly["dewpoint_2m"].append(round(temp - rng.uniform(3, 10), 1))
+            hourly["precipitation"].append(round(max(0.0, rng.gauss(0, 0.6)), 1))
+            hourly["windspeed_10m"].append(round(rng.uniform(2, 15), 1))
+            hourly["shortwave_radiation"].append(round(max(0.0, 800 * math.sin((hour - 6) / 12 * math.pi)), 1))
+            hourly["vapour_pressure_deficit"].append(round(rng.uniform(0.3, 2.5), 2))
+    daily = {
+        "time": [d.isoformat() for d in day_list],
+        "temperature_2m_max": [],
+        "temperature_2m_min": [],
+        "precipitation_sum": [],
+        "shortwave_radiation_sum": [],
+    }
+    for i in range(len(day_list)):
+        temps = hourly["temperature_2m"][i * 24:(i + 1) * 24]
+        daily["temperature_2m_max"].append(max(temps))
+        daily["temperature_2m_min"].append(min(temps))
+        daily["precipitation_sum"].append(round(sum(hourly["precipitation"][i * 24:(i + 1) * 24]), 1))
+        daily["shortwave_radiation_sum"].append(round(sum(hourly["shortwave_radiation"][i * 24:(i + 1) * 24]) * 0.0036, 2))
+    return {"latitude": lat, "longitude": lon, "timezone": timezone_name, "hourly": hourly, "daily": daily}
+
+
+def stub_weather(latency: str = "0"):
+    """Replace Open-Meteo / Nominatim calls in Agents/weather.py and
+    Agents/weather_history.py with in-process fixtures; each call sleeps for
+    a sample of the `latency` spec."""
+    import time
+    import weather
+    import weather_history
+    from fake_llm import sample_latency
+
+    rng = random.Random(0)
+    lock = threading.Lock()
+
+    def _sleep():
+        with lock:
+            seconds = sample_latency(latency, rng)
+        time.sleep(seconds)
+
+    def _geo(name, lat, lon):
+        return {
+            "name": name,
+            "latitude": lat,
+            "longitude": lon,
+            "country": "India",
+            "admin1": "Madhya Pradesh",
+            "timezone": "Asia/Kolkata",
+        }
+
+    def geocode_location(location):
+        _sleep()
+        place = random.Random(location)
+        return _geo(location, round(place.uniform(20, 26), 4), round(place.uniform(74, 80), 4))
+
+    def reverse_geocode(lat, lon):
+        _sleep()
+        return _geo(f"Location ({lat:.4f}, {lon:.4f})", lat, lon)
+
+    def fetch_open_meteo(lat, lon, timezone_name, days=7):
+        _sleep()
+        return forecast_fixture(lat, lon, timezone_name, days)
+
+    def fetch_history(lat, lon, start, end, timezone_name="Asia/Kolkata"):
+        _sleep()
+        fixture = forecast_fixture(lat, lon, timezone_name, days=(end - start).days, start=start)
+        return weather_history._parse_daily(fixture, start, end)
+
+    weather.geocode_location = geocode_location
+    weather.reverse_geocode = reverse_geocode
+    weather.fetch_open_meteo = fetch_open_meteo
+    weather_history.fetch_archive = fetch_history
+    weather_history.fetch_recent = fetch_history
+
+
+# ---------------------------------------------------------------------------
+# Statistics
+# ---------------------------------------------------------------------------
+def percentile(values, pct: float):
+    """Nearest-rank percentile; None for no samples."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return round(ordered[rank - 1], 4)
+
+
+def summarize(values) -> dict:
+    values = list(values)
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 4) if values else None,
+    }
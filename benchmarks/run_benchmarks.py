@@ -0,0 +1,223 @@
+"""
+End-to-end benchmark of the advisory pipeline, fully offline.
+
+Runs run_pipeline (soil, water, weather, stage, nutrient, pest, disease,
+irrigation, merge) against the fake LLM and stubbed Open-Meteo under several
+orchestration scenarios and writes one JSON file per invocation:
+
+    python benchmarks/run_benchmarks.py --iterations 20
+    python benchmarks/run_benchmarks.py --scenarios sequential,concurrent \
+        --llm-latency lognormal:1.5,0.6 --llm-error-rate 0.05 --out before.json
+
+Per scenario the JSON has end-to-end and per-agent p50/p95/p99 latency, LLM
+calls, prompt/completion tokens and DB round trips per run, so two result
+files can be diffed across commits.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import harness  # noqa: E402
+
+# name -> (pipeline max_workers, pipelines run at the same time)
+SCENARIOS = {
+    "sequential": (1, 1),
+    "concurrent": (4, 1),
+    "concurrent_load": (4, 4),
+}
+
+CROPS = ["wheat", "rice", "maize", "soybean"]
+
+
+def _farms(scenario: str, count: int):
+    """count farms; names are per scenario so no scenario starts on rows
+    (soil, weather, stage plan, reports) a previous one left in the DB."""
+    from user_input import FarmerInput
+
+    farms = []
+    for i in range(count):
+        farms.append(FarmerInput(
+            crop_name=CROPS[i % len(CROPS)],
+            location=f"bench-{scenario}-farm-{i}",
+            sowing_date=(date.today() - timedelta(days=30 + (i * 7) % 90)).isoformat(),
+            area=1.0 + i % 5,
+        ))
+    return farms
+
+
+def _run_one(farm, model, max_workers, bypass_cache):
+    from pipeline import run_pipeline
+
+    return run_pipeline(
+        farm,
+        model=model,
+        max_workers=max_workers,
+        session_state={},
+        bypass_cache=bypass_cache,
+    )
+
+
+def run_scenario(name, max_workers, parallel_runs, iterations, model, bypass_cache, warmup=1, standin=None):
+    import fake_llm
+    import llm_cache
+    from pipeline import PIPELINE_NODES
+
+    farms = _farms(name, iterations + warmup)
+    for farm in farms[:warmup]:
+        _run_one(farm, model, max_workers, bypass_cache)
+
+    fake_llm.reset()
+    llm_cache.clear()
+    harness.db_round_trips(reset=True)
+    if standin is not None:
+        standin.stats(reset=True)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallel_runs) as pool:
+        results = list(pool.map(lambda f: _run_one(f, model, max_workers, bypass_cache), farms[warmup:]))
+    wall = time.perf_counter() - started
+
+    runs = len(results)
+    llm_stats = fake_llm.stats()
+    db = harness.db_round_trips()
+    agents = {}
+    # fixed node order so result files diff cleanly
+    for node in [n for n in PIPELINE_NODES if any(n in r["timings"] for r in results)]:
+        durations = [r["timings"][node]["duration"] for r in results if node in r["timings"]]
+        calls = llm_stats.get(node, {})
+        agents[node] = {
+            "latency": harness.summarize(durations),
+            "errors": sum(1 for r in results if node in r["errors"]),
+            "llm_calls_per_run": round(calls.get("calls", 0) / runs, 2),
+            "llm_errors_per_run": round(calls.get("errors", 0) / runs, 2),
+            "prompt_tokens_per_run": round(calls.get("prompt_tokens", 0) / runs, 1),
+            "completion_tokens_per_run": round(calls.get("completion_tokens", 0) / runs, 1),
+            "db_round_trips_per_run": round(db.get(node, 0) / runs, 1),
+        }
+    paths = Counter(" > ".join(r["critical_path"]) for r in results)
+    weather_requests = {}
+    if standin is not None and runs:
+        weather_requests = {
+            path: round(entry["requests"] / runs, 2) for path, entry in sorted(standin.stats().items())
+        }
+    return {
+        "scenario": name,
+        "max_workers": max_workers,
+        "parallel_runs": parallel_runs,
+        "runs": runs,
+        "wall_seconds": round(wall, 3),
+        "runs_per_minute": round(runs / wall * 60, 2) if wall else None,
+        "end_to_end": harness.summarize(r["total_seconds"] for r in results),
+        "llm_calls_per_run": round(sum(s["calls"] for s in llm_stats.values()) / runs, 2) if runs else 0,
+        "db_round_trips_per_run": round(sum(db.values()) / runs, 1) if runs else 0,
+        "critical_path": paths.most_common(1)[0][0] if paths else "",
+        "weather_requests_per_run": weather_requests,
+        "agents": agents,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=harness.PROJECT_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10, help="timed pipeline runs per scenario")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--model", default="fake:", help="fake model string, e.g. 'fake:?error_rate=1|fake:'")
+    parser.add_argument("--llm-latency", default=None, help="FAKE_LLM_LATENCY spec, e.g. lognormal:0.4,0.5")
+    parser.add_argument("--llm-seconds-per-token", type=float, default=None)
+    parser.add_argument("--llm-error-rate", type=float, default=None)
+    parser.add_argument("--llm-output-tokens", type=int, default=None)
+    parser.add_argument("--weather-backend", choices=("standin", "stub"), default="standin",
+                        help="local HTTP stand-in (weather_standin.py) or in-process stubs")
+    parser.add_argument("--weather-latency", default="fixed:0.2",
+                        help="latency spec per Open-Meteo/geocoding request, e.g. fixed:0.2 or lognormal:0.3,0.4")
+    parser.add_argument("--warm-cache", action="store_true", help="allow LLM cache hits (default: every call is fresh)")
+    parser.add_argument("--database-url", default=None, help="default: a throwaway SQLite file")
+    parser.add_argument("--out", default=None, help="output JSON path (default: benchmarks/results/<commit>-<time>.json)")
+    args = parser.parse_args(argv)
+
+    if not args.model.split("|")[0].strip().startswith("fake"):
+        parser.error("--model must be a fake: model; the benchmark runs offline")
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {unknown}")
+
+    database_url = harness.prepare(args.database_url)
+    harness.count_db_round_trips()
+    harness.tag_pipeline_nodes()
+    standin = None
+    if args.weather_backend == "standin":
+        import weather_standin
+        server, base_url = weather_standin.start_in_thread(latency=args.weather_latency)
+        weather_standin.use_standin(base_url)
+        standin = server.standin
+    else:
+        harness.stub_weather(args.weather_latency)
+
+    import fake_llm
+    fake_llm.configure(
+        latency=args.llm_latency,
+        seconds_per_token=args.llm_seconds_per_token,
+        error_rate=args.llm_error_rate,
+        output_tokens=args.llm_output_tokens,
+    )
+
+    report = {
+        "commit": _git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "database": database_url.split(":", 1)[0],
+        "settings": {
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "model": args.model,
+            "fake_llm": fake_llm.settings(args.model),
+            "weather_backend": args.weather_backend,
+            "weather_latency": args.weather_latency,
+            "warm_cache": args.warm_cache,
+        },
+        "scenarios": {},
+    }
+    for name in names:
+        max_workers, parallel_runs = SCENARIOS[name]
+        print(f"[benchmarks] {name}: {args.iterations} runs, max_workers={max_workers}, parallel_runs={parallel_runs}")
+        result = run_scenario(
+            name, max_workers, parallel_runs, args.iterations, args.model,
+            bypass_cache=not args.warm_cache, warmup=args.warmup, standin=standin,
+        )
+        report["scenarios"][name] = result
+        e2e = result["end_to_end"]
+        print(f"[benchmarks] {name}: p50={e2e['p50']}s p95={e2e['p95']}s p99={e2e['p99']}s "
+              f"({result['runs_per_minute']} runs/min, {result['db_round_trips_per_run']} DB round trips/run)")
+
+    out = args.out
+    if out is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(harness.PROJECT_ROOT, "benchmarks", "results", f"{report['commit'] or 'local'}-{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[benchmarks] wrote {out}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Local stand-in for the Open-Meteo forecast/geocoding APIs and Nominatim.
+
+Serves the recorded fixtures in benchmarks/fixtures/ with tunable latency and
+error rate, so the weather path can be load-tested offline:
+
+    python benchmarks/weather_standin.py --port 8765 --latency lognormal:0.3,0.4
+
+    export OPEN_METEO_URL=http://127.0.0.1:8765
+    export OPEN_METEO_GEOCODING_URL=http://127.0.0.1:8765
+    export NOMINATIM_URL=http://127.0.0.1:8765
+    export OPEN_METEO_ARCHIVE_URL=http://127.0.0.1:8765
+
+Endpoints: /v1/forecast (comma-separated latitude/longitude return a list, as
+Open-Meteo does), /v1/archive (same fixture, any date range), /v1/search,
+/search, /reverse. GET /__stats returns request
+counts per endpoint and /__reset zeroes them, which is how caching and
+batching are measured.
+
+The forecast fixture is re-dated to the requested start_date/end_date (or
+forecast_days/past_days) and filtered to the requested variables. With --record the
+server forwards requests to the real services and also saves their responses
+under fixtures/recorded/.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "Agents"))
+from fake_llm import sample_latency  # noqa: E402
+
+UPSTREAM = {
+    "/v1/forecast": "https://api.open-meteo.com",
+    "/v1/archive": "https://archive-api.open-meteo.com",
+    "/v1/search": "https://geocoding-api.open-meteo.com",
+    "/search": "https://nominatim.openstreetmap.org",
+    "/reverse": "https://nominatim.openstreetmap.org",
+}
+
+
+class StandIn:
+    """Fixture store plus the knobs the HTTP handler consults."""
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR, latency="0", error_rate=0.0, error_status=503, record=False, seed=0):
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.record = record
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        with open(os.path.join(fixtures_dir, "forecast.json"), encoding="utf-8") as f:
+            self.forecast = json.load(f)
+        with open(os.path.join(fixtures_dir, "places.json"), encoding="utf-8") as f:
+            self.places = json.load(f)
+
+    def count(self, path, locations=1):
+        with self.lock:
+            entry = self.counts.setdefault(path, {"requests": 0, "locations": 0})
+            entry["requests"] += 1
+            entry["locations"] += locations
+
+    def stats(self, reset=False):
+        with self.lock:
+            out = {path: dict(entry) for path, entry in self.counts.items()}
+            if reset:
+                self.counts.clear()
+        return out
+
+    def delay_and_fail(self):
+        """Sleep for a sampled latency; return an error status or None."""
+        with self.lock:
+            seconds = sample_latency(self.latency, self.rng)
+            failed = self.rng.random() < self.error_rate
+        time.sleep(seconds)
+        return self.error_status if failed else None
+
+    # -- places -----------------------------------------------------------
+    def place(self, name):
+        key = (name or "").strip().lower()
+        for place in self.places:
+            if place["name"].lower() == key or key in [a.lower() for a in place.get("aliases", [])]:
+                return place
+        # unknown names get a stable made-up location in central India
+        h = int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:8], 16)
+        return {
+            "name": name,
+            "latitude": round(18 + (h % 800) / 100.0, 4),
+            "longitude": round(73 + ((h // 800) % 800) / 100.0, 4),
+            "country": "India",
+            "admin1": "Madhya Pradesh",
+            "timezone": "Asia/Kolkata",
+        }
+
+    def nearest(self, lat, lon):
+        return min(self.places, key=lambda p: (p["latitude"] - lat) ** 2 + (p["longitude"] - lon) ** 2)
+
+    # -- responses --------------------------------------------------------
+    def geocoding(self, params):
+        place = self.place(params.get("name", [""])[0])
+        result = {k: place[k] for k in ("name", "latitude", "longitude", "country", "admin1", "timezone")}
+        result["id"] = int(hashlib.sha256(place["name"].encode("utf-8")).hexdigest()[:7], 16)
+        return {"results": [result], "generationtime_ms": 0.4}
+
+    def nominatim_search(self, params):
+        place = self.place(params.get("q", [""])[0])
+        return [{
+            "lat": str(place["latitude"]),
+            "lon": str(place["longitude"]),
+            "display_name": f"{place['name']}, {place['admin1']}, {place['country']}",
+            "address": {"state": place["admin1"], "country": place["country"]},
+        }]
+
+    def nominatim_reverse(self, params):
+        lat = float(params.get("lat", ["0"])[0])
+        lon = float(params.get("lon", ["0"])[0])
+        place = self.nearest(lat, lon)
+        return {
+            "lat": str(lat),
+            "lon": str(lon),
+            "display_name": f"{place['name']}, {place['admin1']}, {place['country']}",
+            "address": {"state": place["admin1"], "country": place["country"]},
+        }
+
+    def forecast_for(self, lat, lon, params):
+        start, end = _date_range(params)
+        days = (end - start).days + 1
+        hourly_vars = _split(params.get("hourly"))
+        daily_vars = _split(params.get("daily"))
+        src_hourly = self.forecast["hourly"]
+        src_daily = self.forecast["daily"]
+        src_days = len(src_daily["time"])
+
+        out = {k: v for k, v in self.forecast.items() if k not in ("hourly", "daily", "hourly_units", "daily_units")}
+        out.update({"latitude": lat, "longitude": lon})
+        if "timezone" in params:
+            out["timezone"] = params["timezone"][0]
+        if hourly_vars:
+            times = [
+                f"{(start + timedelta(days=d)).isoformat()}T{h:02d}:00"
+                for d in range(days) for h in range(24)
+            ]
+            out["hourly_units"] = {k: v for k, v in self.forecast["hourly_units"].items() if k == "time" or k in hourly_vars}
+            out["hourly"] = {"time": times}
+            for var in hourly_vars:
+                series = src_hourly.get(var)
+                out["hourly"][var] = [series[i % len(series)] for i in range(len(times))] if series else [None] * len(times)
+        if daily_vars:
+            out["daily_units"] = {k: v for k, v in self.forecast["daily_units"].items() if k == "time" or k in daily_vars}
+            out["daily"] = {"time": [(start + timedelta(days=d)).isoformat() for d in range(days)]}
+            for var in daily_vars:
+                series = src_daily.get(var)
+                out["daily"][var] = [series[d % src_days] for d in range(days)] if series else [None] * days
+        return out
+
+    def forecast_response(self, params):
+        lats = [float(v) for v in _split(params.get("latitude"))]
+        lons = [float(v) for v in _split(params.get("longitude"))]
+        if not lats or len(lats) != len(lons):
+            raise ValueError("latitude and longitude must have the same number of values")
+        results = [self.forecast_for(lat, lon, params) for lat, lon in zip(lats, lons)]
+        return (results if len(results) > 1 else results[0]), len(results)
+
+    def save_recording(self, path, query, body):
+        name = hashlib.sha256(f"{path}?{query}".encode("utf-8")).hexdigest()[:16]
+        target = os.path.join(self.fixtures_dir, "recorded", f"{path.strip('/').replace('/', '_')}-{name}.json")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(body)
+
+
+def _split(values):
+    if not values:
+        return []
+    return [v.strip() for v in ",".join(values).split(",") if v.strip()]
+
+
+def _date_range(params):
+    if "start_date" in params and "end_date" in params:
+        start = datetime.strptime(params["start_date"][0], "%Y-%m-%d").date()
+        end = datetime.strptime(params["end_date"][0], "%Y-%m-%d").date()
+        return start, end
+    days = int(params.get("forecast_days", ["7"])[0])
+    past_days = int(params.get("past_days", ["0"])[0])
+    start = date.today()
+    return start - timedelta(days=past_days), start + timedelta(days=days - 1)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    standin = None  # set by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        standin = self.standin
+        if url.path == "/__stats":
+            return self._send(200, standin.stats())
+        if url.path == "/__reset":
+            return self._send(200, standin.stats(reset=True))
+
+        routes = {
+            "/v1/forecast": standin.forecast_response,
+            "/v1/archive": standin.forecast_response,
+            "/v1/search": lambda p: (standin.geocoding(p), 1),
+            "/search": lambda p: (standin.nominatim_search(p), 1),
+            "/reverse": lambda p: (standin.nominatim_reverse(p), 1),
+        }
+        if url.path not in routes:
+            return self._send(404, {"error": True, "reason": f"unknown endpoint {url.path}"})
+
+        status = standin.delay_and_fail()
+        if status:
+            standin.count(url.path, 0)
+            return self._send(status, {"error": True, "reason": "simulated upstream error"})
+        if standin.record:
+            try:
+                import requests
+                r = requests.get(UPSTREAM[url.path] + url.path, params=params, timeout=15,
+                                 headers={"User-Agent": "CropAdvisorySystem/1.0 (benchmark recorder)"})
+                if r.ok:
+                    standin.save_recording(url.path, urlencode(params, doseq=True), r.content)
+                    standin.count(url.path)
+                    return self._send(200, r.content)
+            except Exception as ex:
+                print(f"[weather_standin] Warning: recording {url.path} failed: {ex}")
+        try:
+            payload, locations = routes[url.path](params)
+        except (ValueError, KeyError) as ex:
+            return self._send(400, {"error": True, "reason": str(ex)})
+        standin.count(url.path, locations)
+        return self._send(200, payload)
+
+
+def make_server(host="127.0.0.1", port=8765, **settings):
+    standin = StandIn(**settings)
+    handler = type("StandInHandler", (_Handler,), {"standin": standin})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.standin = standin
+    return server
+
+
+def start_in_thread(host="127.0.0.1", port=0, **settings):
+    """Start a stand-in on a background thread; returns (server, base_url).
+    port=0 picks a free port. Stop it with server.shutdown()."""
+    server = make_server(host, port, **settings)
+    thread = threading.Thread(target=server.serve_forever, name="weather-standin", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def use_standin(base_url: str):
+    """Point Agents/weather.py at a stand-in (env for new imports, module
+    attributes if it is already imported)."""
+    for name in ("OPEN_METEO_URL", "OPEN_METEO_GEOCODING_URL", "NOMINATIM_URL", "OPEN_METEO_ARCHIVE_URL"):
+        os.environ[name] = base_url
+    weather = sys.modules.get("weather")
+    if weather is not None:
+        weather.OPEN_METEO_URL = weather.OPEN_METEO_GEOCODING_URL = weather.NOMINATIM_URL = base_url
+        # the 1 req/s Nominatim policy only applies to the public instance
+        weather.NOMINATIM_MIN_INTERVAL = 0.0
+    weather_history = sys.modules.get("weather_history")
+    if weather_history is not None:
+        weather_history.OPEN_METEO_ARCHIVE_URL = base_url
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="0", help="per-request latency spec, e.g. fixed:0.2 or lognormal:0.3,0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--record", action="store_true", help="forward to the real services and save responses")
+    args = parser.parse_args(argv)
+
+    server = make_server(
+        args.host, args.port,
+        fixtures_dir=args.fixtures, latency=args.latency,
+        error_rate=args.error_rate, error_status=args.error_status, record=args.record,
+    )
+    print(f"[weather_standin] serving on http://{args.host}:{server.server_address[1]} (latency={args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""Shared test setup: the offline benchmark harness (throwaway SQLite database,
+Agents/ on sys.path), the fake LLM with no latency and the answer cache off."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+os.environ["LLM_CACHE_ENABLED"] = "0"
+os.environ.setdefault("FAKE_LLM_LATENCY", "0")
+os.environ.setdefault("FAKE_LLM_SECONDS_PER_TOKEN", "0")
+
+import harness  # noqa: E402
+
+harness.prepare(os.getenv("TEST_DATABASE_URL"))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def fake_llm():
+    import fake_llm
+
+    fake_llm.reset(clear_settings=True)
+    yield fake_llm
+    fake_llm.reset(clear_settings=True)
@@ -0,0 +1,44 @@
+import json
+import random
+
+from stage_parser import parse_stage_plan
+
+
+def _stage_plan():
+    import fake_llm
+
+    return fake_llm._stage_plan(
+        "STAGE-PLANNER", "Crop: wheat\nSowing Date: 2026-01-10\nLocation: test-farm", random.Random(0)
+    )
+
+
+def test_padded_json_keeps_its_shape(fake_llm):
+    text = json.dumps({"activities": ["Irrigate"], "tips": [], "alerts": []})
+    padded = json.loads(fake_llm._sized(text, output_tokens=200, max_tokens=0))
+    assert padded["activities"] == ["Irrigate"]
+    assert padded["notes"]
+
+    text = json.dumps({"stages": [], "general_summary": {"soil": "Loam."}})
+    padded = json.loads(fake_llm._sized(text, output_tokens=200, max_tokens=0))
+    assert "notes" not in padded
+    assert padded["general_summary"]["soil"].startswith("Loam. ")
+
+
+def test_padded_map_reduce_merge(fake_llm):
+    from merge_agent import merge_map_reduce
+
+    fake_llm.configure(output_tokens=800)
+    stage = _stage_plan()
+    stages = parse_stage_plan(stage)
+    assert stages
+
+    result = merge_map_reduce(
+        "Soil report", "Nutrient report", "Irrigation report", "Pest report",
+        "Disease report", "Weather report", stage, model_name="fake:",
+    )
+    assert result.data is not None, str(result)
+    assert [s["stage_name"] for s in result.data["stages"]] == [s.name for s in stages]
+    assert all(s["activities"] for s in result.data["stages"])
+    assert result.data["general_summary"]["soil"]
+    assert fake_llm.stats()["merge"]["calls"] == len(stages) + 1
+    assert fake_llm.stats()["merge"]["errors"] == 0
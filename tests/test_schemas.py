@@ -0,0 +1,23 @@
+import json
+
+from schemas import AGENT_SCHEMAS, repair, validate
+
+
+def _stage_plan(**stage):
+    return json.dumps({"stages": [{"stage_name": "Tillering", "start_date": "2026-01-10", "end_date": "2026-02-08", **stage}]})
+
+
+def test_integer_field_accepts_whole_floats():
+    value, fixes = repair(_stage_plan(duration_days=30.0), AGENT_SCHEMAS["stage"])
+    assert value["stages"][0]["duration_days"] == 30
+    assert isinstance(value["stages"][0]["duration_days"], int)
+    assert not validate(value, AGENT_SCHEMAS["stage"])
+    assert any("duration_days" in fix for fix in fixes)
+
+
+def test_integer_field_parses_text_and_drops_junk():
+    value, _ = repair(_stage_plan(duration_days="about 30 days"), AGENT_SCHEMAS["stage"])
+    assert value["stages"][0]["duration_days"] == 30
+
+    value, _ = repair(_stage_plan(duration_days=True), AGENT_SCHEMAS["stage"])
+    assert value["stages"][0]["duration_days"] is None